@@ -1,12 +1,19 @@
 from flask import Flask
 
-from antminermonitor.blueprints.asicminer import antminer, antminer_json
+from antminermonitor.blueprints.asicminer import (antminer, antminer_json,
+                                                  antminer_metrics, api)
+from antminermonitor.blueprints.asicminer.alerts import (alert_engine,
+                                                         notify_alerts)
+from antminermonitor.blueprints.asicminer.live import live_feed
+from antminermonitor.blueprints.asicminer.poller import poller
 from antminermonitor.blueprints.user import user
-from antminermonitor.extensions import login_manager, migrate
+from antminermonitor.extensions import init_migrate, login_manager
 from antminermonitor.blueprints.asicminer.models.miner import Miner
 from antminermonitor.blueprints.asicminer.models.settings import Settings
 from antminermonitor.blueprints.user.models import User
 from antminermonitor.database import db_session, init_db
+from lib.util_compress import compressor
+from lib.util_notify import notifier
 
 import logging
 import os
@@ -30,9 +37,26 @@ def create_app(script_info=None, settings_override=None):
 
     app.register_blueprint(antminer)
     app.register_blueprint(antminer_json)
+    app.register_blueprint(antminer_metrics)
+    app.register_blueprint(api)
+    # the optional features are imported only if enabled; an agent records
+    # nothing, its aggregator does
+    poll_mode = app.config.get('POLL_MODE')
+    if poll_mode != 'agent' and (app.config.get('METRICS_ENABLED') or
+                                 app.config.get('CHAIN_EVENTS_ENABLED')):
+        from antminermonitor.blueprints.asicminer.views.history import \
+            history
+        app.register_blueprint(history)
+    if poll_mode == 'aggregator':
+        from antminermonitor.blueprints.asicminer.views.cluster import \
+            antminer_cluster
+        app.register_blueprint(antminer_cluster)
     app.register_blueprint(user, url_prefix='/user')
     authentication(app, User)
     extensions(app)
+    if script_info is not None:
+        # started by the CLI (`flask` or manage.py), not by a WSGI server
+        init_migrate(app, db_session)
 
     @app.shell_context_processor
     def make_shell_context():
@@ -82,7 +106,47 @@ def extensions(app):
     :return: None
     """
     login_manager.init_app(app)
-    migrate.init_app(app, db_session)
+    compressor.init_app(app)
+    poller.init_app(app)
+    poll_mode = app.config.get('POLL_MODE')
+    # the optional services are imported only if enabled
+    if app.config.get('SHARED_SNAPSHOT'):
+        from antminermonitor.blueprints.asicminer.shared import \
+            shared_snapshot
+        shared_snapshot.init_app(app)
+    if poll_mode in ('agent', 'aggregator'):
+        from antminermonitor.blueprints.asicminer.cluster import (agent,
+                                                                  aggregator)
+        agent.init_app(app)
+        aggregator.init_app(app)
+    if poll_mode == 'agent':
+        # the aggregator records and notifies for its agents
+        recorded = None
+    elif poll_mode == 'aggregator':
+        # every snapshot of every agent, not the merged view
+        recorded = aggregator
+    else:
+        recorded = poller
+    if app.config.get('METRICS_ENABLED') and recorded is not None:
+        from antminermonitor.blueprints.asicminer.timeseries import \
+            timeseries
+        timeseries.init_app(app)
+        recorded.subscribe(timeseries.record)
+    if app.config.get('CHAIN_EVENTS_ENABLED') and recorded is not None:
+        from antminermonitor.blueprints.asicminer.chains import chain_tracker
+        chain_tracker.init_app(app)
+        recorded.subscribe(chain_tracker.record)
+    notifier.init_app(app)
+    alert_engine.init_app(app)
+    if poll_mode == 'aggregator':
+        # the agents do not notify: the aggregator checks the rules again
+        # on their snapshots, and notifies from the merged view
+        aggregator.subscribe(alert_engine.check)
+        poller.subscribe(alert_engine.retain)
+    if poll_mode != 'agent':
+        poller.subscribe(notify_alerts)
+    live_feed.init_app(app)
+    poller.subscribe(live_feed.update, every_process=True)
 
     return
 
@@ -1,2 +1,4 @@
 from antminermonitor.blueprints.asicminer.views.antminer import antminer
 from antminermonitor.blueprints.asicminer.views.antminer_json import antminer_json
+from antminermonitor.blueprints.asicminer.views.metrics import antminer_metrics
+from antminermonitor.blueprints.asicminer.views.api import api
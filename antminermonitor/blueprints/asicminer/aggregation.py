@@ -0,0 +1,390 @@
+"""
+Per-model, per-subnet and per-worker rollups of a `FleetSnapshot`.
+
+The miners are read once into columns, which are then grouped per
+dimension in a batch: with NumPy when it is installed, in pure Python
+otherwise. Both give the same results.
+"""
+from antminermonitor.blueprints.asicminer.registry import registry
+from lib.util_hashrate import UNITS, to_base_unit
+
+try:
+    # faster grouping of large fleets, used when installed
+    import numpy
+except ImportError:
+    numpy = None
+
+# label of a miner per dimension
+DIMENSIONS = {
+    'models': lambda miner: miner.model_id,
+    'subnets': lambda miner: subnet(miner.ip),
+    'workers': lambda miner: miner.worker or "",
+}
+# the kinds of hash rate, summed up separately in their smallest unit
+KINDS = tuple(units[0] for units in UNITS)
+PERCENTILES = (50, 95)
+# a miner is an outlier if its hash rate is this many standard deviations
+# below the mean of its model
+OUTLIER_SIGMAS = 2
+
+
+def subnet(ip):
+    """The /24 of an IPv4 address, e.g. '10.0.3.0/24', else the ip itself."""
+    network, _, host = ip.rpartition('.')
+    if network.count('.') != 2 or not host.isdigit():
+        return ip
+    return network + '.0/24'
+
+
+def percentile(values, q):
+    """
+    The q-th percentile of sorted values, interpolated linearly between the
+    closest ranks like `numpy.percentile` does.
+    """
+    position = (len(values) - 1) * q / 100.0
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return float(values[lower] +
+                 (values[upper] - values[lower]) * (position - lower))
+
+
+def distributions(groups):
+    """
+    (number of values, {'p50': [...], 'p95': [...], 'max': [...]}) of
+    groups of sorted values, 0 for the empty groups.
+    """
+    summary = {
+        'p{}'.format(q): [percentile(values, q) if values else 0.0
+                          for values in groups]
+        for q in PERCENTILES
+    }
+    summary['max'] = [float(values[-1]) if values else 0.0
+                      for values in groups]
+    return [len(values) for values in groups], summary
+
+
+class Columns:
+    """The values of the miners of a snapshot that are aggregated."""
+
+    def __init__(self, miners):
+        # dimension => (labels, index of the label of every miner)
+        self.dimensions = {dimension: ([], []) for dimension in DIMENSIONS}
+        self.active = []
+        # kind of hash rate and hash rate in the smallest unit of its kind
+        self.kinds = []
+        self.hash_rates = []
+        self.hw_error_rates = []
+        # every reading and the index of its miner
+        self.temperatures, self.temperature_owners = [], []
+        self.fan_speeds, self.fan_speed_owners = [], []
+
+        # (label of a miner, label => code, labels, codes) per dimension
+        dimensions = [(label_of, {}) + self.dimensions[dimension]
+                      for dimension, label_of in DIMENSIONS.items()]
+        # model => (kind, factor to the smallest unit of the kind)
+        units = {}
+        for index, miner in enumerate(miners):
+            for label_of, codes, labels, column in dimensions:
+                label = label_of(miner)
+                code = codes.get(label)
+                if code is None:
+                    code = codes[label] = len(labels)
+                    labels.append(label)
+                column.append(code)
+
+            unit = units.get(miner.model_id)
+            if unit is None:
+                factor, base_unit = to_base_unit(
+                    1.0, registry.plan(miner.model_id).unit)
+                unit = units[miner.model_id] = (KINDS.index(base_unit),
+                                                factor)
+            self.kinds.append(unit[0])
+
+            if miner.is_inactive:
+                self.active.append(False)
+                self.hash_rates.append(0.0)
+                self.hw_error_rates.append(0.0)
+                continue
+            self.active.append(True)
+            self.hash_rates.append(float(miner.hash_rate_ghs5s or 0) * unit[1])
+            self.hw_error_rates.append(float(miner.hw_error_rate or 0))
+            self.temperatures.extend(miner.temperatures)
+            self.temperature_owners.extend([index] * len(miner.temperatures))
+            self.fan_speeds.extend(miner.fan_speeds)
+            self.fan_speed_owners.extend([index] * len(miner.fan_speeds))
+
+    def to_numpy(self):
+        """Convert the columns to arrays, once for all the dimensions."""
+        self.dimensions = {
+            dimension: (labels, numpy.asarray(codes, dtype=numpy.intp))
+            for dimension, (labels, codes) in self.dimensions.items()
+        }
+        self.active = numpy.asarray(self.active, dtype=bool)
+        self.kinds = numpy.asarray(self.kinds, dtype=numpy.intp)
+        self.hash_rates = numpy.asarray(self.hash_rates, dtype=float)
+        self.hw_error_rates = numpy.asarray(self.hw_error_rates, dtype=float)
+        # readings sorted by value once, so that they only have to be sorted
+        # by group per dimension
+        self.temperatures, self.temperature_owners = self._sorted(
+            self.temperatures, self.temperature_owners)
+        self.fan_speeds, self.fan_speed_owners = self._sorted(
+            self.fan_speeds, self.fan_speed_owners)
+
+    @staticmethod
+    def _sorted(values, owners):
+        values = numpy.asarray(values, dtype=float)
+        order = numpy.argsort(values, kind='stable')
+        return values[order], numpy.asarray(owners, dtype=numpy.intp)[order]
+
+
+class Groups:
+    """
+    The aggregates of the groups of one dimension, as lists indexed by the
+    code of the group. Hash rates are indexed by code * len(KINDS) + kind.
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.miners = []
+        self.active = []
+        self.hash_rate_counts = []
+        self.hash_rate_totals = []
+        self.hash_rate_means = []
+        self.hash_rate_stds = []
+        # distributions of the values of every group, see `distributions`
+        self.temperatures = ([], {})
+        self.fan_speeds = ([], {})
+        self.hw_error_rates = ([], {})
+
+    def group(self, code):
+        hash_rates = {}
+        for kind, unit in enumerate(KINDS):
+            i = code * len(KINDS) + kind
+            if self.hash_rate_counts[i]:
+                hash_rates[unit] = {
+                    'total': self.hash_rate_totals[i],
+                    'mean': self.hash_rate_means[i],
+                    'std': self.hash_rate_stds[i],
+                }
+        return {
+            'miners': self.miners[code],
+            'active': self.active[code],
+            'hash_rate': hash_rates,
+            'temperature': self.distribution(self.temperatures, code),
+            'fan_speed': self.distribution(self.fan_speeds, code),
+            'hw_error_rate': self.distribution(self.hw_error_rates, code),
+        }
+
+    @staticmethod
+    def distribution(distributions, code):
+        """p50, p95 and max of a group, None if it has no values."""
+        counts, summary = distributions
+        if not counts[code]:
+            return None
+        return {name: values[code] for name, values in summary.items()}
+
+    def as_dict(self):
+        return {
+            label: self.group(code)
+            for code, label in enumerate(self.labels)
+        }
+
+
+def _distributions(values, owners, codes, size):
+    groups = [[] for _ in range(size)]
+    for value, owner in zip(values, owners):
+        groups[codes[owner]].append(value)
+    for values in groups:
+        values.sort()
+    return distributions(groups)
+
+
+def _aggregate(columns, labels, codes):
+    groups = Groups(labels)
+    size = len(labels)
+    groups.miners = [0] * size
+    groups.active = [0] * size
+    counts = [0] * (size * len(KINDS))
+    totals = [0.0] * (size * len(KINDS))
+    squares = [0.0] * (size * len(KINDS))
+    for code, active, kind, hash_rate in zip(codes, columns.active,
+                                             columns.kinds,
+                                             columns.hash_rates):
+        groups.miners[code] += 1
+        if active:
+            groups.active[code] += 1
+            i = code * len(KINDS) + kind
+            counts[i] += 1
+            totals[i] += hash_rate
+            squares[i] += hash_rate * hash_rate
+
+    groups.hash_rate_counts = counts
+    groups.hash_rate_totals = totals
+    groups.hash_rate_means = [
+        t / c if c else 0.0 for t, c in zip(totals, counts)
+    ]
+    groups.hash_rate_stds = [
+        max(s / c - m * m, 0.0)**0.5 if c else 0.0
+        for s, c, m in zip(squares, counts, groups.hash_rate_means)
+    ]
+
+    groups.temperatures = _distributions(columns.temperatures,
+                                         columns.temperature_owners, codes,
+                                         size)
+    groups.fan_speeds = _distributions(columns.fan_speeds,
+                                       columns.fan_speed_owners, codes, size)
+    active = [i for i, a in enumerate(columns.active) if a]
+    groups.hw_error_rates = _distributions(
+        [columns.hw_error_rates[i] for i in active], active, codes, size)
+    return groups
+
+
+def _outliers(columns, codes, groups, sigmas):
+    """Indexes of the active miners far below the mean of their model."""
+    outliers = []
+    for index, (code, active, kind, hash_rate) in enumerate(
+            zip(codes, columns.active, columns.kinds, columns.hash_rates)):
+        i = code * len(KINDS) + kind
+        std = groups.hash_rate_stds[i]
+        if active and std and \
+                hash_rate < groups.hash_rate_means[i] - sigmas * std:
+            outliers.append(index)
+    return outliers
+
+
+def _distributions_numpy(values, owners, codes, size):
+    """
+    `distributions` of values sorted by value, numpy: one stable sort by
+    group, then the percentiles of all the groups at once.
+    """
+    groups = codes[owners]
+    if size <= 1 << 16:
+        # radix sort of the codes
+        groups = groups.astype(numpy.uint16)
+    order = numpy.argsort(groups, kind='stable')
+    values, groups = values[order], groups[order]
+    starts = numpy.searchsorted(groups, numpy.arange(size, dtype=groups.dtype))
+    counts = numpy.diff(numpy.append(starts, len(groups)))
+    if not len(values):
+        values = numpy.zeros(1)
+    last = numpy.maximum(counts - 1, 0)
+
+    def at(positions):
+        return values[numpy.minimum(starts + positions, len(values) - 1)]
+
+    summary = {}
+    for q in PERCENTILES:
+        position = last * q / 100.0
+        lower = position.astype(numpy.intp)
+        upper = numpy.minimum(lower + 1, last)
+        summary['p{}'.format(q)] = (
+            at(lower) + (at(upper) - at(lower)) * (position - lower)).tolist()
+    summary['max'] = at(last).tolist()
+    return counts.tolist(), summary
+
+
+def _aggregate_numpy(columns, labels, codes):
+    groups = Groups(labels)
+    size = len(labels)
+    active = columns.active
+    keys = (codes * len(KINDS) + columns.kinds)[active]
+    hash_rates = columns.hash_rates[active]
+    length = size * len(KINDS)
+
+    counts = numpy.bincount(keys, minlength=length)
+    totals = numpy.bincount(keys, weights=hash_rates, minlength=length)
+    squares = numpy.bincount(keys,
+                             weights=hash_rates * hash_rates,
+                             minlength=length)
+    divisor = numpy.maximum(counts, 1)
+    means = totals / divisor
+    groups.miners = numpy.bincount(codes, minlength=size).tolist()
+    groups.active = numpy.bincount(codes[active], minlength=size).tolist()
+    groups.hash_rate_counts = counts.tolist()
+    groups.hash_rate_totals = totals.tolist()
+    groups.hash_rate_means = means.tolist()
+    groups.hash_rate_stds = numpy.sqrt(
+        numpy.maximum(squares / divisor - means * means, 0.0)).tolist()
+
+    groups.temperatures = _distributions_numpy(columns.temperatures,
+                                               columns.temperature_owners,
+                                               codes, size)
+    groups.fan_speeds = _distributions_numpy(columns.fan_speeds,
+                                             columns.fan_speed_owners, codes,
+                                             size)
+    indexes = numpy.flatnonzero(active)
+    indexes = indexes[numpy.argsort(columns.hw_error_rates[indexes],
+                                    kind='stable')]
+    groups.hw_error_rates = _distributions_numpy(
+        columns.hw_error_rates[indexes], indexes, codes, size)
+    return groups
+
+
+def _outliers_numpy(columns, codes, groups, sigmas):
+    keys = codes * len(KINDS) + columns.kinds
+    stds = numpy.asarray(groups.hash_rate_stds)[keys]
+    limits = numpy.asarray(groups.hash_rate_means)[keys] - sigmas * stds
+    return numpy.flatnonzero(columns.active & (stds > 0) &
+                             (columns.hash_rates < limits)).tolist()
+
+
+class FleetStats:
+    """
+    Totals, means and standard deviations of the hash rate, distributions
+    of the temperatures, fan speeds and HW error rates per model, subnet and
+    worker of the miners of a snapshot, and the outliers of every model.
+
+    Hash rates are in the smallest unit of their kind, H/s or Sol/s, so that
+    the miners of a subnet or a worker add up whatever their models.
+    """
+
+    def __init__(self, miners, sigmas=OUTLIER_SIGMAS, use_numpy=None):
+        if use_numpy is None:
+            use_numpy = numpy is not None
+        aggregate = _aggregate_numpy if use_numpy else _aggregate
+        outliers = _outliers_numpy if use_numpy else _outliers
+
+        self.miners = miners
+        self.sigmas = sigmas
+        columns = Columns(miners)
+        if use_numpy:
+            columns.to_numpy()
+        self.groups = {
+            dimension: aggregate(columns, labels, codes)
+            for dimension, (labels, codes) in columns.dimensions.items()
+        }
+        self._columns = columns
+        # indexes of the outliers in `miners`
+        self._outliers = outliers(columns, columns.dimensions['models'][1],
+                                  self.groups['models'], sigmas)
+
+    @property
+    def outliers(self):
+        return [self.miners[index] for index in self._outliers]
+
+    def outlier(self, index):
+        """Hash rate, mean and deviation of the outlier miners[index]."""
+        miner = self.miners[index]
+        model = self.groups['models']
+        code = int(self._columns.dimensions['models'][1][index])
+        kind = int(self._columns.kinds[index])
+        i = code * len(KINDS) + kind
+        mean = model.hash_rate_means[i]
+        hash_rate = float(self._columns.hash_rates[index])
+        return {
+            'ip': miner.ip,
+            'model_id': miner.model_id,
+            'worker': miner.worker,
+            'hash_rate': hash_rate,
+            'unit': KINDS[kind],
+            'mean': mean,
+            'sigmas': (hash_rate - mean) / model.hash_rate_stds[i],
+        }
+
+    def as_dict(self):
+        stats = {
+            dimension: groups.as_dict()
+            for dimension, groups in self.groups.items()
+        }
+        stats['outliers'] = [self.outlier(index) for index in self._outliers]
+        return stats
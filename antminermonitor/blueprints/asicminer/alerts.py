@@ -0,0 +1,336 @@
+import logging
+import operator
+import threading
+import time
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from antminermonitor.blueprints.asicminer.models import Settings
+from antminermonitor.blueprints.asicminer.registry import registry
+from antminermonitor.database import db_session
+from config.settings import ALERT_RULES
+from lib.util_notify import notifier
+
+logger = logging.getLogger(__name__)
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+    '==': operator.eq,
+    '!=': operator.ne,
+}
+LEVELS = ('warning', 'error')
+
+
+def metrics(miner, state):
+    """
+    The values the rules can check for one polled miner. Updates the last
+    uptime kept in `state`; the hash rate baseline is moved by the engine.
+    """
+    chips = miner.chips
+    temperatures = miner.temperatures
+    found = chips.get('Os', 0) + chips.get('Xs', 0)
+    hash_rate = miner.hash_rate_ghs5s
+
+    baseline = state.baseline
+    if baseline is None:
+        baseline = state.baseline = hash_rate
+    drop = (baseline - hash_rate) * 100.0 / baseline if baseline else 0.0
+
+    rebooted = state.elapsed is not None and miner.elapsed < state.elapsed
+    state.elapsed = miner.elapsed
+
+    # hashboards reported without a working chip, and the ones of the model
+    # that are not reported at all; unknown for firmware without chip maps
+    chains = miner.chains
+    chains_up = [chain.index for chain in chains if 'o' in chain.chips]
+    chains_total = len(registry.plan(miner.model_id).chips)
+    chains_down = None
+    if chains:
+        chains_down = max(chains_total, len(chains)) - len(chains_up)
+
+    return {
+        'temp_max': max(temperatures) if temperatures else None,
+        'temp_count': len(temperatures),
+        'fan_min': min(miner.fan_speeds) if miner.fan_speeds else None,
+        'hash_rate': hash_rate,
+        'hash_rate_drop': drop,
+        'hw_error_rate': float(miner.hw_error_rate or 0),
+        'chips_x': chips.get('Xs', 0),
+        'chips_found': found,
+        'chips_total': chips.get('total', 0),
+        'chips_missing': chips.get('total', 0) - found,
+        'chains_down': chains_down,
+        'chains_up': ', '.join(map(str, chains_up)),
+        'chains_total': chains_total,
+        'elapsed': miner.elapsed,
+        'rebooted': int(rebooted),
+    }
+
+
+class AlertRule:
+    """
+    A rule compiled from its `ALERT_RULES` definition:
+
+    - name: rules of the same name override each other, a rule of a miner
+      wins over a rule of a model, which wins over a rule without scope
+    - metric: a key of `metrics()`, e.g. 'temp_max' or 'hash_rate_drop'
+    - op, threshold: the condition, e.g. '>=' and 80
+    - setting: name of a `Settings` row whose value replaces the threshold
+    - hysteresis: once fired, the alert clears only when the value is on
+      the other side of the threshold by this much
+    - for: seconds the condition must hold before the alert fires
+    - level: 'warning' or 'error'
+    - message: formatted with ip, model_id, value, threshold and metrics
+    - models, miners: the model ids and ips the rule applies to
+    """
+    __slots__ = ('name', 'metric', 'op', 'threshold', 'clear', 'duration',
+                 'level', 'message', 'models', 'miners', 'setting')
+
+    def __init__(self, definition, settings=None):
+        self.name = definition['name']
+        self.metric = definition['metric']
+        op = definition.get('op', '>')
+        self.op = OPERATORS[op]
+        self.setting = definition.get('setting')
+        threshold = definition['threshold']
+        if self.setting and settings and self.setting in settings:
+            try:
+                threshold = float(settings[self.setting])
+            except ValueError:
+                logger.warning("Setting %s is not a number", self.setting)
+        self.threshold = threshold
+        hysteresis = definition.get('hysteresis', 0)
+        if op in ('>', '>='):
+            self.clear = threshold - hysteresis
+        elif op in ('<', '<='):
+            self.clear = threshold + hysteresis
+        else:
+            self.clear = threshold
+        self.duration = definition.get('for', 0)
+        self.level = definition.get('level', 'warning')
+        if self.level not in LEVELS:
+            raise ValueError("Unknown alert level: {}".format(self.level))
+        self.message = definition['message']
+        self.models = frozenset(definition.get('models', ()))
+        self.miners = frozenset(definition.get('miners', ()))
+
+    @property
+    def specificity(self):
+        return 2 if self.miners else 1 if self.models else 0
+
+    def applies(self, ip, model_id):
+        return (not self.miners or ip in self.miners) and \
+            (not self.models or model_id in self.models)
+
+
+class MinerState:
+    """What the rules remember about a miner between two cycles."""
+    __slots__ = ('baseline', 'elapsed', 'pending', 'firing')
+
+    def __init__(self):
+        self.baseline = None
+        self.elapsed = None
+        # rule name => time the condition started to hold
+        self.pending = {}
+        # rule name => last message, of the rules that fired and have not
+        # cleared yet
+        self.firing = {}
+
+
+class AlertEngine:
+    """
+    Evaluate the alert rules on every polled miner, once per poll cycle.
+
+    The rules are compiled once (and again every `reload_interval` seconds
+    to pick up changes of the `Settings` table), the rules that apply to a
+    miner are resolved once per ip and model, and every miner keeps the
+    state of its rules between cycles, so a cycle costs a few comparisons
+    per miner and rule.
+
+    Alerts are appended to the warnings or errors of the miners, where the
+    dashboard, the API and the notifications pick them up.
+    """
+
+    def __init__(self, app=None):
+        self.definitions = ALERT_RULES
+        self.baseline_alpha = 0.1
+        self.reload_interval = 300
+        self.notify_inactive = False
+        self._rules = None
+        self._loaded = 0
+        self._resolved = {}
+        self._states = {}
+        self._lock = threading.Lock()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.definitions = app.config.get('ALERT_RULES', self.definitions)
+        self.baseline_alpha = app.config.get('ALERT_BASELINE_ALPHA',
+                                             self.baseline_alpha)
+        self.reload_interval = app.config.get('ALERT_RELOAD_INTERVAL',
+                                              self.reload_interval)
+        self.notify_inactive = app.config.get('NOTIFY_INACTIVE',
+                                              self.notify_inactive)
+        self.reload()
+        app.extensions['alert_engine'] = self
+
+    def reload(self):
+        """Compile the rules again on the next evaluation."""
+        self._rules = None
+
+    def _settings(self):
+        names = [d['setting'] for d in self.definitions if d.get('setting')]
+        if not names:
+            return {}
+        try:
+            return {
+                s.name: s.value
+                for s in Settings.query.filter(Settings.name.in_(names))
+            }
+        except SQLAlchemyError:
+            logger.exception("Could not read the alert settings")
+            return {}
+        finally:
+            db_session.remove()
+
+    def compile(self):
+        settings = self._settings()
+        rules = [AlertRule(d, settings) for d in self.definitions]
+        # the most specific rules first, so they shadow the others
+        rules.sort(key=lambda rule: rule.specificity, reverse=True)
+        self._rules = rules
+        self._resolved = {}
+        self._loaded = time.time()
+
+    def rules(self, ip, model_id):
+        """The rules that apply to a miner, one per name."""
+        key = (ip, model_id)
+        rules = self._resolved.get(key)
+        if rules is None:
+            names = set()
+            rules = []
+            for rule in self._rules:
+                if rule.name not in names and rule.applies(ip, model_id):
+                    names.add(rule.name)
+                    rules.append(rule)
+            self._resolved[key] = rules
+        return rules
+
+    def evaluate(self, miners, now=None, polled=None, forget=True):
+        """
+        Check the rules on the miners of a poll cycle, only on the `polled`
+        ones if given, the others keep the state of their last check.
+
+        :param forget: forget the miners that are not in `miners`
+        """
+        now = now or time.time()
+        if self._rules is None or now - self._loaded > self.reload_interval:
+            self.compile()
+
+        states = self._states
+        alive = {} if forget else states
+        for miner in miners:
+            state = states.get(miner.ip)
+            if state is None:
+                state = MinerState()
+            alive[miner.ip] = state
+        for miner in miners if polled is None else polled:
+            if miner.is_inactive:
+                continue
+            self._check(miner, alive[miner.ip], now)
+        # forget the miners that are not in the fleet anymore
+        self._states = alive
+
+    def check(self, snapshot):
+        """
+        Aggregator listener: check the rules on the snapshot of an agent, at
+        the time it was polled. The other agents keep their states.
+        """
+        with self._lock:
+            self.evaluate(snapshot.miners, snapshot.timestamp, forget=False)
+
+    def retain(self, snapshot):
+        """Forget the miners that are not in the merged `snapshot`."""
+        ips = {miner.ip for miner in snapshot.miners}
+        with self._lock:
+            self._states = {ip: state for ip, state in self._states.items()
+                            if ip in ips}
+
+    def firing(self, ip):
+        """The alerts of a miner that have not cleared: rule name => message"""
+        state = self._states.get(ip)
+        return dict(state.firing) if state is not None else {}
+
+    def _check(self, miner, state, now):
+        values = metrics(miner, state)
+        pending = state.pending
+        firing = state.firing
+        rules = self.rules(miner.ip, miner.model_id)
+        for rule in rules:
+            name = rule.name
+            value = values.get(rule.metric)
+            if value is None:
+                continue
+            if name in firing:
+                if rule.op(value, rule.clear):
+                    self._fire(miner, rule, value, values, state)
+                else:
+                    del firing[name]
+                continue
+            if not rule.op(value, rule.threshold):
+                if name in pending:
+                    del pending[name]
+                continue
+            since = pending.setdefault(name, now)
+            if now - since >= rule.duration:
+                del pending[name]
+                self._fire(miner, rule, value, values, state)
+
+        # a drop is measured against the baseline from before it started,
+        # or the baseline would catch up and clear a sustained drop
+        if not any(rule.metric == 'hash_rate_drop' and
+                   (rule.name in pending or rule.name in firing)
+                   for rule in rules):
+            state.baseline += self.baseline_alpha * (
+                values['hash_rate'] - state.baseline)
+
+    @staticmethod
+    def _fire(miner, rule, value, values, state):
+        message = rule.message.format(ip=miner.ip,
+                                      model_id=miner.model_id,
+                                      value=value,
+                                      threshold=rule.threshold,
+                                      **values)
+        messages = miner.errors if rule.level == 'error' else miner.warnings
+        # the snapshot of an agent already has the alerts the agent fired
+        if message not in messages:
+            messages.append(message)
+        state.firing[rule.name] = message
+
+
+alert_engine = AlertEngine()
+
+
+def notify_alerts(snapshot):
+    """
+    Queue the alerts of a poll cycle in the notification dispatcher. An
+    alert is identified by its miner and rule, whatever the values in its
+    message, so a condition is only sent again after the rate limit of the
+    dispatcher, no matter how many cycles it persists.
+
+    The errors of the miners that could not be polled are only sent with
+    `NOTIFY_INACTIVE`, once per miner until the rate limit.
+    """
+    for miner in snapshot.miners:
+        if miner.is_inactive:
+            if alert_engine.notify_inactive and miner.errors:
+                notifier.notify("\n".join(miner.errors),
+                                key=(miner.ip, 'inactive'))
+            continue
+        for name, message in alert_engine.firing(miner.ip).items():
+            notifier.notify(message, key=(miner.ip, name))
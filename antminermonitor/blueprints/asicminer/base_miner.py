@@ -1,4 +1,20 @@
+import asyncio
+import functools
+from datetime import timedelta
+
+from antminermonitor.blueprints.asicminer.registry import registry
+from lib.util_hashrate import update_unit_and_value
+
+
 class BaseMiner:
+    # thousands of miners are kept in memory: no `__dict__` per miner, and
+    # only raw values, formatted for display when rendered
+    __slots__ = ('id', 'ip', 'model_id', 'remarks', 'is_inactive', 'worker',
+                 'chips', 'temperatures', 'fan_speeds', 'hash_rate_ghs5s',
+                 'hw_error_rate', 'elapsed', 'poll_latency', 'polled_at',
+                 'warnings', 'errors', 'chains', 'temperature_ids',
+                 'fan_ids')
+
     def __init__(self, miner):
         self.id = miner.id
         self.ip = miner.ip
@@ -9,15 +25,79 @@ class BaseMiner:
         self.chips = {}
         self.temperatures = []
         self.fan_speeds = []
-        # this value will be used to calculate `total_hash_rate_per_model`
+        # in the unit of the model, e.g. GH/s, summed up per model
         self.hash_rate_ghs5s = 0
-        # this value will be displayed in the table
-        self.normalized_hash_rate = 0
         self.hw_error_rate = 0
-        self.uptime = ""
+        # uptime in seconds
+        self.elapsed = 0
+        # seconds it took to poll the miner
+        self.poll_latency = 0
+        # unix time of the poll, None until polled
+        self.polled_at = None
         self.warnings = []
         self.errors = []
+        # a `Chain` per hashboard, see registry.py
+        self.chains = ()
+        # the index of the sensor of every temperature and of the fan of
+        # every speed, the ones reading 0 are left out of both lists
+        self.temperature_ids = ()
+        self.fan_ids = ()
+
+    @property
+    def normalized_hash_rate(self):
+        """The hash rate in the best unit, e.g. '13.51 TH/s'."""
+        value, unit = update_unit_and_value(self.hash_rate_ghs5s,
+                                            registry.plan(self.model_id).unit)
+        return "{:3.2f} {}".format(value, unit)
 
-    def poll(self):
+    @property
+    def uptime(self):
+        return str(timedelta(seconds=self.elapsed)) if self.elapsed else ""
+
+    @property
+    def status(self):
+        if self.is_inactive:
+            return 'inactive'
+        if self.errors:
+            return 'error'
+        if self.warnings:
+            return 'warning'
+        return 'ok'
+
+    @property
+    def serialize(self):
+        return {
+            'id': self.id,
+            'ip': self.ip,
+            'model_id': self.model_id,
+            'remarks': self.remarks,
+            'status': self.status,
+            'worker': self.worker,
+            'chips': self.chips,
+            'temperatures': self.temperatures,
+            'fan_speeds': self.fan_speeds,
+            'hash_rate_ghs5s': self.hash_rate_ghs5s,
+            'hw_error_rate': self.hw_error_rate,
+            'elapsed': self.elapsed,
+            'uptime': self.uptime,
+            'poll_latency': self.poll_latency,
+            'polled_at': self.polled_at,
+            'errors': self.errors,
+            'warnings': self.warnings,
+            'chains': [chain._asdict() for chain in self.chains],
+        }
+
+    def poll(self, timeout=None):
         pass
 
+    async def async_poll(self, semaphore=None, timeout=None):
+        # models without a native asyncio implementation are polled with
+        # their blocking `poll` in the default executor
+        loop = asyncio.get_running_loop()
+        poll = functools.partial(self.poll, timeout=timeout)
+        if semaphore is None:
+            await loop.run_in_executor(None, poll)
+        else:
+            async with semaphore:
+                await loop.run_in_executor(None, poll)
+
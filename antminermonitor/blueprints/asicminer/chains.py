@@ -0,0 +1,199 @@
+import logging
+import threading
+import time
+from itertools import zip_longest
+
+from sqlalchemy import func
+
+from antminermonitor.blueprints.asicminer.models import ChainEvent
+from antminermonitor.database import db_session, engine, transaction
+
+logger = logging.getLogger(__name__)
+
+# seconds between two deletions of the events older than the retention
+PRUNE_INTERVAL = 3600
+
+
+def diff(old, new):
+    """
+    The chip positions that changed between two maps of a chain, e.g.
+    diff('ooox', 'oxoo') => '1:o>x,3:x>o'. A position missing from one of
+    the maps is '_'.
+    """
+    return ','.join(
+        '{}:{}>{}'.format(position, before, after)
+        for position, (before, after) in enumerate(
+            zip_longest(old, new, fillvalue='_')) if before != after)
+
+
+class ChainTracker:
+    """
+    Track the chip map of every hashboard (chain) of the fleet and store a
+    `ChainEvent` only when it changes, with the chip positions that flipped,
+    instead of every map on every cycle. An unchanged map costs a string
+    comparison per chain and cycle.
+
+    The snapshots are queued and their changes written in one transaction
+    every `flush_interval` seconds by a background thread, like the samples
+    of the time-series store, never by the poller or the request of an
+    agent that brought them. The last map of every chain is loaded from the
+    database by the first flush, so a restart does not store the whole
+    fleet again.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.flush_interval = 60
+        # seconds to keep the events
+        self.retention = 90 * 86400
+        # ip => {chain index => chip map}, '' once the chain is not reported
+        self._maps = None
+        self._queue = []
+        self._last_prune = 0
+        self._table_checked = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('CHAIN_EVENTS_ENABLED', self.enabled)
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL',
+                                             self.flush_interval)
+        self.retention = app.config.get('CHAIN_EVENTS_RETENTION',
+                                        self.retention)
+        app.extensions['chains'] = self
+
+    def changes(self, snapshot):
+        """
+        The `ChainEvent` rows (as dicts) of the chains of a `FleetSnapshot`
+        whose chip map changed since the previous snapshot.
+        """
+        timestamp = int(snapshot.timestamp or time.time())
+        rows = []
+        for miner in snapshot.miners:
+            # an unreachable miner tells nothing about its chains
+            if miner.is_inactive:
+                continue
+            maps = self._maps.get(miner.ip)
+            if maps is None:
+                maps = self._maps[miner.ip] = {}
+
+            for chain in miner.chains:
+                previous = maps.get(chain.index)
+                if previous == chain.chips:
+                    continue
+                maps[chain.index] = chain.chips
+                temperatures = chain.temperatures
+                rows.append({
+                    'ip': miner.ip,
+                    'model_id': miner.model_id,
+                    'chain': chain.index,
+                    'timestamp': timestamp,
+                    'chips': chain.chips,
+                    # a new chain, or one reported again, has no changes
+                    'changes':
+                    diff(previous, chain.chips) if previous else None,
+                    'rate': chain.rate,
+                    'hw_errors': chain.hw_errors,
+                    'temp_max': max(temperatures) if temperatures else None,
+                })
+
+            if len(maps) > len(miner.chains):
+                # chains no longer reported, e.g. a dead hashboard
+                reported = {chain.index for chain in miner.chains}
+                for index, chips in maps.items():
+                    if chips and index not in reported:
+                        maps[index] = ''
+                        rows.append({
+                            'ip': miner.ip,
+                            'model_id': miner.model_id,
+                            'chain': index,
+                            'timestamp': timestamp,
+                            'chips': '',
+                            'changes': None,
+                        })
+        return rows
+
+    def record(self, snapshot):
+        """Queue a `FleetSnapshot` for the next flush."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._queue.append(snapshot)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='antminer-chains',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self, now=None):
+        """Store the changes of the chains of the queued snapshots."""
+        now = now or time.time()
+        with self._lock:
+            snapshots, self._queue = self._queue, []
+        try:
+            if self._maps is None:
+                self._maps = self._load()
+            rows = []
+            for snapshot in snapshots:
+                rows.extend(self.changes(snapshot))
+            with transaction() as session:
+                if rows:
+                    session.bulk_insert_mappings(ChainEvent, rows)
+                if now - self._last_prune >= PRUNE_INTERVAL:
+                    self._last_prune = now
+                    session.query(ChainEvent) \
+                        .filter(ChainEvent.timestamp < now - self.retention) \
+                        .delete(synchronize_session=False)
+        except Exception:
+            logger.exception("Could not store the changes of the chains")
+        finally:
+            db_session.remove()
+
+    def _load(self):
+        """The last stored map of every chain."""
+        self._ensure_table()
+        latest = db_session.query(func.max(ChainEvent.id)) \
+            .group_by(ChainEvent.ip, ChainEvent.chain)
+        maps = {}
+        for ip, chain, chips in db_session.query(
+                ChainEvent.ip, ChainEvent.chain,
+                ChainEvent.chips).filter(ChainEvent.id.in_(latest)):
+            maps.setdefault(ip, {})[chain] = chips
+        return maps
+
+    def query_miner(self, ip, start, end):
+        """
+        Return the events of the chains of a miner between `start` and `end`
+        (unix timestamps) as a list of dicts.
+        """
+        self._ensure_table()
+        rows = ChainEvent.query.filter(ChainEvent.ip == ip,
+                                       ChainEvent.timestamp >= start,
+                                       ChainEvent.timestamp < end) \
+            .order_by(ChainEvent.timestamp, ChainEvent.chain).all()
+        return [{
+            'chain': row.chain,
+            'timestamp': row.timestamp,
+            'chips': row.chips,
+            'changes': row.changes,
+            'rate': row.rate,
+            'hw_errors': row.hw_errors,
+            'temp_max': row.temp_max,
+        } for row in rows]
+
+    def _ensure_table(self):
+        # databases created before the chain_event table existed
+        if not self._table_checked:
+            ChainEvent.__table__.create(bind=engine, checkfirst=True)
+            self._table_checked = True
+
+
+chain_tracker = ChainTracker()
@@ -0,0 +1,380 @@
+import gzip
+import hashlib
+import ipaddress
+import json
+import logging
+import socket
+import threading
+import time
+import urllib.request
+from collections import deque
+from types import SimpleNamespace
+
+try:
+    import fcntl
+except ImportError:  # Windows: nothing stops a second aggregator
+    fcntl = None
+
+from antminermonitor.blueprints.asicminer.base_miner import BaseMiner
+from antminermonitor.blueprints.asicminer.poller import FleetSnapshot, poller
+from antminermonitor.blueprints.asicminer.registry import Chain
+
+logger = logging.getLogger(__name__)
+
+# attributes of a polled miner sent by the agents, in this order
+FIELDS = BaseMiner.__slots__
+
+
+def encode(snapshot, agent_id):
+    """A snapshot as a compact JSON-able dict, one list per miner."""
+    return {
+        'agent': agent_id,
+        'cycle': snapshot.cycle,
+        'timestamp': snapshot.timestamp,
+        'duration': snapshot.duration,
+        'fields': FIELDS,
+        'miners': [[getattr(miner, field) for field in FIELDS]
+                   for miner in snapshot.miners],
+    }
+
+
+def decode(payload):
+    """The `FleetSnapshot` of an encoded snapshot."""
+    fields = payload['fields']
+    miners = [RemoteMiner(dict(zip(fields, values)))
+              for values in payload['miners']]
+    return FleetSnapshot(miners=miners,
+                         timestamp=payload['timestamp'],
+                         duration=payload['duration'],
+                         cycle=payload['cycle'])
+
+
+class RemoteMiner(BaseMiner):
+    """A miner polled by an agent."""
+    __slots__ = ()
+
+    def __init__(self, values):
+        super(RemoteMiner, self).__init__(SimpleNamespace(**values))
+        for field, value in values.items():
+            # fields of other versions of the agents are ignored
+            if field in FIELDS:
+                setattr(self, field, value)
+        # lists once encoded
+        self.chains = tuple(Chain(*chain) for chain in self.chains)
+
+
+class Shard:
+    """
+    The miners of the `Miner` table an agent polls: the miners in one of
+    `subnets`, whose remarks contain one of `tags` and that rendezvous
+    hashing over `peers` assigns to `agent_id`. Adding or removing a peer
+    only moves the miners of that peer.
+    """
+
+    def __init__(self, agent_id, subnets=(), tags=(), peers=()):
+        self.agent_id = agent_id
+        self.subnets = [ipaddress.ip_network(s, strict=False) for s in subnets]
+        self.tags = [tag.lower() for tag in tags]
+        self.peers = list(peers)
+
+    @staticmethod
+    def _weight(peer, ip):
+        return hashlib.md5('{}/{}'.format(peer, ip).encode()).digest()
+
+    def owner(self, ip):
+        return max(self.peers, key=lambda peer: self._weight(peer, ip))
+
+    def contains(self, miner):
+        if self.subnets:
+            try:
+                ip = ipaddress.ip_address(miner.ip)
+            except ValueError:
+                return False
+            if not any(ip in subnet for subnet in self.subnets):
+                return False
+        if self.tags:
+            remarks = (miner.remarks or '').lower()
+            if not any(tag in remarks for tag in self.tags):
+                return False
+        if self.peers and self.owner(miner.ip) != self.agent_id:
+            return False
+        return True
+
+
+class Agent:
+    """
+    Push the snapshots of the poller to the aggregator.
+
+    Snapshots are buffered (up to `buffer_size`, the oldest are dropped
+    first) and sent in order, `batch_size` at a time, by a background
+    thread. While the aggregator is unreachable they stay in the buffer and
+    are replayed every `retry_interval` seconds.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.agent_id = socket.gethostname()
+        self.url = None
+        self.token = None
+        self.batch_size = 20
+        self.retry_interval = 10
+        self.timeout = 10
+        self._buffer = deque(maxlen=1000)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._wakeup = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('POLL_MODE') == 'agent'
+        self.agent_id = app.config.get('AGENT_ID') or self.agent_id
+        self.url = app.config.get('AGGREGATOR_URL')
+        self.token = app.config.get('AGENT_TOKEN')
+        self.batch_size = app.config.get('AGENT_BATCH_SIZE', self.batch_size)
+        self.retry_interval = app.config.get('AGENT_RETRY_INTERVAL',
+                                             self.retry_interval)
+        self._buffer = deque(self._buffer,
+                             maxlen=app.config.get('AGENT_BUFFER_SIZE',
+                                                   self._buffer.maxlen))
+        app.extensions['agent'] = self
+        if not self.enabled:
+            return
+        if not self.url:
+            raise RuntimeError("POLL_MODE 'agent' needs an AGGREGATOR_URL")
+        poller.shard = Shard(self.agent_id,
+                             app.config.get('AGENT_SUBNETS', ()),
+                             app.config.get('AGENT_TAGS', ()),
+                             app.config.get('AGENT_PEERS', ()))
+        poller.subscribe(self.record)
+
+    @property
+    def pending(self):
+        return len(self._buffer)
+
+    def record(self, snapshot):
+        """Poller listener: queue a snapshot for the aggregator."""
+        with self._lock:
+            self._buffer.append(encode(snapshot, self.agent_id))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='antminer-agent',
+                                                daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+
+    def push(self):
+        """
+        Send the buffered snapshots, oldest first.
+
+        :return: True if the buffer is empty
+        """
+        while True:
+            with self._lock:
+                batch = [self._buffer[i] for i in range(
+                    min(self.batch_size, len(self._buffer)))]
+            if not batch:
+                return True
+            try:
+                self._post(batch)
+            except Exception as e:
+                logger.warning("Could not push %d snapshots to %s: %s",
+                               len(self._buffer), self.url, e)
+                return False
+            with self._lock:
+                # snapshots dropped from a full buffer meanwhile are gone
+                for payload in batch:
+                    if self._buffer and self._buffer[0] is payload:
+                        self._buffer.popleft()
+
+    def _post(self, batch):
+        body = gzip.compress(json.dumps({'snapshots': batch}).encode())
+        headers = {
+            'Content-Type': 'application/json',
+            'Content-Encoding': 'gzip',
+        }
+        if self.token:
+            headers['Authorization'] = 'Bearer {}'.format(self.token)
+        request = urllib.request.Request(
+            self.url.rstrip('/') + '/cluster/snapshots',
+            data=body,
+            headers=headers,
+            method='POST')
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            self._wakeup.clear()
+            while not self.push():
+                # replay once the aggregator is back, unless new snapshots
+                # wake us up first
+                self._wakeup.wait(self.retry_interval)
+                self._wakeup.clear()
+
+
+class Aggregator:
+    """
+    Merge the snapshots pushed by the agents into the snapshot the poller
+    serves to the dashboard, the API and the exporters.
+
+    Every snapshot received, replayed ones included, is passed to the
+    listeners (e.g. the time-series store); the merged view only keeps the
+    latest snapshot of every agent. The miners of an agent that has not
+    reported for `stale_after` seconds are shown as inactive.
+
+    The snapshots are kept in memory, so the aggregator runs in a single
+    process: it holds an exclusive `flock` on `lock_path` and another
+    process of the app fails to start.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.stale_after = 120
+        self.max_batch_size = 64 * 1024 * 1024
+        self.lock_path = None
+        self._lock_file = None
+        self._agents = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._cycle = 0
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('POLL_MODE') == 'aggregator'
+        self.stale_after = app.config.get('AGENT_STALE_AFTER',
+                                          self.stale_after)
+        self.max_batch_size = app.config.get('AGENT_MAX_BATCH_SIZE',
+                                             self.max_batch_size)
+        self.lock_path = app.config.get('AGGREGATOR_LOCK_PATH',
+                                        self.lock_path)
+        app.extensions['aggregator'] = self
+        if self.enabled:
+            self._acquire()
+            # the agents poll, the poller only serves their snapshots
+            poller.enabled = False
+
+    def _acquire(self):
+        if self._lock_file is not None or fcntl is None or \
+                not self.lock_path:
+            return
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(
+                "Another process of the app is the aggregator (lock {}): "
+                "POLL_MODE 'aggregator' runs in a single process, e.g. "
+                "gunicorn --workers 1".format(self.lock_path))
+        self._lock_file = lock_file
+
+    def subscribe(self, listener):
+        """Call `listener(snapshot)` for every snapshot of every agent."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def receive(self, payloads, address=None):
+        """Merge the encoded snapshots of a batch and publish the result."""
+        now = time.time()
+        for payload in sorted(payloads, key=lambda p: p['timestamp']):
+            snapshot = decode(payload)
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception:
+                    logger.exception("Aggregator listener %r failed",
+                                     listener)
+            with self._lock:
+                agent = self._agents.get(payload['agent'])
+                if agent is None or agent['snapshot'].timestamp <= \
+                        snapshot.timestamp:
+                    self._agents[payload['agent']] = {
+                        'snapshot': snapshot,
+                        'received': now,
+                        'address': address,
+                    }
+        self.publish()
+        self._watch()
+
+    def publish(self):
+        poller.publish(self.merge())
+
+    def merge(self, now=None):
+        now = now or time.time()
+        miners = []
+        timestamp = None
+        duration = 0
+        with self._lock:
+            self._cycle += 1
+            for agent_id, agent in sorted(self._agents.items()):
+                snapshot = agent['snapshot']
+                if now - agent['received'] > self.stale_after:
+                    miners.extend(
+                        self._stale(miner, agent_id, agent['received'])
+                        for miner in snapshot.miners)
+                    continue
+                miners.extend(snapshot.miners)
+                timestamp = max(timestamp or 0, snapshot.timestamp)
+                duration = max(duration, snapshot.duration)
+            cycle = self._cycle
+        return FleetSnapshot(miners=miners,
+                             timestamp=timestamp or now,
+                             duration=duration,
+                             cycle=cycle)
+
+    @staticmethod
+    def _stale(miner, agent_id, received):
+        stale = RemoteMiner({field: getattr(miner, field) for field in
+                             ('id', 'ip', 'model_id', 'remarks')})
+        stale.is_inactive = True
+        stale.errors = [
+            "[ERROR] Agent '{}' has not reported since {}".format(
+                agent_id,
+                time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(received)))
+        ]
+        return stale
+
+    def status(self, now=None):
+        now = now or time.time()
+        with self._lock:
+            return {
+                agent_id: {
+                    'address': agent['address'],
+                    'cycle': agent['snapshot'].cycle,
+                    'polled_at': agent['snapshot'].timestamp,
+                    'received_at': agent['received'],
+                    'miners': len(agent['snapshot'].miners),
+                    'stale': now - agent['received'] > self.stale_after,
+                }
+                for agent_id, agent in self._agents.items()
+            }
+
+    def _watch(self):
+        """Publish again when an agent goes stale, even if none reports."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run,
+                                            name='antminer-aggregator',
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        stale = set()
+        while True:
+            time.sleep(min(self.stale_after, 30))
+            status = self.status()
+            now_stale = {a for a, s in status.items() if s['stale']}
+            if now_stale != stale:
+                stale = now_stale
+                self.publish()
+
+
+agent = Agent()
+aggregator = Aggregator()
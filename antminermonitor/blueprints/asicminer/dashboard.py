@@ -0,0 +1,120 @@
+import hashlib
+import threading
+from operator import attrgetter
+
+from markupsafe import Markup
+
+NO_MINERS = ("[INFO] No miners added yet. "
+             "Please add miners using the above form.")
+NO_ERRORS = "[INFO] All miners are operating normal. No errors found."
+
+
+def alert_panel(snapshot, limit=50):
+    """
+    The alert panel of the dashboard, rendered from the state of a
+    `FleetSnapshot` instead of flashed into the session on every request:
+    (category, message, count) with every message once, the errors first,
+    at most `limit` of them.
+
+    :return: (alerts, number of messages left out)
+    """
+    if not snapshot.miners:
+        return [('info', NO_MINERS, 1)], 0
+
+    counts = {}
+    if not snapshot.errors:
+        counts[('info', NO_ERRORS)] = 1
+    for category, messages in (('error', snapshot.errors),
+                               ('warning', snapshot.warnings)):
+        for message in messages:
+            key = (category, message)
+            counts[key] = counts.get(key, 0) + 1
+    panel = [(category, message, count)
+             for (category, message), count in counts.items()]
+    return panel[:limit], max(0, len(panel) - limit)
+
+
+class RowCache:
+    """
+    The rendered rows of the miner tables of the dashboard, per miner. A
+    row is only rendered again once its miner was polled again, so a page of
+    thousands of miners renders the rows of the few polled since the
+    previous page. Miners without a poll time, e.g. from agents of older
+    versions, are always rendered.
+    """
+
+    def __init__(self):
+        # ip => (poll time, html)
+        self._rows = {}
+        self._lock = threading.Lock()
+
+    def render(self, miners, render_row):
+        """
+        :param render_row: renders the row of a miner
+        :return: (rows of the active miners, rows of the inactive ones) as
+                 HTML, sorted by ip
+        """
+        rows = {}
+        active = []
+        inactive = []
+        with self._lock:
+            previous = self._rows
+            for miner in sorted(miners, key=attrgetter('ip')):
+                polled_at = miner.polled_at
+                cached = previous.get(miner.ip)
+                if polled_at is not None and cached is not None and \
+                        cached[0] == polled_at:
+                    html = cached[1]
+                else:
+                    html = render_row(miner)
+                rows[miner.ip] = (polled_at, html)
+                (inactive if miner.is_inactive else active).append(html)
+            # forget the removed miners
+            self._rows = rows
+        return Markup(''.join(active)), Markup(''.join(inactive))
+
+
+class PageCache:
+    """
+    The last rendered dashboard and its compressed bodies, by ETag.
+
+    The ETag is derived from the state the page shows, so the requests
+    between two snapshots send the same page without rendering it, and a
+    browser that has it gets a 304 without a body. The page is rendered
+    once whatever the number of requests waiting for it.
+    """
+
+    def __init__(self):
+        self.rows = RowCache()
+        self._etag = None
+        self._body = None
+        # encoding => compressed body
+        self._compressed = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def etag(*state):
+        """The ETag of the page that shows `state`."""
+        return hashlib.sha1(repr(state).encode()).hexdigest()
+
+    def get(self, etag, render, encoding=None, compress=None):
+        """
+        The body of the page of `etag`, rendered with `render()` unless it
+        is the cached one, compressed with `compress(body, encoding)` if
+        `encoding` is given.
+        """
+        with self._lock:
+            if self._etag != etag:
+                self._body = render().encode()
+                self._etag = etag
+                self._compressed = {}
+            if encoding is None:
+                return self._body
+            body = self._compressed.get(encoding)
+            if body is None:
+                body = self._compressed[encoding] = compress(
+                    self._body, encoding)
+            return body
+
+
+page_cache = PageCache()
@@ -0,0 +1,241 @@
+import asyncio
+import ipaddress
+import logging
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy.exc import SQLAlchemyError
+
+from antminermonitor.blueprints.asicminer.inventory import CHUNK_SIZE
+from antminermonitor.blueprints.asicminer.models import Miner
+from antminermonitor.database import db_session, transaction
+from config.settings import MODELS
+from lib.pycgminer import async_get_stats
+
+logger = logging.getLogger(__name__)
+
+# number of finished jobs kept in memory so their results can be fetched
+MAX_JOBS = 10
+
+
+def parse_ranges(text, max_hosts=65536):
+    """
+    Parse a list of IP ranges separated by commas, spaces or new lines.
+    Every range can be a CIDR network (192.168.1.0/24), a start-end range
+    (192.168.1.10-192.168.1.50 or 192.168.1.10-50) or a single IP address.
+
+    :param text: ranges to parse
+    :param max_hosts: maximum number of IP addresses to return
+    :return: list of unique IP addresses as strings, in order
+    :raises ValueError: if a range is invalid or there are too many hosts
+    """
+    hosts = OrderedDict()
+    for token in re.split(r'[\s,;]+', text.strip()):
+        if not token:
+            continue
+        if '/' in token:
+            network = ipaddress.ip_network(token, strict=False)
+            addresses = network.hosts() if network.num_addresses > 2 \
+                else iter(network)
+        elif '-' in token:
+            first, last = token.split('-', 1)
+            first = ipaddress.ip_address(first)
+            if '.' not in last:
+                # short form, e.g. 192.168.1.10-50
+                last = first.exploded.rsplit('.', 1)[0] + '.' + last
+            last = ipaddress.ip_address(last)
+            if last < first:
+                raise ValueError(
+                    "Start IP ({}) cannot be greater than the end IP ({})".
+                    format(first, last))
+            addresses = (ipaddress.ip_address(i)
+                         for i in range(int(first),
+                                        int(last) + 1))
+        else:
+            addresses = [ipaddress.ip_address(token)]
+
+        for address in addresses:
+            hosts[str(address)] = None
+            if len(hosts) > max_hosts:
+                raise ValueError(
+                    "Too many IP addresses to scan (max {})".format(max_hosts))
+    return list(hosts)
+
+
+class DiscoveryJob:
+    """
+    Scan a list of IP addresses for supported miners in a background thread.
+
+    Every address is first probed with a plain TCP connect on the cgminer
+    API port; the `stats` command is only sent to the addresses that
+    accepted the connection. The supported miners that were found are
+    inserted into the `Miner` table in a single transaction when the scan
+    ends.
+
+    Progress is recorded as a list of events that the UI streams.
+    """
+
+    def __init__(self, hosts, port=4028, max_concurrency=256,
+                 probe_timeout=0.5, timeout=1):
+        self.id = uuid.uuid4().hex
+        self.hosts = hosts
+        self.port = port
+        self.max_concurrency = max_concurrency
+        self.probe_timeout = probe_timeout
+        self.timeout = timeout
+        self.total = len(hosts)
+        self.scanned = 0
+        self.responders = 0
+        self.found = []
+        self.added = []
+        self.done = False
+        self.started = time.time()
+        self.finished = None
+        self.events = []
+        self._condition = threading.Condition()
+
+    def start(self, on_done=None):
+        self._on_done = on_done
+        thread = threading.Thread(target=self._run,
+                                  name='antminer-discovery-' + self.id[:8],
+                                  daemon=True)
+        thread.start()
+        return self
+
+    @property
+    def progress(self):
+        return {
+            'id': self.id,
+            'total': self.total,
+            'scanned': self.scanned,
+            'responders': self.responders,
+            'found': len(self.found),
+            'added': len(self.added),
+            'done': self.done,
+            'elapsed': (self.finished or time.time()) - self.started,
+        }
+
+    def wait_events(self, since, timeout=15):
+        """
+        Block until there are events newer than `since` or the job is done.
+
+        :return: list of (index, event) tuples
+        """
+        with self._condition:
+            if len(self.events) <= since and not self.done:
+                self._condition.wait(timeout)
+            return [(index, self.events[index])
+                    for index in range(since, len(self.events))]
+
+    def _emit(self, type, **data):
+        data.update({'type': type, 'progress': self.progress})
+        with self._condition:
+            self.events.append(data)
+            self._condition.notify_all()
+
+    def _run(self):
+        try:
+            asyncio.run(self._scan())
+            self._save()
+        except Exception as e:
+            logger.exception("Discovery job %s failed", self.id)
+            self._emit('error', message="[ERROR] Discovery failed: {}".format(e))
+        finally:
+            self.done = True
+            self.finished = time.time()
+            self._emit('done')
+            if self._on_done is not None:
+                self._on_done(self)
+
+    async def _scan(self):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # report progress every ~1% of the hosts
+        step = max(1, self.total // 100)
+
+        async def scan(ip):
+            async with semaphore:
+                if await self._probe(ip):
+                    self.responders += 1
+                    model_id = await self._identify(ip)
+                    if model_id in MODELS:
+                        self.found.append((ip, model_id))
+                        self._emit('found', ip=ip, model_id=model_id)
+                    else:
+                        self._emit('unsupported', ip=ip, model_id=model_id)
+            self.scanned += 1
+            if self.scanned % step == 0:
+                self._emit('progress')
+
+        await asyncio.gather(*[scan(ip) for ip in self.hosts])
+
+    async def _probe(self, ip):
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(ip, self.port), self.probe_timeout)
+        except Exception:
+            return False
+        writer.close()
+        return True
+
+    async def _identify(self, ip):
+        # semaphore is None as the caller already holds a slot
+        miner_stats = await async_get_stats(ip, timeout=self.timeout)
+        try:
+            return miner_stats['STATS'][0]['Type']
+        except Exception:
+            return None
+
+    def _save(self):
+        """Insert every newly found miner in a single transaction."""
+        if not self.found:
+            return
+        try:
+            ips = [ip for ip, _ in self.found]
+            existing = set()
+            for i in range(0, len(ips), CHUNK_SIZE):
+                existing.update(
+                    ip for ip, in db_session.query(Miner.ip).filter(
+                        Miner.ip.in_(ips[i:i + CHUNK_SIZE])))
+            miners = [
+                Miner(ip=ip, model_id=model_id, remarks="")
+                for ip, model_id in sorted(
+                    self.found, key=lambda f: ipaddress.ip_address(f[0]))
+                if ip not in existing
+            ]
+            with transaction() as session:
+                session.add_all(miners)
+            self.added = [miner.ip for miner in miners]
+            self._emit('saved',
+                       added=self.added,
+                       existing=sorted(existing, key=ipaddress.ip_address))
+        except SQLAlchemyError:
+            db_session.rollback()
+            raise
+        finally:
+            db_session.remove()
+
+
+class DiscoveryJobs:
+    """Registry of the most recent discovery jobs."""
+
+    def __init__(self, max_jobs=MAX_JOBS):
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+        return job
+
+    def get(self, id):
+        with self._lock:
+            return self._jobs.get(id)
+
+
+discovery_jobs = DiscoveryJobs()
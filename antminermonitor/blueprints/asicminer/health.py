@@ -0,0 +1,123 @@
+import threading
+import time
+
+# circuit breaker states of a miner
+CLOSED = 'closed'  # healthy, polled every cycle
+OPEN = 'open'  # unreachable, skipped until the backoff expires
+HALF_OPEN = 'half-open'  # backoff expired, the next poll is a probe
+
+
+class MinerHealth:
+    """
+    Round-trip time and failure history of one miner.
+
+    The RTT estimator is the one of TCP (RFC 6298): a smoothed RTT and its
+    mean deviation, updated on every successful poll.
+    """
+    __slots__ = ('srtt', 'rttvar', 'failures', 'state', 'retry_at')
+
+    def __init__(self):
+        self.srtt = None
+        self.rttvar = None
+        self.failures = 0
+        self.state = CLOSED
+        self.retry_at = 0
+
+
+class HealthTracker:
+    """
+    Per-miner health of the fleet, kept by the poller across cycles.
+
+    - adaptive timeouts: a miner that has answered before gets a timeout of
+      `srtt + 4 * rttvar`, clamped between `min_timeout` and the configured
+      cgminer timeout, instead of the full configured timeout
+    - exponential backoff: after `threshold` consecutive failures the
+      circuit opens and the miner is skipped for `base_backoff` seconds,
+      doubled on every failed probe up to `max_backoff`
+    - circuit breaker: once the backoff expires the miner is probed once;
+      an answer closes the circuit, a failure opens it again
+
+    Skipped miners are still reported as inactive, so a cycle only waits
+    for the miners that are likely to answer.
+    """
+
+    def __init__(self, threshold=3, base_backoff=60, max_backoff=900,
+                 min_timeout=0.25):
+        self.threshold = threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.min_timeout = min_timeout
+        self._miners = {}
+        self._lock = threading.Lock()
+
+    def get(self, ip):
+        with self._lock:
+            health = self._miners.get(ip)
+            if health is None:
+                health = self._miners[ip] = MinerHealth()
+            return health
+
+    def forget(self, ips):
+        """Drop the health of the miners that are not in `ips` anymore."""
+        ips = set(ips)
+        with self._lock:
+            for ip in [ip for ip in self._miners if ip not in ips]:
+                del self._miners[ip]
+
+    def should_poll(self, ip, now=None):
+        """
+        :return: False if the circuit of the miner is open, True otherwise.
+                 An open circuit whose backoff has expired turns half-open
+                 and lets one probe through.
+        """
+        health = self.get(ip)
+        if health.state != OPEN:
+            return True
+        if (now or time.time()) < health.retry_at:
+            return False
+        health.state = HALF_OPEN
+        return True
+
+    def timeout(self, ip, timeout):
+        """
+        Timeout of the next RPC to the miner.
+
+        :param timeout: configured timeout, a number of seconds or a dict of
+                        per-command timeouts
+        :return: adaptive timeout in seconds, or `timeout` unchanged if the
+                 miner has never answered or has just failed
+        """
+        health = self.get(ip)
+        # a miner that failed gets the full timeout, so a slow answer is not
+        # mistaken for an unreachable miner
+        if health.srtt is None or health.failures:
+            return timeout
+        if isinstance(timeout, dict):
+            ceiling = max(timeout.values())
+        else:
+            ceiling = timeout
+        return min(ceiling,
+                   max(self.min_timeout, health.srtt + 4 * health.rttvar))
+
+    def success(self, ip, rtt):
+        health = self.get(ip)
+        if health.srtt is None:
+            health.srtt = rtt
+            health.rttvar = rtt / 2
+        else:
+            health.rttvar = 0.75 * health.rttvar + 0.25 * abs(health.srtt -
+                                                               rtt)
+            health.srtt = 0.875 * health.srtt + 0.125 * rtt
+        health.failures = 0
+        health.state = CLOSED
+        health.retry_at = 0
+
+    def failure(self, ip, now=None):
+        health = self.get(ip)
+        health.failures += 1
+        if health.failures >= self.threshold:
+            backoff = min(
+                self.max_backoff,
+                self.base_backoff * 2**(health.failures - self.threshold))
+            health.state = OPEN
+            health.retry_at = (now or time.time()) + backoff
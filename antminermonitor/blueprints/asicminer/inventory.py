@@ -0,0 +1,200 @@
+import csv
+import io
+import ipaddress
+import json
+
+from antminermonitor.blueprints.asicminer.models import Miner
+from antminermonitor.database import db_session, transaction
+from config.settings import MODELS
+
+# columns of the import and export files
+COLUMNS = ('ip', 'model_id', 'remarks')
+# max bound parameters of a SQLite statement is 999
+CHUNK_SIZE = 500
+MAX_ROWS = 100000
+
+
+class InventoryError(ValueError):
+    """A file or a request body that cannot be imported at all."""
+
+
+def _ip(ip):
+    try:
+        return int(ipaddress.ip_address(ip))
+    except ValueError:
+        return 0
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def parse(data, format):
+    """
+    Parse the rows of a CSV file (with a header, the columns of `COLUMNS` in
+    any order) or of a JSON list of objects.
+
+    :param data: content of the file
+    :type data: str
+    :param format: 'csv' or 'json'
+    :return: list of dicts, one per row
+    """
+    if format == 'json':
+        try:
+            rows = json.loads(data)
+        except ValueError as e:
+            raise InventoryError("Invalid JSON: {}".format(e))
+        if isinstance(rows, dict):
+            rows = rows.get('miners')
+        if not isinstance(rows, list):
+            raise InventoryError("Expected a list of miners")
+    elif format == 'csv':
+        reader = csv.DictReader(io.StringIO(data))
+        if not reader.fieldnames or 'ip' not in reader.fieldnames:
+            raise InventoryError("The CSV file needs a header with an 'ip' "
+                                 "column")
+        rows = list(reader)
+    else:
+        raise InventoryError("Unknown format: {}".format(format))
+    if len(rows) > MAX_ROWS:
+        raise InventoryError("Too many rows, the limit is {}".format(
+            MAX_ROWS))
+    return rows
+
+
+def validate(row):
+    """
+    :return: (ip, model_id, remarks) of a row
+    :raises ValueError: if the row is not a valid miner
+    """
+    if not isinstance(row, dict):
+        raise ValueError("Expected an object")
+    ip = str(row.get('ip') or '').strip()
+    if not ip:
+        raise ValueError("Missing ip")
+    ip = str(ipaddress.ip_address(ip))
+    model_id = str(row.get('model_id') or '').strip()
+    if model_id not in MODELS:
+        raise ValueError("Unknown model_id: '{}'".format(model_id))
+    remarks = row.get('remarks')
+    remarks = '' if remarks is None else str(remarks).strip()
+    if len(remarks) > Miner.remarks.type.length:
+        raise ValueError("Remarks longer than {} characters".format(
+            Miner.remarks.type.length))
+    return ip, model_id, remarks
+
+
+def upsert(rows):
+    """
+    Add the miners of `rows` and update the model and remarks of the
+    miners already in the table, in a single transaction. Invalid rows are
+    reported and skipped, the others are saved.
+
+    :return: one result per row: {'row', 'ip', 'status'} where status is
+             added, updated, unchanged, duplicate (a later row has the same
+             ip) or error (with an 'error' message)
+    """
+    results = []
+    valid = {}
+    for number, row in enumerate(rows, 1):
+        try:
+            ip, model_id, remarks = validate(row)
+        except ValueError as e:
+            ip = row.get('ip') if isinstance(row, dict) else None
+            results.append({
+                'row': number,
+                'ip': ip,
+                'status': 'error',
+                'error': str(e),
+            })
+            continue
+        result = {'row': number, 'ip': ip}
+        if ip in valid:
+            # the last row of an ip wins
+            valid[ip][1]['status'] = 'duplicate'
+        valid[ip] = ((model_id, remarks), result)
+        results.append(result)
+
+    try:
+        with transaction() as session:
+            existing = {}
+            for ips in _chunks(list(valid)):
+                for miner in Miner.query.filter(Miner.ip.in_(ips)):
+                    existing[miner.ip] = miner
+            added = []
+            for ip, ((model_id, remarks), result) in valid.items():
+                miner = existing.get(ip)
+                if miner is None:
+                    added.append(
+                        Miner(ip=ip, model_id=model_id, remarks=remarks))
+                    result['status'] = 'added'
+                elif (miner.model_id, miner.remarks or '') == (model_id,
+                                                                remarks):
+                    result['status'] = 'unchanged'
+                else:
+                    miner.model_id = model_id
+                    miner.remarks = remarks
+                    result['status'] = 'updated'
+            session.add_all(added)
+    finally:
+        db_session.remove()
+    return results
+
+
+def delete(ips):
+    """
+    Delete the miners of `ips` in a single transaction.
+
+    :return: one result per ip: {'ip', 'status'} where status is deleted,
+             missing or error (with an 'error' message)
+    """
+    results = []
+    # the valid ips, without duplicates, in their order
+    valid = {}
+    for ip in ips:
+        try:
+            valid[str(ipaddress.ip_address(str(ip).strip()))] = None
+        except ValueError as e:
+            results.append({'ip': ip, 'status': 'error', 'error': str(e)})
+
+    try:
+        with transaction():
+            existing = set()
+            for chunk in _chunks(list(valid)):
+                existing.update(
+                    ip for ip, in db_session.query(Miner.ip).filter(
+                        Miner.ip.in_(chunk)))
+                Miner.query.filter(Miner.ip.in_(chunk)).delete(
+                    synchronize_session=False)
+    finally:
+        db_session.remove()
+    results.extend({
+        'ip': ip,
+        'status': 'deleted' if ip in existing else 'missing'
+    } for ip in valid)
+    return results
+
+
+def export(format):
+    """
+    The `Miner` table sorted by ip, as a CSV file or a JSON list.
+    """
+    try:
+        rows = db_session.query(Miner.ip, Miner.model_id,
+                                Miner.remarks).all()
+    finally:
+        db_session.remove()
+    rows.sort(key=lambda row: (_ip(row.ip), row.ip))
+    if format == 'json':
+        return json.dumps([{
+            'ip': row.ip,
+            'model_id': row.model_id,
+            'remarks': row.remarks or '',
+        } for row in rows], indent=2)
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(COLUMNS)
+    for row in rows:
+        writer.writerow((row.ip, row.model_id, row.remarks or ''))
+    return output.getvalue()
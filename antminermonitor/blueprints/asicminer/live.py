@@ -0,0 +1,181 @@
+import json
+import threading
+from collections import deque
+
+from antminermonitor.blueprints.asicminer.dashboard import alert_panel
+
+# tolerance, in seconds, on the start time of a miner derived from its
+# uptime; a larger difference means the miner restarted
+RESTART_TOLERANCE = 60
+
+# the fields of a miner that the dashboard displays; the rows of the fleet
+# are kept as tuples of these fields, a fraction of the size of dicts
+FIELDS = ('id', 'active', 'worker', 'model_id', 'remarks', 'os', 'xs', 'dash',
+          'temperatures', 'fan_speeds', 'hash_rate', 'hw_error_rate',
+          'started', 'errors')
+ACTIVE = FIELDS.index('active')
+STARTED = FIELDS.index('started')
+
+
+def row(miner, timestamp):
+    """The fields of a miner that the dashboard displays, see `FIELDS`."""
+    chips = miner.chips
+    return (
+        miner.id,
+        not miner.is_inactive,
+        miner.worker,
+        miner.model_id,
+        miner.remarks,
+        chips.get('Os'),
+        chips.get('Xs'),
+        chips.get('-'),
+        miner.temperatures,
+        miner.fan_speeds,
+        miner.normalized_hash_rate,
+        miner.hw_error_rate,
+        # the uptime changes every cycle, its start does not: the browser
+        # derives the uptime from it
+        int((miner.polled_at or timestamp) - miner.elapsed)
+        if miner.elapsed else None,
+        miner.errors,
+    )
+
+
+def changes(old, new):
+    """The fields of the row `new` that differ from `old`, as a dict."""
+    changed = {}
+    for field, previous, value in zip(FIELDS, old, new):
+        if value != previous:
+            changed[field] = value
+    started, previous = new[STARTED], old[STARTED]
+    if started and previous and abs(started - previous) <= RESTART_TOLERANCE:
+        changed.pop('started', None)
+    return changed
+
+
+class LiveFeed:
+    """
+    Sequence of dashboard updates fed by the poll snapshots.
+
+    Every poll cycle gets a sequence number, the number of the cycle, and a
+    delta: the fleet summary plus the changed fields of the miners that
+    changed and the miners that were removed, and the alert panel when it
+    changed. The delta is encoded once, whatever the number of clients, and
+    the last `history` deltas are kept with the sequence number they apply
+    to, so a client that reconnects with its last sequence number catches up
+    with them, even on another process that shares the snapshots. A client
+    that is further behind gets the full state instead.
+    """
+
+    def __init__(self, app=None):
+        self.history = 20
+        self.max_alerts = 50
+        self.seq = 0
+        self._rows = {}
+        self._fleet = {}
+        self._deltas = deque(maxlen=self.history)
+        self._full = None
+        self._condition = threading.Condition()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.history = app.config.get('LIVE_HISTORY', self.history)
+        self.max_alerts = app.config.get('DASHBOARD_MAX_ALERTS',
+                                         self.max_alerts)
+        self._deltas = deque(self._deltas, maxlen=self.history)
+        app.extensions['live_feed'] = self
+
+    def update(self, snapshot):
+        """Poller listener: compute the delta of a new snapshot."""
+        timestamp = snapshot.timestamp
+        rows = {
+            miner.ip: row(miner, timestamp)
+            for miner in snapshot.miners
+        }
+        fleet = {
+            'cycle': snapshot.cycle,
+            'polled_at': snapshot.polled_at,
+            'duration': round(snapshot.duration, 2),
+            'active': len(snapshot.active_miners),
+            'inactive': len(snapshot.inactive_miners),
+            'hash_rates': snapshot.formatted_hash_rate_per_model,
+            'alerts': alert_panel(snapshot, self.max_alerts),
+        }
+        delta = fleet
+        if fleet['alerts'] == self._fleet.get('alerts'):
+            delta = dict(fleet)
+            del delta['alerts']
+
+        miners = {}
+        for ip, new in rows.items():
+            old = self._rows.get(ip)
+            if old is None or old[ACTIVE] != new[ACTIVE]:
+                # the row moves to the other table, send all of it
+                changed = dict(zip(FIELDS, new))
+            else:
+                changed = changes(old, new)
+                if 'started' not in changed:
+                    # keep the start time the browser already has
+                    new = new[:STARTED] + (old[STARTED], ) + \
+                        new[STARTED + 1:]
+                    rows[ip] = new
+            if changed:
+                miners[ip] = changed
+        removed = [ip for ip in self._rows if ip not in rows]
+
+        with self._condition:
+            base = self.seq
+            self.seq = max(base + 1, snapshot.cycle)
+            self._rows = rows
+            self._fleet = fleet
+            self._full = None
+            self._deltas.append((self.seq, base, json.dumps({
+                'seq': self.seq,
+                'fleet': delta,
+                'miners': miners,
+                'removed': removed,
+            })))
+            self._condition.notify_all()
+
+    def full(self):
+        """
+        :return: (seq, encoded full state), encoded once per sequence
+        """
+        with self._condition:
+            if self._full is None or self._full[0] != self.seq:
+                self._full = (self.seq, json.dumps({
+                    'seq': self.seq,
+                    'fleet': self._fleet,
+                    'miners': {
+                        ip: dict(zip(FIELDS, row))
+                        for ip, row in self._rows.items()
+                    },
+                    'removed': [],
+                }))
+            return self._full
+
+    def wait(self, since, timeout=15):
+        """
+        Block until there are updates newer than `since`.
+
+        :return: list of ('delta' or 'reset', seq, encoded update), empty if
+                 `timeout` expired first
+        """
+        with self._condition:
+            if since > self.seq:
+                # the client comes from before a restart of the server
+                since = 0
+            if self.seq <= since:
+                self._condition.wait(timeout)
+            if self.seq <= since:
+                return []
+            deltas = [delta for delta in self._deltas if delta[0] > since]
+            if not deltas or deltas[0][1] != since or since == 0:
+                # too far behind (or a new client): send everything
+                return [('reset', ) + self.full()]
+            return [('delta', seq, data) for seq, _, data in deltas]
+
+
+live_feed = LiveFeed()
@@ -1,2 +1,4 @@
 from .miner import Miner
 from .settings import Settings
+from .metric import Metric
+from .chain_event import ChainEvent
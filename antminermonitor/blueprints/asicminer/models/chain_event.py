@@ -0,0 +1,33 @@
+from sqlalchemy import Column, Float, Index, Integer, String
+from antminermonitor.database import Base
+
+
+class ChainEvent(Base):
+    """
+    A change of the chip map of one hashboard (chain) of a miner.
+
+    Only the changes are stored: a row is written when a chain is seen for
+    the first time, with `changes` empty, and then every time its chip map
+    changes, with the positions that flipped in `changes`, e.g. '12:o>x'.
+    `chips` is the chip map after the change, empty if the chain is no
+    longer reported.
+    """
+    __tablename__ = 'chain_event'
+    id = Column(Integer, primary_key=True)
+    ip = Column(String(15), nullable=False)
+    model_id = Column(String(64), nullable=False)
+    chain = Column(Integer, nullable=False)
+    timestamp = Column(Integer, nullable=False)
+    chips = Column(String(255), nullable=False, default='')
+    changes = Column(String(1024))
+    # the chain when the change was seen
+    rate = Column(Float)
+    hw_errors = Column(Float)
+    temp_max = Column(Float)
+
+    __table_args__ = (Index('ix_chain_event_ip_timestamp', 'ip',
+                            'timestamp'), )
+
+    def __repr__(self):
+        return "ChainEvent(ip='{}', chain={}, timestamp={})" \
+            .format(self.ip, self.chain, self.timestamp)
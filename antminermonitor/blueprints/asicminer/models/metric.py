@@ -0,0 +1,45 @@
+from sqlalchemy import Column, Float, Index, Integer, String
+from antminermonitor.database import Base
+
+
+class Metric(Base):
+    """
+    One time-series sample of a miner.
+
+    Raw poll samples are stored with `resolution` 0. Rollups of 1 minute,
+    1 hour and 1 day are stored in the same table with `resolution` set to
+    the bucket size in seconds, `timestamp` set to the start of the bucket
+    and `samples` set to the number of raw samples they aggregate.
+    """
+    __tablename__ = 'metric'
+    id = Column(Integer, primary_key=True)
+    ip = Column(String(15), nullable=False)
+    model_id = Column(String(64), nullable=False)
+    resolution = Column(Integer, nullable=False, default=0)
+    timestamp = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False, default=1)
+    # fraction of the samples the miner was reachable
+    online = Column(Float)
+    # in the hashrate unit of the model
+    hash_rate = Column(Float)
+    temp_max = Column(Float)
+    temp_avg = Column(Float)
+    fan_min = Column(Float)
+    fan_avg = Column(Float)
+    chips_ok = Column(Float)
+    chips_x = Column(Float)
+    chips_dash = Column(Float)
+    hw_error_rate = Column(Float)
+
+    __table_args__ = (
+        Index('ix_metric_resolution_ip_timestamp', 'resolution', 'ip',
+              'timestamp'),
+        Index('ix_metric_resolution_model_id_timestamp', 'resolution',
+              'model_id', 'timestamp'),
+        # rollups and pruning: a time range of a resolution, all miners
+        Index('ix_metric_resolution_timestamp', 'resolution', 'timestamp'),
+    )
+
+    def __repr__(self):
+        return "Metric(ip='{}', resolution={}, timestamp={})" \
+            .format(self.ip, self.resolution, self.timestamp)
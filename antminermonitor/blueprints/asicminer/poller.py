@@ -0,0 +1,510 @@
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+from datetime import datetime
+
+from antminermonitor.blueprints.asicminer.aggregation import (FleetStats,
+                                                               subnet)
+from antminermonitor.blueprints.asicminer.alerts import alert_engine
+from antminermonitor.blueprints.asicminer.health import HealthTracker
+from antminermonitor.blueprints.asicminer.models import Miner
+from antminermonitor.blueprints.asicminer.registry import registry
+from antminermonitor.blueprints.asicminer.scheduler import (PollScheduler,
+                                                            RateLimiter)
+from antminermonitor.database import db_session
+from config.settings import MODELS, NUM_THREADS
+from lib.pycgminer import DEFAULT_TIMEOUT
+from lib.util_hashrate import update_unit_and_value
+
+logger = logging.getLogger(__name__)
+
+
+class FleetSnapshot:
+    """
+    Immutable result of one poll cycle over the whole fleet.
+
+    Views only ever read from a snapshot, so rendering the dashboard never
+    talks to the miners directly.
+    """
+
+    def __init__(self, miners=None, timestamp=None, duration=0, cycle=0):
+        self.miners = miners or []
+        self.timestamp = timestamp
+        self.duration = duration
+        self.cycle = cycle
+        self.active_miners = []
+        self.inactive_miners = []
+        self.warnings = []
+        self.errors = []
+        # total 5s hashrate per model in the unit of the model
+        self.total_hash_rate_per_model = {
+            id: {"value": 0, "unit": model.get('unit')}
+            for id, model in MODELS.items()
+        }
+        self._stats = None
+
+        for miner in self.miners:
+            if miner.is_inactive:
+                self.inactive_miners.append(miner)
+            else:
+                self.active_miners.append(miner)
+                self.warnings.extend(miner.warnings)
+                self.errors.extend(miner.errors)
+                self.total_hash_rate_per_model[
+                    miner.model_id]["value"] += miner.hash_rate_ghs5s
+
+    @property
+    def formatted_hash_rate_per_model(self):
+        """Non-zero total hash rates per model, e.g. '13.51 TH/s'."""
+        formatted = {}
+        for key, total in self.total_hash_rate_per_model.items():
+            value, unit = update_unit_and_value(total["value"], total["unit"])
+            if value > 0:
+                formatted[key] = f"{value:3.2f} {unit}"
+        return formatted
+
+    @property
+    def stats(self):
+        """
+        Per-model, per-subnet and per-worker `FleetStats`, computed on first
+        use and kept with the snapshot.
+        """
+        if self._stats is None:
+            self._stats = FleetStats(self.miners)
+        return self._stats
+
+    @property
+    def polled_at(self):
+        if self.timestamp is None:
+            return ""
+        return datetime.fromtimestamp(self.timestamp).strftime(
+            '%Y-%m-%d %H:%M:%S')
+
+
+class Poller:
+    """
+    Background service that polls the miners and keeps the latest
+    `FleetSnapshot` of the whole fleet in memory.
+
+    Every `tick` seconds it polls the miners the `PollScheduler` says are
+    due, each on the interval of its priority, and the snapshot keeps the
+    last poll of the others. The polls are paced by `limiter` to the RPC
+    budget of the fleet and at most `subnet_concurrency` miners of a /24
+    subnet are polled at the same time.
+
+    The polling thread is started lazily on the first call to `snapshot()`
+    so that CLI commands (create-db, create-admin, ...) never spawn it. With
+    `enabled` set to False the thread never starts and snapshots are only
+    provided with `publish()`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.interval = 30
+        self.first_poll_timeout = 30
+        self.use_asyncio = True
+        self.max_concurrency = 256
+        # max miners of a /24 subnet polled at the same time, 0 for no limit
+        self.subnet_concurrency = 32
+        # seconds between two looks at the due miners
+        self.tick = 5
+        self.scheduler = PollScheduler()
+        # max RPC batches (one poll of a miner) started per second
+        self.limiter = RateLimiter()
+        self.timeouts = DEFAULT_TIMEOUT
+        self.health = HealthTracker()
+        # the `Shard` of the `Miner` table polled by an agent, see cluster.py
+        self.shard = None
+        # the `SharedSnapshot` of the processes of the app, see shared.py
+        self.shared = None
+        self._snapshot = FleetSnapshot()
+        self._cycle = 0
+        # the `Miner` rows and when they were loaded
+        self._rows = None
+        self._rows_loaded = 0
+        # ip => the last polled miner object
+        self._objects = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._executor = None
+        self._listeners = []
+        self._local_listeners = []
+        self._ready = threading.Event()
+        self._wakeup = threading.Event()
+        # what the next wake up is for, see `refresh()` and `reload()`
+        self._refresh = False
+        self._reload = False
+        self._stopped = threading.Event()
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('POLLER_ENABLED', self.enabled)
+        self.interval = app.config.get('POLL_INTERVAL', self.interval)
+        self.first_poll_timeout = app.config.get('POLL_FIRST_TIMEOUT',
+                                                 self.first_poll_timeout)
+        self.use_asyncio = app.config.get('POLL_ASYNC', self.use_asyncio)
+        self.max_concurrency = app.config.get('POLL_MAX_CONCURRENCY',
+                                              self.max_concurrency)
+        self.subnet_concurrency = app.config.get('POLL_SUBNET_CONCURRENCY',
+                                                 self.subnet_concurrency)
+        self.tick = app.config.get('POLL_TICK', self.tick)
+        self.limiter.rate = app.config.get('POLL_MAX_RPS', self.limiter.rate)
+        scheduler = self.scheduler
+        scheduler.intervals.update({
+            'low': app.config.get('POLL_INTERVAL_LOW',
+                                  scheduler.intervals['low']),
+            'normal': self.interval,
+            'high': app.config.get('POLL_INTERVAL_HIGH',
+                                   scheduler.intervals['high']),
+        })
+        scheduler.model_priorities.update(
+            app.config.get('POLL_PRIORITIES', {}))
+        self.timeouts = app.config.get('CGMINER_TIMEOUTS', self.timeouts)
+        health = self.health
+        health.threshold = app.config.get('POLL_BREAKER_THRESHOLD',
+                                          health.threshold)
+        health.base_backoff = app.config.get('POLL_BACKOFF',
+                                             health.base_backoff)
+        health.max_backoff = app.config.get('POLL_MAX_BACKOFF',
+                                            health.max_backoff)
+        health.min_timeout = app.config.get('POLL_MIN_TIMEOUT',
+                                            health.min_timeout)
+        app.extensions['poller'] = self
+
+    def subscribe(self, listener, every_process=False):
+        """
+        Call `listener(snapshot)` from the polling thread after every cycle.
+
+        With a shared snapshot only the process that polls calls the
+        listeners, unless `every_process` is True, e.g. for listeners that
+        keep some state of each process up to date.
+        """
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+        if every_process and listener not in self._local_listeners:
+            self._local_listeners.append(listener)
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self.run,
+                                            name='antminer-poller',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+
+    def refresh(self):
+        """Wake up the polling thread and poll every miner right away."""
+        self.start()
+        with self._lock:
+            self._refresh = True
+        if self.shared is not None and not self.shared.leader:
+            self.shared.request_refresh()
+        self._wakeup.set()
+
+    def reload(self):
+        """
+        Wake up the polling thread to load the `Miner` table again after a
+        change: the new miners are polled right away, the removed ones leave
+        the snapshot and the others keep their schedule.
+        """
+        if not self.enabled:
+            # e.g. the aggregator, its agents load the table themselves
+            return
+        self.start()
+        with self._lock:
+            self._reload = True
+        if self.shared is not None and not self.shared.leader:
+            self.shared.request_refresh('reload')
+        self._wakeup.set()
+
+    def snapshot(self):
+        """
+        Return the latest fleet snapshot.
+
+        Only the very first call blocks, until the first cycle completes or
+        `first_poll_timeout` expires.
+        """
+        if self.enabled:
+            self.start()
+            self._ready.wait(self.first_poll_timeout)
+        return self._snapshot
+
+    def publish(self, snapshot, polled=True):
+        """
+        Make `snapshot` the latest one and pass it to the listeners.
+
+        :param polled: False if another process polled the snapshot
+        """
+        self._snapshot = snapshot
+        self._ready.set()
+
+        listeners = self._listeners if polled else self._local_listeners
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                logger.exception("Poll listener %r failed", listener)
+
+    def poll_fleet(self, miners=None):
+        """
+        Poll every miner of the `Miner` table (or of `miners`) once and
+        return a new `FleetSnapshot`.
+        """
+        start = time.perf_counter()
+        if miners is None:
+            miners = self._load_miners()
+        miner_objects = [self._miner_object(miner) for miner in miners]
+        return self._poll(miner_objects, miner_objects, start)
+
+    def poll_due(self, refresh=False, reload=False):
+        """
+        Poll the miners that are due, or every miner with `refresh`, and
+        return a new `FleetSnapshot` of the whole fleet: the miners that
+        were not due keep their last poll. A miner shows up once it was
+        polled. The `Miner` table is loaded again every `interval`, or with
+        `refresh` or `reload`.
+        """
+        start = time.perf_counter()
+        now = time.time()
+        # the `Miner` table only changes from the views, which reload
+        if refresh or reload or self._rows is None or \
+                now - self._rows_loaded >= self.interval:
+            self._rows = self._load_miners()
+            self._rows_loaded = now
+        scheduler = self.scheduler
+        scheduler.sync((row.ip for row in self._rows), now)
+        limit = None
+        if refresh:
+            scheduler.expedite(now)
+        elif self.limiter.rate:
+            # no more polls than the RPC budget until the next tick
+            limit = max(1, int(self.limiter.rate * self.tick))
+        due = set(scheduler.due(now, limit))
+
+        objects = self._objects
+        miner_objects = []
+        polled = []
+        for row in self._rows:
+            if row.ip in due:
+                obj = self._miner_object(row)
+                polled.append(obj)
+            else:
+                obj = objects.get(row.ip)
+                if obj is None:
+                    continue
+            miner_objects.append(obj)
+
+        snapshot = self._poll(miner_objects, polled, start)
+        self._objects = {obj.ip: obj for obj in miner_objects}
+        # after the alerts, the warnings of a miner raise its priority
+        for obj in polled:
+            scheduler.schedule(obj, now)
+        return snapshot
+
+    def _load_miners(self):
+        try:
+            miners = Miner.query.all()
+        finally:
+            # the polling thread has its own scoped session
+            db_session.remove()
+        if self.shard is not None:
+            miners = [m for m in miners if self.shard.contains(m)]
+        return miners
+
+    def _poll(self, miner_objects, polled, start):
+        """
+        Poll the `polled` miners of `miner_objects`, check the alerts and
+        return the `FleetSnapshot` of `miner_objects`.
+        """
+        self.health.forget(obj.ip for obj in miner_objects)
+
+        # miners whose circuit is open are reported inactive without an RPC
+        now = time.time()
+        probes = []
+        for obj in polled:
+            obj.polled_at = now
+            if self.health.should_poll(obj.ip, now):
+                probes.append(obj)
+            else:
+                self._skip(obj)
+
+        if self.use_asyncio:
+            asyncio.run(self._poll_async(probes))
+        else:
+            self._poll_threaded(probes)
+
+        for obj in probes:
+            if obj.is_inactive:
+                self.health.failure(obj.ip, now)
+            else:
+                self.health.success(obj.ip, obj.poll_latency)
+
+        alert_engine.evaluate(miner_objects, now, polled=polled)
+
+        self._cycle += 1
+        return FleetSnapshot(miners=miner_objects,
+                             timestamp=time.time(),
+                             duration=time.perf_counter() - start,
+                             cycle=self._cycle)
+
+    def _poll_threaded(self, miner_objects):
+        subnets = {}
+        if self.subnet_concurrency:
+            for obj in miner_objects:
+                if subnet(obj.ip) not in subnets:
+                    subnets[subnet(obj.ip)] = threading.BoundedSemaphore(
+                        self.subnet_concurrency)
+
+        def poll(obj):
+            semaphore = subnets.get(subnet(obj.ip))
+            if semaphore is not None:
+                semaphore.acquire()
+            try:
+                self.limiter.wait()
+                start = time.perf_counter()
+                try:
+                    obj.poll(
+                        timeout=self.health.timeout(obj.ip, self.timeouts))
+                except Exception as e:
+                    self._poll_failed(obj, e)
+                obj.poll_latency = time.perf_counter() - start
+            finally:
+                if semaphore is not None:
+                    semaphore.release()
+            return obj
+
+        if self._executor is None:
+            self._executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=NUM_THREADS)
+        return list(self._executor.map(poll, miner_objects))
+
+    async def _poll_async(self, miner_objects):
+        # at most `max_concurrency` miners are polled at any time, and at
+        # most `subnet_concurrency` of a subnet, whose slot is taken first so
+        # that a busy subnet does not hold the slots of the others; the
+        # latency is measured once the miner got its slots, so it is the
+        # round-trip time the adaptive timeouts are derived from
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        subnets = {}
+        if self.subnet_concurrency:
+            for obj in miner_objects:
+                if subnet(obj.ip) not in subnets:
+                    subnets[subnet(obj.ip)] = asyncio.Semaphore(
+                        self.subnet_concurrency)
+
+        async def poll_one(obj):
+            async with semaphore:
+                await self.limiter.async_wait()
+                start = time.perf_counter()
+                try:
+                    await obj.async_poll(timeout=self.health.timeout(
+                        obj.ip, self.timeouts))
+                except Exception as e:
+                    self._poll_failed(obj, e)
+                obj.poll_latency = time.perf_counter() - start
+
+        async def poll(obj):
+            subnet_semaphore = subnets.get(subnet(obj.ip))
+            if subnet_semaphore is None:
+                await poll_one(obj)
+            else:
+                async with subnet_semaphore:
+                    await poll_one(obj)
+            return obj
+
+        return await asyncio.gather(*[poll(obj) for obj in miner_objects])
+
+    def _skip(self, obj):
+        health = self.health.get(obj.ip)
+        obj.is_inactive = True
+        obj.errors.append(
+            "Unreachable after {} attempts, next attempt at {}".format(
+                health.failures,
+                datetime.fromtimestamp(health.retry_at).strftime('%H:%M:%S')))
+
+    def _poll_failed(self, obj, e):
+        logger.exception("Error polling miner %s", obj.ip)
+        obj.is_inactive = True
+        obj.errors.append("{}".format(e))
+
+    def _miner_object(self, miner):
+        return registry.miner_class(miner.model_id)(miner)
+
+    def run(self):
+        """Poll the due miners every `tick` seconds until `stop()`."""
+        shared = self.shared
+        refresh, reload = True, False
+        while not self._stopped.is_set():
+            if shared is not None and not shared.elect():
+                self._follow()
+                # poll everything if this process takes over
+                refresh = True
+                continue
+            try:
+                snapshot = self.poll_due(refresh, reload)
+                self.publish(snapshot)
+                if shared is not None:
+                    shared.write(snapshot)
+            except Exception:
+                logger.exception("Poll cycle failed")
+                # do not keep the first request waiting
+                self._ready.set()
+
+            # until the next miner is due, but no sooner than the next tick
+            next_due = self.scheduler.next_due()
+            delay = self.interval if next_due is None else \
+                next_due - time.time()
+            refresh, reload = self._sleep(max(delay, self.tick))
+
+    def _follow(self):
+        """Pick up the latest snapshot of the process that polls."""
+        try:
+            snapshot = self.shared.read()
+        except Exception:
+            logger.exception("Could not read the shared snapshot")
+            snapshot = None
+        if snapshot is not None:
+            # carry on with the cycle numbers if this process takes over
+            self._cycle = snapshot.cycle
+            self.publish(snapshot, polled=False)
+        self._sleep(self.shared.check_interval)
+
+    def _sleep(self, seconds):
+        """
+        Wait `seconds`, or less if `refresh()` or `reload()` was called in
+        this process or, for the process that polls, in another one.
+
+        :return: (refresh, reload), True if it was called
+        """
+        shared = self.shared
+        deadline = time.monotonic() + seconds
+        refresh = reload = False
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if shared is not None and shared.leader:
+                refresh = shared.refresh_requested() or refresh
+                reload = shared.refresh_requested('reload') or reload
+                if refresh or reload:
+                    break
+                remaining = min(remaining, shared.check_interval)
+            if self._wakeup.wait(remaining):
+                break
+        self._wakeup.clear()
+        with self._lock:
+            refresh, self._refresh = refresh or self._refresh, False
+            reload, self._reload = reload or self._reload, False
+        return refresh, reload
+
+poller = Poller()
@@ -0,0 +1,177 @@
+import importlib
+import re
+import sys
+from collections import namedtuple
+
+from config.settings import MODELS
+
+# max number of firmware layouts cached per model
+MAX_LAYOUTS = 16
+
+FAN_PATTERN = re.compile("fan" + '[0-9]')
+# temperatures of a chain, e.g. temp6 (PCB) and temp2_6 (chips) of chain 6
+CHAIN_TEMP_PATTERN = re.compile(r'^temp(?:[0-9]+_)?([0-9]+)$')
+
+# One hashboard of a miner: its index in the `stats` keys (e.g. 6 for
+# chain_acs6), its chip map without spaces ('o' ok, 'x' defective, '-'
+# inactive), its hash rate, HW errors, temperatures and the index of the
+# sensor of each temperature (the sensors reading 0 are left out). A tuple,
+# so that it is small and goes through JSON as a list.
+Chain = namedtuple('Chain',
+                   'index chips rate hw_errors temperatures temperature_ids',
+                   defaults=((), ))
+
+
+def _number(value, type=float):
+    """A number of a `stats` value, e.g. '4501.23', None if it is not one."""
+    try:
+        return type(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _readings(stats, keys, ids, type=None):
+    """
+    The non-zero values of `keys` and their ids, `ids` (all the ids) when
+    none is 0.
+    """
+    values = [stats[key] for key in keys]
+    if 0 not in values:
+        return [type(v) for v in values] if type else values, ids
+    readings = [(i, v) for i, v in zip(ids, values) if v != 0]
+    return ([type(v) if type else v for _, v in readings],
+            tuple(i for i, _ in readings))
+
+
+class StatsLayout:
+    """
+    The keys of a `stats` response that hold the chips, temperatures and
+    fan speeds. Resolved once per firmware layout, i.e. per set of keys.
+    """
+    __slots__ = ('chain_keys', 'temp_keys', 'fan_keys', 'chains', 'temp_ids',
+                 'fan_ids')
+
+    def __init__(self, keys, temp_pattern):
+        self.chain_keys = [key for key in keys if "chain_acs" in key]
+        # the keys are sorted as strings, e.g. temp2_10 before temp2_6
+        keys = sorted(keys, key=str)
+        self.temp_keys = [key for key in keys if temp_pattern.search(key)]
+        self.fan_keys = [key for key in keys if FAN_PATTERN.search(key)]
+        # the ids of the sensors and fans when none of them reads 0, shared
+        self.temp_ids = tuple(range(len(self.temp_keys)))
+        self.fan_ids = tuple(range(len(self.fan_keys)))
+
+        # (index, rate key, hw key, temperature keys, their ids) per chain key
+        chain_temps = {}
+        for key in keys:
+            match = CHAIN_TEMP_PATTERN.match(str(key))
+            if match:
+                chain_temps.setdefault(match.group(1), []).append(key)
+        keys = set(keys)
+        self.chains = []
+        for key in self.chain_keys:
+            index = key[len("chain_acs"):]
+            rate_key = "chain_rate" + index
+            hw_key = "chain_hw" + index
+            temp_keys = chain_temps.get(index, [])
+            self.chains.append(
+                (int(index) if index.isdigit() else None,
+                 rate_key if rate_key in keys else None,
+                 hw_key if hw_key in keys else None,
+                 temp_keys, tuple(range(len(temp_keys)))))
+
+
+class ParsePlan:
+    """
+    Everything `ASIC_ANTMINER.update` needs to know about a model to parse
+    a `stats` response, compiled once per model.
+    """
+
+    def __init__(self, model):
+        self.model_id = model['id']
+        self.unit = model['unit']
+        # convert the comma separated chips of the model to ints and sum
+        self.chips = [int(y) for y in str(model['chips']).split(',')]
+        self.total_chips = sum(self.chips)
+        self.temp_pattern = re.compile(re.escape(model['temp_keys']) + '[0-9]')
+        self._layouts = {}
+
+    def layout(self, stats):
+        """Return the (cached) `StatsLayout` of a `stats` response."""
+        keys = tuple(stats)
+        layout = self._layouts.get(keys)
+        if layout is None:
+            layout = StatsLayout(keys, self.temp_pattern)
+            if len(self._layouts) >= MAX_LAYOUTS:
+                self._layouts.clear()
+            self._layouts[keys] = layout
+        return layout
+
+    def parse(self, stats):
+        """
+        Extract the chip counts, temperatures and fan speeds of the second
+        section of a `stats` response. The sensors and fans reading 0 are
+        left out, their ids are the index of the others among all of them.
+
+        :return: (chips, temperatures, fan_speeds, chains, temperature_ids,
+                 fan_ids) where chips is a dict with the number of 'o', 'x',
+                 'B', 'C' and '-' chips and chains a tuple of `Chain`
+        """
+        layout = self.layout(stats)
+
+        # count the chips of all the chains at once
+        maps = [str(stats[key]) for key in layout.chain_keys]
+        acs = ''.join(maps)
+        chips = {c: acs.count(c) for c in 'oxBC-'}
+
+        temperatures, temp_ids = _readings(stats, layout.temp_keys,
+                                           layout.temp_ids, int)
+        fan_speeds, fan_ids = _readings(stats, layout.fan_keys,
+                                        layout.fan_ids)
+        chains = []
+        for (index, rate_key, hw_key, temp_keys, ids), chain_map in zip(
+                layout.chains, maps):
+            # bmminer reports 16 chains, the missing boards without chips
+            if not chain_map or index is None:
+                continue
+            chain_temperatures, chain_ids = _readings(stats, temp_keys, ids,
+                                                      int)
+            # interned: most boards of a fleet have the same map, all 'o'
+            chains.append(
+                Chain(index, sys.intern(chain_map.replace(' ', '')),
+                      _number(stats[rate_key]) if rate_key else None,
+                      _number(stats[hw_key], int) if hw_key else None,
+                      tuple(chain_temperatures), chain_ids))
+        return (chips, temperatures, fan_speeds, tuple(chains), temp_ids,
+                fan_ids)
+
+
+class ModelRegistry:
+    """
+    The parse plan and the miner class of every model of
+    `config/models.json`, both resolved on first use and cached.
+    """
+
+    def __init__(self, models):
+        self.models = models
+        self.plans = {}
+        self._classes = {}
+
+    def plan(self, model_id):
+        plan = self.plans.get(model_id)
+        if plan is None:
+            plan = self.plans[model_id] = ParsePlan(self.models[model_id])
+        return plan
+
+    def miner_class(self, model_id):
+        """The class that polls the miners of a model, e.g. `ASIC_ANTMINER`."""
+        cls = self._classes.get(model_id)
+        if cls is None:
+            model = self.models[model_id]
+            module = importlib.import_module(model['model_module'])
+            cls = self._classes[model_id] = getattr(module,
+                                                    model['model_classname'])
+        return cls
+
+
+registry = ModelRegistry(MODELS)
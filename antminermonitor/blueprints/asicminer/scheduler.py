@@ -0,0 +1,176 @@
+import asyncio
+import heapq
+import random
+import re
+import threading
+import time
+
+# from the least to the most urgent
+PRIORITIES = ('low', 'normal', 'high')
+# user-set priority of a miner, in its remarks, e.g. 'rack 3 priority:high'
+PRIORITY_TAG = re.compile(r'\bpriority:(low|normal|high)\b', re.IGNORECASE)
+
+
+class PollScheduler:
+    """
+    When to poll each miner: a heap of (next poll time, ip) per priority.
+
+    After every poll a miner is scheduled again after the interval of its
+    priority, which is its user-set priority, a 'priority:<level>' tag in
+    its remarks, else the priority of its model (see `model_priorities`),
+    raised to 'high' by its health: a miner with warnings or errors (hot,
+    defective chips, hash rate drop, ...) or that rebooted in the last
+    `reboot_window` seconds. Healthy miners are polled less often than the
+    ones that need attention.
+
+    The due miners are taken the latest relative to their interval first, so
+    when they are more than the polls budget of a tick every priority is
+    slowed down in proportion to its interval instead of the miners that
+    need attention waiting behind the others. The next poll time is brought
+    forward by up to `jitter` of the interval so that the miners polled
+    together drift apart.
+    """
+
+    def __init__(self, intervals=None, model_priorities=None,
+                 reboot_window=3600, jitter=0.1):
+        # seconds between two polls of a miner, per priority
+        self.intervals = dict(intervals or {
+            'low': 120,
+            'normal': 30,
+            'high': 10
+        })
+        self.model_priorities = dict(model_priorities or {})
+        self.reboot_window = reboot_window
+        self.jitter = jitter
+        self._heaps = {priority: [] for priority in PRIORITIES}
+        # ip => (next poll time, priority) of its entry in the heaps; the
+        # entries of the heaps that do not match are stale and skipped
+        self._due = {}
+
+    def sync(self, ips, now):
+        """
+        Follow the miners of the fleet: new miners are due `now`, removed
+        miners are dropped. A miner taken by `due()` but never scheduled
+        again, e.g. after a failed cycle, is also due `now`.
+        """
+        ips = set(ips)
+        for ip in ips:
+            if ip not in self._due:
+                # first in line until its priority is known
+                self._push(ip, now, 'high')
+        for ip in [ip for ip in self._due if ip not in ips]:
+            del self._due[ip]
+        # do not let the stale entries pile up
+        if sum(map(len, self._heaps.values())) > 2 * len(self._due) + 64:
+            self._rebuild()
+
+    def expedite(self, now):
+        """Make every miner due `now`, e.g. to refresh the whole fleet."""
+        self._due = {
+            ip: (now, priority)
+            for ip, (_, priority) in self._due.items()
+        }
+        self._rebuild()
+
+    def due(self, now, limit=None):
+        """
+        Take the miners due at `now`, the latest relative to their interval
+        first, at most `limit` of them. They are due again once polled and
+        `schedule`d.
+        """
+        heads = [(priority, heap, self.intervals[priority])
+                 for priority, heap in self._heaps.items()]
+        ips = []
+        while limit is None or len(ips) < limit:
+            latest = None
+            lateness = -1
+            for priority, heap, interval in heads:
+                self._drop_stale(priority, heap)
+                if heap and heap[0][0] <= now and \
+                        (now - heap[0][0]) / interval > lateness:
+                    lateness = (now - heap[0][0]) / interval
+                    latest = heap
+            if latest is None:
+                break
+            _, ip = heapq.heappop(latest)
+            del self._due[ip]
+            ips.append(ip)
+        return ips
+
+    def next_due(self):
+        """The time of the next poll, None without miners."""
+        times = []
+        for priority, heap in self._heaps.items():
+            self._drop_stale(priority, heap)
+            if heap:
+                times.append(heap[0][0])
+        return min(times, default=None)
+
+    def priority(self, miner):
+        """The priority of a polled miner."""
+        match = PRIORITY_TAG.search(miner.remarks or '')
+        if match:
+            priority = match.group(1).lower()
+        else:
+            priority = self.model_priorities.get(miner.model_id, 'normal')
+        if not miner.is_inactive and (
+                miner.warnings or miner.errors or
+                miner.chips.get('Xs') or
+                0 < miner.elapsed < self.reboot_window):
+            return 'high'
+        return priority
+
+    def schedule(self, miner, now):
+        """Schedule the next poll of a miner that was just polled."""
+        priority = self.priority(miner)
+        interval = self.intervals[priority]
+        interval *= 1 - self.jitter * random.random()
+        self._push(miner.ip, now + interval, priority)
+
+    def _push(self, ip, due, priority):
+        self._due[ip] = (due, priority)
+        heapq.heappush(self._heaps[priority], (due, ip))
+
+    def _drop_stale(self, priority, heap):
+        while heap and self._due.get(heap[0][1]) != (heap[0][0], priority):
+            heapq.heappop(heap)
+
+    def _rebuild(self):
+        self._heaps = {priority: [] for priority in PRIORITIES}
+        for ip, (due, priority) in self._due.items():
+            self._heaps[priority].append((due, ip))
+        for heap in self._heaps.values():
+            heapq.heapify(heap)
+
+
+class RateLimiter:
+    """
+    Space out the start of the RPCs to at most `rate` per second, across
+    the threads or tasks that poll and across the poll cycles. A rate of 0
+    does not limit.
+    """
+
+    def __init__(self, rate=0):
+        self.rate = rate
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """Reserve the next slot, return the seconds to wait for it."""
+        if not self.rate:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + 1.0 / self.rate
+            return start - now
+
+    def wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def async_wait(self):
+        delay = self.reserve()
+        if delay > 0:
+            await asyncio.sleep(delay)
@@ -0,0 +1,130 @@
+import json
+import logging
+import os
+
+try:
+    import fcntl
+except ImportError:  # Windows: every process polls on its own
+    fcntl = None
+
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+from antminermonitor.blueprints.asicminer.cluster import decode, encode
+from antminermonitor.blueprints.asicminer.poller import poller
+
+logger = logging.getLogger(__name__)
+
+
+class SharedSnapshot:
+    """
+    Share the latest snapshot between the processes of the app, e.g. the
+    gunicorn workers, so the fleet is polled once whatever their number.
+
+    The processes elect the one that polls with an exclusive `flock` on
+    `<path>.lock`. The leader writes every snapshot to `path`, through a
+    temporary file that is renamed so a reader never sees half a snapshot,
+    and only when a miner was polled since the previous one.
+    The other processes read the file only when it was replaced, once per
+    poll cycle, and serve all their requests from that snapshot. The kernel
+    releases the lock of a leader that exits, and the next process that
+    checks the file takes over.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.path = None
+        self.check_interval = 1
+        self._lock_file = None
+        self._stat = None
+        # (ip, poll time) of the miners of the last snapshot written
+        self._written = None
+        # kind of request => time of the last one seen
+        self._requests = {}
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('SHARED_SNAPSHOT', self.enabled)
+        self.path = app.config.get('SHARED_SNAPSHOT_PATH', self.path)
+        self.check_interval = app.config.get('SHARED_SNAPSHOT_CHECK_INTERVAL',
+                                             self.check_interval)
+        app.extensions['shared_snapshot'] = self
+        if self.enabled and self.path:
+            poller.shared = self
+
+    @property
+    def leader(self):
+        return self._lock_file is not None
+
+    def elect(self):
+        """
+        Try to become the process that polls.
+
+        :return: True if this process is the leader
+        """
+        if self._lock_file is not None or fcntl is None:
+            return True
+        lock_file = open(self.path + '.lock', 'a')
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        logger.info("Process %d polls the fleet", os.getpid())
+        self._lock_file = lock_file
+        return True
+
+    def write(self, snapshot):
+        """Write `snapshot` unless it has the same polls as the last one."""
+        written = [(miner.ip, miner.polled_at) for miner in snapshot.miners]
+        if written == self._written:
+            return
+        data = json.dumps(encode(snapshot, os.getpid())).encode()
+        temporary = '{}.{}'.format(self.path, os.getpid())
+        with open(temporary, 'wb') as f:
+            f.write(data)
+        os.replace(temporary, self.path)
+        self._written = written
+
+    def read(self):
+        """
+        :return: the snapshot written since the last call, or None
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if key == self._stat:
+            return None
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        self._stat = key
+        return decode(loads(data))
+
+    def request_refresh(self, kind='refresh'):
+        """
+        Ask the leader to start a new poll cycle right away, that polls
+        every miner ('refresh') or loads the `Miner` table again ('reload').
+        """
+        path = '{}.{}'.format(self.path, kind)
+        with open(path, 'a'):
+            os.utime(path)
+
+    def refresh_requested(self, kind='refresh'):
+        try:
+            requested = os.stat('{}.{}'.format(self.path, kind)).st_mtime_ns
+        except FileNotFoundError:
+            # never requested
+            requested = 0
+        last = self._requests.get(kind)
+        self._requests[kind] = requested
+        # not the requests made before this process became the leader
+        return last is not None and requested != last
+
+
+shared_snapshot = SharedSnapshot()
@@ -0,0 +1,348 @@
+import logging
+import threading
+import time
+
+from sqlalchemy import case, func, inspect
+
+from antminermonitor.blueprints.asicminer.models import Metric
+from antminermonitor.database import db_session, engine
+
+logger = logging.getLogger(__name__)
+
+# resolution (seconds) => source resolution of its rollups
+ROLLUPS = ((60, 0), (3600, 60), (86400, 3600))
+
+# how a metric is aggregated by a rollup; the rest are averaged
+AGGREGATES = {
+    'temp_max': 'max',
+    'fan_min': 'min',
+    'chips_ok': 'min',
+    'chips_x': 'max',
+    'chips_dash': 'max',
+}
+
+METRICS = ('online', 'hash_rate', 'temp_max', 'temp_avg', 'fan_min',
+           'fan_avg', 'chips_ok', 'chips_x', 'chips_dash', 'hw_error_rate')
+
+
+def sample(miner, timestamp):
+    """Convert a polled miner into a raw `Metric` row (as a dict)."""
+    row = dict.fromkeys(METRICS)
+    row.update({
+        'ip': miner.ip,
+        'model_id': miner.model_id,
+        'resolution': 0,
+        'timestamp': int(timestamp),
+        'samples': 1,
+        'online': 0.0 if miner.is_inactive else 1.0,
+    })
+    if miner.is_inactive:
+        return row
+
+    row['hash_rate'] = float(miner.hash_rate_ghs5s)
+    if miner.temperatures:
+        row['temp_max'] = max(miner.temperatures)
+        row['temp_avg'] = sum(miner.temperatures) / len(miner.temperatures)
+    if miner.fan_speeds:
+        row['fan_min'] = min(miner.fan_speeds)
+        row['fan_avg'] = sum(miner.fan_speeds) / len(miner.fan_speeds)
+    row['chips_ok'] = miner.chips.get('Os')
+    row['chips_x'] = miner.chips.get('Xs')
+    row['chips_dash'] = miner.chips.get('-')
+    try:
+        row['hw_error_rate'] = float(miner.hw_error_rate)
+    except (TypeError, ValueError):
+        pass
+    return row
+
+
+class TimeSeriesStore:
+    """
+    Persist the poll samples and keep the storage bounded.
+
+    A miner is sampled when it was polled, at most once every
+    `sample_interval` seconds whatever the interval of its priority (see
+    scheduler.py). Samples are buffered in memory and written in one
+    transaction every `flush_interval` seconds by a background thread, never
+    by the poller or the request that brought them. Every flush also rolls
+    the complete buckets up into 1 minute, 1 hour and 1 day resolutions,
+    again from the oldest sample written (an agent replays its snapshots
+    late), and deletes the rows older than the retention of their
+    resolution.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.flush_interval = 60
+        self.sample_interval = 30
+        # seconds a sample still stands for its miner in the per model sums,
+        # the miners of low priority are sampled the least often
+        self.fill_interval = 2 * 120
+        # seconds to keep the rows of each resolution
+        self.retention = {
+            0: 86400,
+            60: 7 * 86400,
+            3600: 90 * 86400,
+            86400: 5 * 365 * 86400,
+        }
+        self._buffer = []
+        # ip => poll time of its last sample
+        self._sampled = {}
+        self._table_checked = False
+        self._lock = threading.Lock()
+        self._thread = None
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('METRICS_ENABLED', self.enabled)
+        self.flush_interval = app.config.get('METRICS_FLUSH_INTERVAL',
+                                             self.flush_interval)
+        self.sample_interval = app.config.get('POLL_INTERVAL',
+                                              self.sample_interval)
+        self.fill_interval = 2 * max(
+            self.sample_interval,
+            app.config.get('POLL_INTERVAL_LOW', self.fill_interval // 2))
+        self.retention.update(app.config.get('METRICS_RETENTION', {}))
+        app.extensions['timeseries'] = self
+
+    def record(self, snapshot):
+        """Buffer the samples of a `FleetSnapshot`."""
+        if not self.enabled:
+            return
+        # the polls are scheduled up to 10% early
+        min_interval = 0.9 * self.sample_interval
+        with self._lock:
+            sampled = self._sampled
+            for miner in snapshot.miners:
+                # snapshots of agents of older versions have no poll times
+                polled_at = miner.polled_at or snapshot.timestamp
+                last = sampled.get(miner.ip)
+                if last is not None and polled_at - last < min_interval:
+                    continue
+                sampled[miner.ip] = polled_at
+                self._buffer.append(sample(miner, polled_at))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run,
+                                                name='antminer-timeseries',
+                                                daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self, now=None):
+        now = int(now or time.time())
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+            # forget the removed miners
+            self._sampled = {
+                ip: polled_at
+                for ip, polled_at in self._sampled.items()
+                if now - polled_at < self.retention[0]
+            }
+        try:
+            self._ensure_table()
+            since = None
+            if rows:
+                db_session.bulk_insert_mappings(Metric, rows)
+                since = min(row['timestamp'] for row in rows)
+            self.rollup(now, since)
+            self.prune(now)
+            db_session.commit()
+        except Exception:
+            db_session.rollback()
+            logger.exception("Could not write %d metric samples", len(rows))
+        finally:
+            db_session.remove()
+
+    def rollup(self, now, since=None):
+        """
+        Aggregate every complete bucket that was not rolled up yet, and again
+        the ones from `since` on, that got samples since they were.
+        """
+        for resolution, source in ROLLUPS:
+            end = now - now % resolution
+            last = db_session.query(func.max(Metric.timestamp)) \
+                .filter(Metric.resolution == resolution).scalar()
+            if last is not None:
+                start = last + resolution
+            else:
+                start = db_session.query(func.min(Metric.timestamp)) \
+                    .filter(Metric.resolution == source).scalar()
+                if start is None:
+                    continue
+                start -= start % resolution
+            if since is not None:
+                # the buckets the source rows were partly pruned from stay
+                # as they were rolled up
+                kept = now - self.retention[source]
+                again = max(since - since % resolution,
+                            kept + -kept % resolution)
+            if since is not None and again < start:
+                start = again
+                db_session.query(Metric) \
+                    .filter(Metric.resolution == resolution,
+                            Metric.timestamp >= start,
+                            Metric.timestamp < end) \
+                    .delete(synchronize_session=False)
+            if start >= end:
+                continue
+
+            bucket = Metric.timestamp - Metric.timestamp % resolution
+            columns = [
+                Metric.ip, Metric.model_id,
+                bucket.label('timestamp'),
+                func.sum(Metric.samples).label('samples')
+            ]
+            for name in METRICS:
+                column = getattr(Metric, name)
+                aggregate = AGGREGATES.get(name)
+                if aggregate is None:
+                    # average weighted by the number of samples of each row
+                    columns.append(
+                        (func.sum(column * Metric.samples) / func.nullif(
+                            func.sum(
+                                case([(column.isnot(None), Metric.samples)],
+                                     else_=0)), 0)).label(name))
+                else:
+                    columns.append(
+                        getattr(func, aggregate)(column).label(name))
+
+            rows = db_session.query(*columns) \
+                .filter(Metric.resolution == source,
+                        Metric.timestamp >= start,
+                        Metric.timestamp < end) \
+                .group_by(Metric.ip, Metric.model_id, bucket).all()
+            db_session.bulk_insert_mappings(
+                Metric, [dict(row._asdict(), resolution=resolution)
+                         for row in rows])
+
+    def prune(self, now):
+        for resolution, seconds in self.retention.items():
+            db_session.query(Metric) \
+                .filter(Metric.resolution == resolution,
+                        Metric.timestamp < now - seconds) \
+                .delete(synchronize_session=False)
+
+    def resolution_for(self, start, end, max_points=1000):
+        """
+        Pick the finest resolution that still holds `start` and returns at
+        most about `max_points` points per series.
+        """
+        now = time.time()
+        for resolution in sorted(self.retention):
+            if now - start > self.retention[resolution]:
+                continue
+            # assume about one raw sample per minute
+            if (end - start) / (resolution or 60) <= max_points:
+                return resolution
+        return max(self.retention)
+
+    def query_miner(self, ip, start, end, resolution=None):
+        """
+        Return the samples of a miner between `start` and `end` (unix
+        timestamps) as a list of dicts.
+        """
+        self._ensure_table()
+        if resolution is None:
+            resolution = self.resolution_for(start, end)
+        rows = Metric.query.filter(Metric.resolution == resolution,
+                                   Metric.ip == ip,
+                                   Metric.timestamp >= start,
+                                   Metric.timestamp < end) \
+            .order_by(Metric.timestamp).all()
+        return resolution, [
+            dict({name: getattr(row, name)
+                  for name in METRICS},
+                 timestamp=row.timestamp,
+                 samples=row.samples) for row in rows
+        ]
+
+    def query_model(self, model_id, start, end, resolution=None):
+        """
+        Return the samples of all the miners of a model between `start` and
+        `end` aggregated per bucket of `resolution` seconds (the sample
+        interval for the raw samples): hashrate and online miners are
+        summed, the rest are aggregated like in a rollup.
+
+        The miners are polled on the interval of their priority, so a bucket
+        does not hold a sample of every miner: each miner counts with its
+        latest sample, up to `fill_interval` seconds old.
+        """
+        self._ensure_table()
+        if resolution is None:
+            resolution = self.resolution_for(start, end)
+        step = resolution or self.sample_interval
+        fill = max(self.fill_interval, resolution)
+
+        rows = db_session.query(Metric.ip, Metric.timestamp,
+                                *(getattr(Metric, name) for name in METRICS)) \
+            .filter(Metric.resolution == resolution,
+                    Metric.model_id == model_id,
+                    Metric.timestamp >= start - fill,
+                    Metric.timestamp < end) \
+            .order_by(Metric.timestamp).all()
+
+        samples = []
+        # ip => latest row
+        latest = {}
+        index = 0
+        first = start - start % step
+        for bucket in sorted({row.timestamp - row.timestamp % step
+                              for row in rows}):
+            while index < len(rows) and rows[index].timestamp < bucket + step:
+                latest[rows[index].ip] = rows[index]
+                index += 1
+            if bucket < first:
+                continue
+            current = [
+                row for row in latest.values()
+                if bucket + step - row.timestamp <= fill
+            ]
+            samples.append(_aggregate(bucket, current))
+        return resolution, samples
+
+    def _ensure_table(self):
+        # databases created before the metric table or one of its indexes
+        # existed
+        if not self._table_checked:
+            table = Metric.__table__
+            table.create(bind=engine, checkfirst=True)
+            existing = {index['name'] for index in
+                        inspect(engine).get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in existing:
+                    index.create(bind=engine)
+            self._table_checked = True
+
+
+timeseries = TimeSeriesStore()
+
+
+def _aggregate(timestamp, rows):
+    """The sample of a model at `timestamp` from the rows of its miners."""
+    sample = {
+        'timestamp': timestamp,
+        'miners': len(rows),
+        'online': sum(row.online or 0 for row in rows),
+        'hash_rate': sum(row.hash_rate or 0 for row in rows),
+    }
+    for name in METRICS:
+        if name in sample:
+            continue
+        values = [
+            getattr(row, name) for row in rows
+            if getattr(row, name) is not None
+        ]
+        aggregate = AGGREGATES.get(name)
+        if not values:
+            sample[name] = None
+        elif aggregate is None:
+            sample[name] = sum(values) / len(values)
+        else:
+            sample[name] = (max if aggregate == 'max' else min)(values)
+    return sample
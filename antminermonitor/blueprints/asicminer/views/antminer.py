@@ -1,20 +1,22 @@
-import concurrent.futures
-import re
-import sys
+import json
 import time
-from datetime import timedelta
 
-from flask import (Blueprint, current_app, flash, redirect, render_template,
-                   request, url_for)
-from flask_login import login_required
+from flask import (Blueprint, Response, abort, current_app, flash, jsonify,
+                   redirect, render_template, request, session, url_for)
+from flask_login import current_user, login_required
 from sqlalchemy.exc import IntegrityError
 
-from antminermonitor.blueprints.asicminer.asic_antminer import ASIC_ANTMINER
+from antminermonitor.blueprints.asicminer.dashboard import (alert_panel,
+                                                            page_cache)
+from antminermonitor.blueprints.asicminer.discovery import (DiscoveryJob,
+                                                            discovery_jobs,
+                                                            parse_ranges)
+from antminermonitor.blueprints.asicminer.live import live_feed
 from antminermonitor.blueprints.asicminer.models import Miner
-from antminermonitor.database import db_session
-from config.settings import MODELS, NUM_THREADS
-from lib.util_hashrate import update_unit_and_value
-from lib.util_notify import notify_telegram
+from antminermonitor.blueprints.asicminer.poller import poller
+from antminermonitor.database import transaction
+from config.settings import MODELS
+from lib.util_compress import compressor
 
 antminer = Blueprint('antminer', __name__, template_folder='../templates')
 
@@ -22,75 +24,47 @@ antminer = Blueprint('antminer', __name__, template_folder='../templates')
 @antminer.route('/')
 @login_required
 def miners():
-    # Init variables
+    # read the latest state polled by the background poller
+    snapshot = poller.snapshot()
+    discovery = discovery_jobs.get(request.args.get('discovery', ''))
+    if discovery is not None or '_flashes' in session:
+        # the progress of a discovery job and the outcome of the last action
+        # are only shown once, the page is not cached
+        return _render_miners(snapshot, discovery)
+
+    # the page only changes with the snapshot; a browser that has it gets a
+    # 304, the others the page rendered for the first request
+    seq = live_feed.seq
+    etag = page_cache.etag(snapshot.cycle, snapshot.timestamp, seq,
+                           current_user.is_authenticated)
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        encoding = compressor.encoding()
+        body = page_cache.get(etag,
+                              lambda: _render_miners(snapshot, None, seq),
+                              encoding, compressor.compress)
+        response = Response(body, mimetype='text/html')
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    response.set_etag(etag, weak=True)
+    # always revalidated, the page changes with every snapshot
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _render_miners(snapshot, discovery, seq=None):
     start = time.perf_counter()
-    miners = Miner.query.all()
-    active_miners = []
-    inactive_miners = []
-
-    warnings = []
-    errors = []
-    total_hash_rate_per_model = {}
-    miner_objects = []
-
-    # lookup table for total_hash_rate_per_model
-    for id, miner in MODELS.items():
-        total_hash_rate_per_model[id] = {"value": 0, "unit": miner.get('unit')}
-
-    # create miner objects to pass to executor.map
-    for miner in miners:
-        module = MODELS[miner.model_id]['model_module']
-        cls = MODELS[miner.model_id]['model_classname']
-        obj = getattr(sys.modules[module], cls)(miner)
-        miner_objects.append(obj)
-
-    # pass this method to executor.map to poll the miner
-    def poll(obj):
-        obj.poll()
-        return obj
-
-    # run with ThreadPoolExecutor
-    with concurrent.futures.ThreadPoolExecutor(
-            max_workers=NUM_THREADS) as executor:
-        results = executor.map(poll, miner_objects)
-        for miner in results:
-            if miner is not None:
-                if miner.is_inactive:
-                    inactive_miners.append(miner)
-                else:
-                    active_miners.append(miner)
-
-                    for warning in miner.warnings:
-                        warnings.append(warning)
-                    for error in miner.errors:
-                        errors.append(error)
-                    total_hash_rate_per_model[
-                        miner.model_id]["value"] += miner.hash_rate_ghs5s
-
-    # Flash notifications
-    if not miners:
-        error_message = ("[INFO] No miners added yet. "
-                         "Please add miners using the above form.")
-        current_app.logger.info(error_message)
-        flash(error_message, "info")
-        notify_telegram(error_message)
-
-    elif not errors:
-        error_message = ("[INFO] All miners are operating normal. "
-                         "No errors found.")
-        current_app.logger.info(error_message)
-        flash(error_message, "info")
-        notify_telegram(error_message)
-
-    for error in errors:
-        current_app.logger.error(error)
-        flash(error, "error")
-        notify_telegram(error)
-
-    for warning in warnings:
-        current_app.logger.error(warning)
-        flash(warning, "warning")
-        notify_telegram(warning)
+    models = MODELS
+    row_template = current_app.jinja_env.get_template(
+        'asicminer/miner_row.html')
+    active_rows, inactive_rows = page_cache.rows.render(
+        snapshot.miners,
+        lambda miner: row_template.render(
+            miner=miner, models=models, timestamp=snapshot.timestamp))
+    alerts, hidden_alerts = alert_panel(
+        snapshot, current_app.config.get('DASHBOARD_MAX_ALERTS', 50))
 
     # flash("[INFO] Check chips on your miner", "info")
     # flash("[SUCCESS] Miner added successfully", "success")
@@ -99,26 +73,25 @@ def miners():
 
     # Convert the total_hash_rate_per_model into a data structure that the
     # template can consume.
-    total_hash_rate_per_model_temp = {}
-    for key in total_hash_rate_per_model:
-        value, unit = update_unit_and_value(
-            total_hash_rate_per_model[key]["value"],
-            total_hash_rate_per_model[key]["unit"])
-        if value > 0:
-            total_hash_rate_per_model_temp[key] = f"{value:3.2f} {unit}"
+    total_hash_rate_per_model = snapshot.formatted_hash_rate_per_model
 
     end = time.perf_counter()
     loading_time = end - start
     return render_template(
         'asicminer/home.html',
         version=current_app.config['__VERSION__'],
-        models=MODELS,
-        errors=errors,
-        warnings=warnings,
-        active_miners=active_miners,
-        inactive_miners=inactive_miners,
+        models=models,
+        alerts=alerts,
+        hidden_alerts=hidden_alerts,
+        active_miners=snapshot.active_miners,
+        inactive_miners=snapshot.inactive_miners,
+        active_rows=active_rows,
+        inactive_rows=inactive_rows,
         loading_time=loading_time,
-        total_hash_rate_per_model=total_hash_rate_per_model_temp)
+        last_poll=snapshot,
+        live_seq=live_feed.seq if seq is None else seq,
+        discovery=discovery,
+        total_hash_rate_per_model=total_hash_rate_per_model)
 
 
 @antminer.route('/add', methods=['POST'])
@@ -133,23 +106,21 @@ def add_miner():
     #    return "IP Address already added"
 
     add_miner(miner_ip, miner_model_id, miner_remarks)
+    poller.reload()
 
     return redirect(url_for('antminer.miners'))
 
 
 def add_miner(miner_ip, miner_model_id, miner_remarks):
+    miner = Miner(ip=miner_ip, model_id=miner_model_id, remarks=miner_remarks)
     try:
-        miner = Miner(ip=miner_ip,
-                      model_id=miner_model_id,
-                      remarks=miner_remarks)
-        db_session.add(miner)
-        db_session.commit()
+        with transaction() as session:
+            session.add(miner)
         current_app.logger.info(
             f"Miner with IP Address {miner.ip} added successfully")
         flash(f"Miner with IP Address {miner.ip} added successfully",
               "success")
     except IntegrityError:
-        db_session.rollback()
         current_app.logger.info(f"IP Address {miner.ip} already added")
         flash(f"IP Address {miner.ip} already added", "error")
 
@@ -157,72 +128,97 @@ def add_miner(miner_ip, miner_model_id, miner_remarks):
 @antminer.route('/discovery/', methods=['POST'])
 @login_required
 def miner_discovery():
+    ranges = request.form.get('ranges', '')
+    # legacy form: subnet (xxx.xxx.xxx) with a start and an end IP
+    if request.form.get('subnet'):
+        ranges = "{0}.{1}-{0}.{2}".format(request.form.get('subnet'),
+                                          request.form.get('start_ip'),
+                                          request.form.get('end_ip'))
 
-    subnet = request.form.get('subnet') + "."
-    start_ip = request.form.get('start_ip', type=int)
-    end_ip = request.form.get('end_ip', type=int)
-
-    if end_ip < start_ip:
-        current_app.logger.error(
-            f"Start IP ({start_ip}) cannot be smaller than the end IP ({end_ip})"
-        )
-        flash(
-            f"Start IP ({start_ip}) cannot be smaller than the end IP ({end_ip})",
-            "error")
-        return redirect(url_for('miners'))
-
-    supported_miner = ""
-    miner_model_id = ""
-
-    def is_pycgminer(ip):
-        from lib.pycgminer import get_stats
-        try:
-            miner_stats = get_stats(ip)
-            if miner_stats['STATUS'][0]['STATUS'] == 'error':
-                current_app.logger.error("Error querying IP %s" % ip)
-                flash(f"Error querying IP {ip}", "error")
-                return False
-        except Exception as c:
-            return False
-        try:
-            return miner_stats['STATS'][0]['Type']
-        except Exception as c:
-            return False
-
-    def add_if_supported(ip, model_id):
-        # check if the miner is supported by the software
-        try:
-            supported_miner = [id for id in MODELS.keys() if id == model_id][0]
-            add_miner(ip, supported_miner, "")
-            return True
-        except IndexError as i:
-            return False
-
-    while start_ip <= end_ip:
-        ip = subnet + str(start_ip)
-        current_app.logger.info("Querying IP %s" % ip)
-
-        # check if is pycgminer
-        miner_model_id = is_pycgminer(ip)
-        if miner_model_id:
-            is_supported = add_if_supported(ip, miner_model_id)
-            if is_supported:
-                start_ip += 1
-                # TODO
-                # log message of added supported miner model and IP
-                continue
-
-        # miner is not supported by the software
-        current_app.logger.error(
-            f"Miner with IP {ip} is currently not supported by AntminerMonitor"
-        )
-        flash(
-            f"Miner with IP {ip} is currently not supported by AntminerMonitor",
-            "info")
-
-        start_ip += 1
+    try:
+        hosts = parse_ranges(
+            ranges, max_hosts=current_app.config['DISCOVERY_MAX_HOSTS'])
+    except ValueError as e:
+        current_app.logger.error(f"Invalid discovery range: {e}")
+        flash(f"[ERROR] Invalid discovery range: {e}", "error")
+        return redirect(url_for('antminer.miners'))
 
-    return redirect(url_for('antminer.miners'))
+    if not hosts:
+        flash("[ERROR] No IP addresses to scan", "error")
+        return redirect(url_for('antminer.miners'))
+
+    job = DiscoveryJob(
+        hosts,
+        max_concurrency=current_app.config['DISCOVERY_MAX_CONCURRENCY'],
+        probe_timeout=current_app.config['DISCOVERY_PROBE_TIMEOUT'])
+    discovery_jobs.add(job).start(on_done=lambda job: poller.reload())
+    current_app.logger.info(
+        f"Discovery {job.id} started, scanning {job.total} IP addresses")
+
+    return redirect(url_for('antminer.miners', discovery=job.id))
+
+
+@antminer.route('/discovery/<job_id>')
+@login_required
+def discovery_status(job_id):
+    job = discovery_jobs.get(job_id)
+    if job is None:
+        abort(404)
+    return jsonify(dict(job.progress, found=job.found, added=job.added))
+
+
+@antminer.route('/discovery/<job_id>/events')
+@login_required
+def discovery_events(job_id):
+    """Stream the progress of a discovery job as Server-Sent Events."""
+    job = discovery_jobs.get(job_id)
+    if job is None:
+        abort(404)
+
+    def stream():
+        since = 0
+        while True:
+            events = job.wait_events(since)
+            for index, event in events:
+                yield "id: {}\ndata: {}\n\n".format(index, json.dumps(event))
+                since = index + 1
+            if not events:
+                # keep the connection alive
+                yield ": ping\n\n"
+            elif events[-1][1]['type'] == 'done':
+                break
+
+    return Response(stream(),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
+
+
+@antminer.route('/events')
+@login_required
+def live_events():
+    """
+    Stream the dashboard updates as Server-Sent Events: the changes since
+    the sequence number of the page (`since`) or of the last event received
+    before a reconnection (`Last-Event-ID`).
+    """
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', 0, type=int)
+
+    def stream(since):
+        while True:
+            events = live_feed.wait(since)
+            for kind, seq, data in events:
+                yield "event: {}\nid: {}\ndata: {}\n\n".format(
+                    kind, seq, data)
+                since = seq
+            if not events:
+                # keep the connection alive
+                yield ": ping\n\n"
+
+    return Response(stream(since),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
 
 
 @antminer.route('/delete/<id>')
@@ -230,7 +226,8 @@ def miner_discovery():
 def delete_miner(id):
     miner = Miner.query.filter_by(id=int(id)).first()
     if miner:
-        db_session.delete(miner)
-        db_session.commit()
+        with transaction() as session:
+            session.delete(miner)
         flash(f"Miner {miner.ip} removed successfully", "info")
+        poller.reload()
     return redirect(url_for('antminer.miners'))
@@ -4,29 +4,51 @@ from lib.pycgminer import (get_summary,
                            get_pools,
                            get_stats,
                            )
+from lib.util_cache import TTLCache
 
 antminer_json = Blueprint('antminer_json',
                           __name__,
                           template_folder='../templates',
                           )
 
+# responses of the miners, keyed by (ip, command)
+cache = TTLCache()
+ttls = {'summary': 5, 'pools': 30, 'stats': 5}
+
+
+@antminer_json.record_once
+def configure(state):
+    cache.maxsize = state.app.config.get('CGMINER_CACHE_SIZE', cache.maxsize)
+    ttls.update(state.app.config.get('CGMINER_CACHE_TTLS', {}))
+
+
+def cached(ip, command, function):
+    """
+    Serve the response of `command` from the cache. Concurrent requests for
+    the same ip and command share a single RPC to the miner.
+    """
+    output, age = cache.get_or_call((ip, command), lambda: function(ip),
+                                    ttls[command])
+    response = jsonify(output)
+    response.headers['Age'] = str(int(age))
+    response.headers['Cache-Control'] = 'private, max-age={}'.format(
+        max(0, int(ttls[command] - age)))
+    return response
+
 
 @antminer_json.route('/<ip>/summary')
 @login_required
 def summary(ip):
-    output = get_summary(ip)
-    return jsonify(output)
+    return cached(ip, 'summary', get_summary)
 
 
 @antminer_json.route('/<ip>/pools')
 @login_required
 def pools(ip):
-    output = get_pools(ip)
-    return jsonify(output)
+    return cached(ip, 'pools', get_pools)
 
 
 @antminer_json.route('/<ip>/stats')
 @login_required
 def stats(ip):
-    output = get_stats(ip)
-    return jsonify(output)
+    return cached(ip, 'stats', get_stats)
@@ -0,0 +1,298 @@
+import base64
+import ipaddress
+import json
+
+from flask import Blueprint, Response, abort, jsonify, request
+
+from antminermonitor.blueprints.asicminer import inventory
+from antminermonitor.blueprints.asicminer.poller import poller
+from lib.util_auth import token_or_login_required
+
+api = Blueprint('api', __name__, url_prefix='/api')
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+STATUSES = ('ok', 'warning', 'error', 'inactive')
+
+
+def _ip(miner):
+    try:
+        return int(ipaddress.ip_address(miner.ip))
+    except ValueError:
+        return 0
+
+
+# sort field => function returning the sort value of a miner, None last
+SORT_KEYS = {
+    'ip': _ip,
+    'model_id': lambda m: m.model_id,
+    'worker': lambda m: m.worker,
+    'status': lambda m: STATUSES.index(m.status),
+    'hash_rate_ghs5s': lambda m: float(m.hash_rate_ghs5s or 0),
+    'temperature': lambda m: max(m.temperatures) if m.temperatures else None,
+    'hw_error_rate': lambda m: float(m.hw_error_rate or 0),
+    'elapsed': lambda m: m.elapsed,
+}
+
+
+def _sort_key(field):
+    value = SORT_KEYS[field]
+
+    def key(miner):
+        v = value(miner)
+        # (missing, value, ip) is unique per miner, so it can be a cursor
+        return [v is None, v if v is not None else 0, _ip(miner)]
+
+    return key
+
+
+def _is_after(key, cursor, reverse):
+    """Whether the miner of `key` comes after the one of `cursor`."""
+    if key[0] != cursor[0]:
+        # missing values last
+        return key[0] > cursor[0]
+    return key[1:] < cursor[1:] if reverse else key[1:] > cursor[1:]
+
+
+def _encode_cursor(key):
+    return base64.urlsafe_b64encode(
+        json.dumps(key).encode()).decode().rstrip('=')
+
+
+def _decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        if not isinstance(key, list) or len(key) != 3:
+            raise ValueError
+        return key
+    except ValueError:
+        abort(400, "Invalid cursor")
+
+
+def _filter(miners, args):
+    models = args.getlist('model')
+    statuses = args.getlist('status')
+    worker = args.get('worker')
+    min_temp = args.get('min_temp', type=float)
+    max_temp = args.get('max_temp', type=float)
+
+    for miner in miners:
+        if models and miner.model_id not in models:
+            continue
+        if statuses and miner.status not in statuses:
+            continue
+        if worker and worker.lower() not in miner.worker.lower():
+            continue
+        temperature = max(miner.temperatures) if miner.temperatures else None
+        if min_temp is not None and \
+                (temperature is None or temperature < min_temp):
+            continue
+        if max_temp is not None and \
+                (temperature is None or temperature > max_temp):
+            continue
+        yield miner
+
+
+@api.route('/miners')
+@token_or_login_required('API_TOKEN')
+def miners():
+    """
+    State of the fleet from the latest poll snapshot.
+
+    Query arguments:
+
+    - model: only miners of this model, can be repeated
+    - status: ok, warning, error or inactive, can be repeated
+    - worker: only miners whose worker contains this text
+    - min_temp, max_temp: only miners whose hottest sensor is in the range
+    - sort: ip (default), model_id, worker, status, hash_rate_ghs5s,
+      temperature, hw_error_rate or elapsed; prefix with '-' to reverse
+    - limit, cursor: size of a page and `next_cursor` of the previous page
+    - format: json (default) or ndjson; also picked by the Accept header
+
+    NDJSON is streamed one miner per line and returns every miner that
+    matches unless `limit` is given.
+    """
+    snapshot = poller.snapshot()
+    args = request.args
+
+    sort = args.get('sort', 'ip')
+    reverse = sort.startswith('-')
+    field = sort.lstrip('-')
+    if field not in SORT_KEYS:
+        abort(400, "Unknown sort field: {}".format(field))
+    statuses = set(args.getlist('status')) - set(STATUSES)
+    if statuses:
+        abort(400, "Unknown status: {}".format(', '.join(statuses)))
+    for name in ('min_temp', 'max_temp'):
+        if name in args and args.get(name, type=float) is None:
+            abort(400, "Invalid {}: {}".format(name, args[name]))
+
+    ndjson = args.get('format') == 'ndjson' or (
+        'format' not in args and request.accept_mimetypes.best
+        == 'application/x-ndjson')
+    limit = args.get('limit', type=int)
+    if limit is None and not ndjson:
+        limit = DEFAULT_LIMIT
+    if limit is not None:
+        limit = max(1, min(limit, MAX_LIMIT))
+
+    key = _sort_key(field)
+    miners = sorted(((key(m), m) for m in _filter(snapshot.miners, args)),
+                    key=lambda item: item[0],
+                    reverse=reverse)
+    # the miners without a value stay last in both directions (stable)
+    miners.sort(key=lambda item: item[0][0])
+
+    cursor = args.get('cursor')
+    if cursor:
+        after = _decode_cursor(cursor)
+        try:
+            miners = [(k, m) for k, m in miners
+                      if _is_after(k, after, reverse)]
+        except TypeError:
+            # a cursor of another sort field
+            abort(400, "Invalid cursor")
+
+    next_cursor = None
+    if limit is not None and len(miners) > limit:
+        miners = miners[:limit]
+        next_cursor = _encode_cursor(miners[-1][0])
+
+    headers = {'X-Poll-Cycle': str(snapshot.cycle)}
+    if next_cursor:
+        headers['X-Next-Cursor'] = next_cursor
+
+    if ndjson:
+
+        def stream():
+            for _, miner in miners:
+                yield json.dumps(miner.serialize) + '\n'
+
+        return Response(stream(),
+                        mimetype='application/x-ndjson',
+                        headers=headers)
+
+    response = jsonify(cycle=snapshot.cycle,
+                       polled_at=snapshot.timestamp,
+                       count=len(miners),
+                       next_cursor=next_cursor,
+                       miners=[miner.serialize for _, miner in miners])
+    response.headers.extend(headers)
+    return response
+
+
+@api.route('/fleet')
+@token_or_login_required('API_TOKEN')
+def fleet():
+    """
+    Rollups of the latest poll snapshot per model, subnet (/24) and worker:
+    number of miners, total, mean and standard deviation of the hash rate
+    in H/s or Sol/s, and p50, p95 and max of the temperatures, fan speeds
+    and HW error rates of the active miners. `outliers` lists the miners
+    whose hash rate is more than 2 standard deviations below the mean of
+    their model.
+    """
+    snapshot = poller.snapshot()
+    response = jsonify(cycle=snapshot.cycle,
+                       polled_at=snapshot.timestamp,
+                       **snapshot.stats.as_dict())
+    response.headers['X-Poll-Cycle'] = str(snapshot.cycle)
+    return response
+
+
+def _inventory_format(default):
+    format = request.args.get('format')
+    if format is None:
+        mimetype = request.mimetype
+        if mimetype == 'text/csv':
+            format = 'csv'
+        elif mimetype == 'application/json':
+            format = 'json'
+        else:
+            format = default
+    if format not in ('csv', 'json'):
+        abort(400, "Unknown format: {}".format(format))
+    return format
+
+
+@api.route('/inventory')
+@token_or_login_required('API_TOKEN')
+def export_miners():
+    """
+    The `Miner` table (ip, model_id, remarks) as a file to edit and import.
+
+    Query arguments:
+
+    - format: csv (default) or json
+    """
+    format = request.args.get('format', 'csv')
+    if format not in ('csv', 'json'):
+        abort(400, "Unknown format: {}".format(format))
+    mimetype = 'text/csv' if format == 'csv' else 'application/json'
+    return Response(inventory.export(format),
+                    mimetype=mimetype,
+                    headers={
+                        'Content-Disposition':
+                        'attachment; filename=miners.{}'.format(format)
+                    })
+
+
+@api.route('/inventory', methods=['POST'])
+@token_or_login_required('API_TOKEN')
+def import_miners():
+    """
+    Add or update many miners in a single transaction.
+
+    The body is a CSV file with a header (ip, model_id, remarks) or a JSON
+    list of objects with the same keys, picked by the Content-Type or the
+    `format` argument, or a file uploaded in the 'file' field of a form.
+    Invalid rows are skipped and reported with the error, the others are
+    saved. The miners are polled from the next poll cycle on.
+    """
+    upload = request.files.get('file')
+    if upload is not None:
+        data = upload.read()
+        default = 'json' if upload.filename.endswith('.json') else 'csv'
+    else:
+        data = request.get_data()
+        default = 'csv'
+    format = _inventory_format(default)
+    try:
+        rows = inventory.parse(data.decode('utf-8-sig'), format)
+    except UnicodeDecodeError:
+        abort(400, "The file is not UTF-8")
+    except inventory.InventoryError as e:
+        abort(400, str(e))
+
+    results = inventory.upsert(rows)
+    return _inventory_response(results)
+
+
+@api.route('/inventory/delete', methods=['POST'])
+@token_or_login_required('API_TOKEN')
+def delete_miners():
+    """
+    Delete many miners in a single transaction.
+
+    The body is a JSON list of ips, or an object with that list in 'ips'.
+    """
+    ips = request.get_json(force=True, silent=True)
+    if isinstance(ips, dict):
+        ips = ips.get('ips')
+    if not isinstance(ips, list):
+        abort(400, "Expected a list of ips")
+    if len(ips) > inventory.MAX_ROWS:
+        abort(400, "Too many ips, the limit is {}".format(inventory.MAX_ROWS))
+
+    results = inventory.delete(ips)
+    return _inventory_response(results)
+
+
+def _inventory_response(results):
+    counts = {}
+    for result in results:
+        counts[result['status']] = counts.get(result['status'], 0) + 1
+    errors = [result for result in results if result['status'] == 'error']
+    return jsonify(counts=counts, errors=errors, results=results)
@@ -0,0 +1,46 @@
+import gzip
+import io
+import json
+
+from flask import Blueprint, abort, jsonify, request
+
+from antminermonitor.blueprints.asicminer.cluster import aggregator
+from lib.util_auth import token_or_login_required
+
+antminer_cluster = Blueprint('antminer_cluster',
+                             __name__,
+                             url_prefix='/cluster')
+
+
+@antminer_cluster.route('/snapshots', methods=['POST'])
+@token_or_login_required('AGENT_TOKEN')
+def receive_snapshots():
+    """Receive a batch of encoded snapshots from an agent."""
+    if not aggregator.enabled:
+        abort(404)
+    body = request.get_data()
+    max_size = aggregator.max_batch_size
+    if request.headers.get('Content-Encoding') == 'gzip':
+        # a few KB can inflate to GBs, stop reading past the limit
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(body)) as f:
+                body = f.read(max_size + 1)
+        except (OSError, EOFError):
+            abort(400)
+    if len(body) > max_size:
+        abort(413)
+    try:
+        snapshots = json.loads(body)['snapshots']
+    except (ValueError, KeyError, TypeError):
+        abort(400)
+    aggregator.receive(snapshots, request.remote_addr)
+    return jsonify(received=len(snapshots))
+
+
+@antminer_cluster.route('/agents')
+@token_or_login_required('AGENT_TOKEN')
+def agents():
+    """Last report of every agent."""
+    if not aggregator.enabled:
+        abort(404)
+    return jsonify(aggregator.status())
@@ -0,0 +1,68 @@
+import time
+
+from flask import Blueprint, abort, jsonify, request
+from flask_login import login_required
+
+from antminermonitor.blueprints.asicminer.chains import chain_tracker
+from antminermonitor.blueprints.asicminer.timeseries import timeseries
+from config.settings import MODELS
+
+history = Blueprint('history', __name__, url_prefix='/history')
+
+
+def _range():
+    """
+    Read the `start`, `end` (unix timestamps, default: the last 24 hours) and
+    `resolution` (seconds, default: picked from the range) query arguments.
+    """
+    end = request.args.get('end', type=int) or int(time.time())
+    start = request.args.get('start', type=int) or end - 86400
+    resolution = request.args.get('resolution', type=int)
+    if start >= end:
+        abort(400)
+    if resolution is not None and resolution not in timeseries.retention:
+        abort(400)
+    return start, end, resolution
+
+
+@history.route('/miner/<ip>')
+@login_required
+def miner_history(ip):
+    start, end, resolution = _range()
+    resolution, samples = timeseries.query_miner(ip, start, end, resolution)
+    return jsonify(ip=ip,
+                   start=start,
+                   end=end,
+                   resolution=resolution,
+                   samples=samples)
+
+
+@history.route('/miner/<ip>/chains')
+@login_required
+def chain_history(ip):
+    """
+    The changes of the chip maps of the hashboards of a miner: every event
+    has the map after the change and the positions that flipped, e.g.
+    '12:o>x' when the 13th chip of the chain became defective.
+    """
+    start, end, _ = _range()
+    return jsonify(ip=ip,
+                   start=start,
+                   end=end,
+                   events=chain_tracker.query_miner(ip, start, end))
+
+
+@history.route('/model/<model_id>')
+@login_required
+def model_history(model_id):
+    if model_id not in MODELS:
+        abort(404)
+    start, end, resolution = _range()
+    resolution, samples = timeseries.query_model(model_id, start, end,
+                                                 resolution)
+    return jsonify(model_id=model_id,
+                   start=start,
+                   end=end,
+                   resolution=resolution,
+                   unit=MODELS[model_id]['unit'],
+                   samples=samples)
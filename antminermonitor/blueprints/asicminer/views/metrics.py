@@ -0,0 +1,167 @@
+import threading
+
+from flask import Blueprint, Response
+
+from antminermonitor.blueprints.asicminer.poller import poller
+from config.settings import MODELS
+from lib.util_auth import token_or_login_required
+
+antminer_metrics = Blueprint('antminer_metrics', __name__)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# (name, type, help) of every metric family, in the order they are rendered
+FAMILIES = (
+    ('antminer_up', 'gauge', 'Whether the miner answered the last poll.'),
+    ('antminer_hashrate', 'gauge',
+     'Hashrate (5s) in the unit of the model, see the unit label.'),
+    ('antminer_temperature_celsius', 'gauge', 'Temperature of each sensor.'),
+    ('antminer_fan_rpm', 'gauge', 'Speed of each fan.'),
+    ('antminer_chips', 'gauge', 'Number of ASIC chips per state.'),
+    ('antminer_chips_expected', 'gauge',
+     'Number of ASIC chips of the model.'),
+    ('antminer_hw_error_percent', 'gauge', 'Hardware error rate.'),
+    ('antminer_uptime_seconds', 'gauge', 'Seconds since cgminer started.'),
+    ('antminer_chain_hashrate', 'gauge',
+     'Hashrate of each hashboard, see the unit label.'),
+    ('antminer_chain_hw_errors_total', 'counter',
+     'HW errors of each hashboard.'),
+    ('antminer_chain_chips', 'gauge',
+     'Number of ASIC chips per state of each hashboard.'),
+    ('antminer_chain_temperature_celsius', 'gauge',
+     'Temperature of each sensor of each hashboard.'),
+    ('antminer_poll_duration_seconds', 'gauge',
+     'Seconds it took to poll the miner.'),
+    ('antminermonitor_miners', 'gauge', 'Number of miners per state.'),
+    ('antminermonitor_poll_cycle', 'counter', 'Number of poll cycles.'),
+    ('antminermonitor_poll_cycle_duration_seconds', 'gauge',
+     'Seconds it took to poll the whole fleet.'),
+    ('antminermonitor_poll_timestamp_seconds', 'gauge',
+     'Unix time of the end of the last poll cycle.'),
+)
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n',
+                                                   r'\n').replace('"', r'\"')
+
+
+def _labels(**labels):
+    return '{' + ','.join('{}="{}"'.format(k, _escape(v))
+                          for k, v in labels.items()) + '}'
+
+
+def _ids(ids, values):
+    """
+    The index of the sensor or fan of every value, their position if the
+    miner has no ids (e.g. from an agent of an older version).
+    """
+    return ids if len(ids) == len(values) else range(len(values))
+
+
+def render(snapshot):
+    """Render a `FleetSnapshot` in the Prometheus text exposition format."""
+    samples = {name: [] for name, _, _ in FAMILIES}
+
+    for miner in snapshot.miners:
+        labels = dict(ip=miner.ip, model_id=miner.model_id,
+                      worker=miner.worker)
+        samples['antminer_up'].append(
+            (_labels(**labels), 0 if miner.is_inactive else 1))
+        samples['antminer_poll_duration_seconds'].append(
+            (_labels(**labels), miner.poll_latency))
+        if miner.is_inactive:
+            continue
+
+        samples['antminer_hashrate'].append(
+            (_labels(**labels, unit=MODELS[miner.model_id]['unit']),
+             miner.hash_rate_ghs5s))
+        for sensor, temperature in zip(
+                _ids(miner.temperature_ids, miner.temperatures),
+                miner.temperatures):
+            samples['antminer_temperature_celsius'].append(
+                (_labels(**labels, sensor=sensor), temperature))
+        for fan, speed in zip(_ids(miner.fan_ids, miner.fan_speeds),
+                              miner.fan_speeds):
+            samples['antminer_fan_rpm'].append(
+                (_labels(**labels, fan=fan), speed))
+        for state, key in (('ok', 'Os'), ('defective', 'Xs'),
+                           ('inactive', '-')):
+            samples['antminer_chips'].append(
+                (_labels(**labels, state=state), miner.chips.get(key, 0)))
+        samples['antminer_chips_expected'].append(
+            (_labels(**labels), miner.chips.get('total', 0)))
+        samples['antminer_hw_error_percent'].append(
+            (_labels(**labels), miner.hw_error_rate))
+        samples['antminer_uptime_seconds'].append(
+            (_labels(**labels), miner.elapsed))
+        for chain in miner.chains:
+            samples['antminer_chain_hashrate'].append(
+                (_labels(**labels, chain=chain.index,
+                         unit=MODELS[miner.model_id]['unit']), chain.rate))
+            samples['antminer_chain_hw_errors_total'].append(
+                (_labels(**labels, chain=chain.index), chain.hw_errors))
+            for state, key in (('ok', 'o'), ('defective', 'x'),
+                               ('inactive', '-')):
+                samples['antminer_chain_chips'].append(
+                    (_labels(**labels, chain=chain.index, state=state),
+                     chain.chips.count(key)))
+            for sensor, temperature in zip(
+                    _ids(chain.temperature_ids, chain.temperatures),
+                    chain.temperatures):
+                samples['antminer_chain_temperature_celsius'].append(
+                    (_labels(**labels, chain=chain.index, sensor=sensor),
+                     temperature))
+
+    samples['antminermonitor_miners'] = [
+        (_labels(state='active'), len(snapshot.active_miners)),
+        (_labels(state='inactive'), len(snapshot.inactive_miners)),
+    ]
+    samples['antminermonitor_poll_cycle'] = [('', snapshot.cycle)]
+    samples['antminermonitor_poll_cycle_duration_seconds'] = [
+        ('', snapshot.duration)
+    ]
+    samples['antminermonitor_poll_timestamp_seconds'] = [
+        ('', snapshot.timestamp or 0)
+    ]
+
+    lines = []
+    for name, type, help in FAMILIES:
+        lines.append('# HELP {} {}'.format(name, help))
+        lines.append('# TYPE {} {}'.format(name, type))
+        for labels, value in samples[name]:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                continue
+            lines.append('{}{} {}'.format(name, labels, repr(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class _RenderCache:
+    """Keep the output of the last snapshot, scrapes in between reuse it."""
+
+    def __init__(self):
+        self.cycle = None
+        self.output = ''
+        self.lock = threading.Lock()
+
+    def get(self, snapshot):
+        with self.lock:
+            if self.cycle != snapshot.cycle:
+                self.output = render(snapshot)
+                self.cycle = snapshot.cycle
+            return self.output
+
+
+_cache = _RenderCache()
+
+
+@antminer_metrics.route('/metrics')
+@token_or_login_required('METRICS_TOKEN')
+def metrics():
+    """
+    Prometheus/OpenMetrics exporter of the latest polled state of the fleet.
+    Scrapes never poll the miners, they read the poller's snapshot.
+    """
+    return Response(_cache.get(poller.snapshot()), content_type=CONTENT_TYPE)
@@ -1,21 +1,84 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.orm import scoped_session, sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool
+
+from config.settings import (SQLALCHEMY_DATABASE_URI, SQLITE_BUSY_TIMEOUT,
+                             SQLITE_POOL_SIZE, SQLITE_PRAGMAS)
+
+
+def make_engine(uri, pragmas=None, pool_size=5, busy_timeout=30):
+    """
+    Create the engine of `uri`.
+
+    A SQLite file gets a pool of `pool_size` connections shared by the
+    threads (SQLAlchemy would otherwise open a new connection per session
+    and run the pragmas every time) and every connection is configured with
+    `pragmas` once, when it is opened. `busy_timeout` is the number of
+    seconds a writer waits for the lock of another writer.
+    """
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '',
+                                                              ':memory:'):
+        return create_engine(uri, convert_unicode=True)
+
+    engine = create_engine(uri,
+                           convert_unicode=True,
+                           poolclass=QueuePool,
+                           pool_size=pool_size,
+                           max_overflow=2 * pool_size,
+                           connect_args={
+                               'check_same_thread': False,
+                               'timeout': busy_timeout,
+                           })
 
-from config.settings import SQLALCHEMY_DATABASE_URI
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in (pragmas or {}).items():
+            cursor.execute('PRAGMA {} = {}'.format(name, value))
+        cursor.close()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URI, convert_unicode=True)
+    return engine
+
+
+engine = make_engine(SQLALCHEMY_DATABASE_URI, SQLITE_PRAGMAS,
+                     SQLITE_POOL_SIZE, SQLITE_BUSY_TIMEOUT)
 db_session = scoped_session(sessionmaker(autocommit=False,
                                          autoflush=False,
                                          bind=engine))
 Base = declarative_base()
 Base.query = db_session.query_property()
 
+
+@contextmanager
+def transaction():
+    """
+    Commit everything added, changed or deleted in the block at once, or
+    nothing if it raises: one write transaction instead of one per row.
+
+        with transaction() as session:
+            session.add_all(miners)
+    """
+    try:
+        yield db_session
+        db_session.commit()
+    except BaseException:
+        db_session.rollback()
+        raise
+
+
 def init_db():
     # import all modules here that might define models so that
     # they will be registered properly on the metadata.  Otherwise
     # you will have to import them first before calling init_db()
+    from antminermonitor.blueprints.asicminer.models.chain_event import \
+        ChainEvent
+    from antminermonitor.blueprints.asicminer.models.metric import Metric
     from antminermonitor.blueprints.asicminer.models.miner import Miner
     from antminermonitor.blueprints.asicminer.models.settings import Settings
     from antminermonitor.blueprints.user.models import User
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    Base.metadata.create_all(bind=engine)
@@ -1,6 +1,14 @@
-from flask_migrate import Migrate
 from flask_login import LoginManager
 
 
-migrate = Migrate()
 login_manager = LoginManager()
+
+
+def init_migrate(app, db):
+    """
+    Initialize Flask-Migrate. It imports alembic, which takes longer than
+    the rest of the app, and only the `db` commands of the CLI need it.
+    """
+    from flask_migrate import Migrate
+
+    Migrate(app, db)
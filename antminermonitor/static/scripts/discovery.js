@@ -0,0 +1,41 @@
+(function discovery() {
+    var fieldset = document.getElementById('discovery');
+    if (!fieldset || !window.EventSource)
+        return;
+
+    var progress = document.getElementById('discovery_progress');
+    var status = document.getElementById('discovery_status');
+    var results = document.getElementById('discovery_results');
+    var source = new EventSource(fieldset.dataset.events);
+
+    function append(text, category) {
+        var li = document.createElement('li');
+        li.className = category;
+        li.textContent = text;
+        results.appendChild(li);
+    }
+
+    source.onmessage = function(e) {
+        var event = JSON.parse(e.data);
+        var p = event.progress;
+        progress.max = p.total;
+        progress.value = p.scanned;
+        status.textContent = 'Scanned ' + p.scanned + '/' + p.total +
+            ' IP addresses, ' + p.found + ' supported miners found';
+
+        if (event.type === 'found')
+            append(event.ip + ': ' + event.model_id, 'success');
+        else if (event.type === 'unsupported')
+            append(event.ip + ': ' + (event.model_id || 'unknown') +
+                ' is currently not supported by AntminerMonitor', 'info');
+        else if (event.type === 'saved')
+            append(event.added.length + ' miners added, ' +
+                event.existing.length + ' already added', 'success');
+        else if (event.type === 'error')
+            append(event.message, 'error');
+        else if (event.type === 'done') {
+            status.textContent += ' (done in ' + p.elapsed.toFixed(1) + ' sec)';
+            source.close();
+        }
+    };
+})();
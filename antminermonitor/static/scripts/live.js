@@ -0,0 +1,192 @@
+(function live() {
+    var element = document.getElementById('live');
+    if (!element || !window.EventSource)
+        return;
+
+    var ACTIVE = ['worker', 'model_id', 'remarks', 'os', 'xs', 'dash',
+                  'temperatures', 'fan_speeds', 'hash_rate', 'hw_error_rate',
+                  'uptime', 'errors'];
+    var INACTIVE = ['model_id', 'remarks', 'errors'];
+    var tables = {
+        active: document.getElementById('active_miners'),
+        inactive: document.getElementById('inactive_miners')
+    };
+
+    // same output as the str() of a python list in the server side template
+    function list(values) {
+        return '[' + values.map(function(value) {
+            return typeof value === 'string' ? "'" + value + "'" : value;
+        }).join(', ') + ']';
+    }
+
+    // same output as the str() of a python timedelta
+    function uptime(started) {
+        var seconds = Math.max(0, Math.floor(Date.now() / 1000) - started);
+        var days = Math.floor(seconds / 86400);
+        var h = Math.floor(seconds % 86400 / 3600);
+        var m = Math.floor(seconds % 3600 / 60);
+        var s = seconds % 60;
+        var time = h + ':' + (m < 10 ? '0' : '') + m + ':' + (s < 10 ? '0' : '') + s;
+        if (days === 0)
+            return time;
+        return days + (days === 1 ? ' day, ' : ' days, ') + time;
+    }
+
+    function tick() {
+        var cells = document.querySelectorAll('[data-started]');
+        for (var i = 0; i < cells.length; i++)
+            if (cells[i].dataset.started)
+                cells[i].textContent = uptime(+cells[i].dataset.started);
+    }
+
+    function set(row, field, value) {
+        var cell;
+        if (field === 'id') {
+            cell = row.cells[row.cells.length - 1];
+            cell.firstElementChild.href = element.dataset.delete.replace('ID', value);
+        }
+        else if (field === 'started') {
+            cell = row.querySelector('[data-field=uptime]');
+            if (cell)
+                cell.dataset.started = value || '';
+        }
+        else if (field === 'errors' && row.closest('table') === tables.active) {
+            cell = row.querySelector('[data-field=errors]');
+            row.className = value.length ? 'error' : '';
+            cell.title = value.length ? list(value) : 'OK';
+            cell.textContent = value.length ? 'Check your miner' : 'OK';
+        }
+        else {
+            cell = row.querySelector('[data-field=' + field + ']');
+            if (!cell)
+                return;
+            if (Array.isArray(value))
+                cell.textContent = list(value);
+            else
+                cell.textContent = value === null ? 'None' : value;
+        }
+    }
+
+    function create(ip, miner) {
+        var row = document.createElement('tr');
+        row.id = 'miner-' + ip;
+        var cell = row.insertCell();
+        var link = document.createElement('a');
+        link.target = '_blank';
+        link.href = 'http://' + ip + '/cgi-bin/minerStatus.cgi';
+        link.textContent = ip;
+        cell.appendChild(link);
+        (miner.active ? ACTIVE : INACTIVE).forEach(function(field) {
+            row.insertCell().dataset.field = field;
+        });
+        cell = row.insertCell();
+        link = document.createElement('a');
+        link.style.textDecoration = 'none';
+        link.innerHTML = '&#10060;';
+        cell.appendChild(link);
+
+        // keep the rows sorted by ip like the server side template
+        var table = miner.active ? tables.active : tables.inactive;
+        var rows = table.querySelectorAll('tr[id]');
+        var before = null;
+        for (var i = 0; i < rows.length; i++)
+            if (rows[i].id > row.id) {
+                before = rows[i];
+                break;
+            }
+        if (before)
+            before.parentNode.insertBefore(row, before);
+        else
+            (table.tBodies[0] || table).appendChild(row);
+        return row;
+    }
+
+    // same markup as the alert panel of the server side template
+    function alerts(panel) {
+        var element = document.getElementById('alerts');
+        element.innerHTML = '';
+        function add(category, message, count) {
+            var div = document.createElement('div');
+            div.className = category;
+            var strong = document.createElement('strong');
+            strong.textContent = message;
+            div.appendChild(strong);
+            if (count > 1)
+                div.appendChild(document.createTextNode(' (x' + count + ')'));
+            element.appendChild(div);
+        }
+        panel[0].forEach(function(alert) {
+            add(alert[0], alert[1], alert[2]);
+        });
+        if (panel[1])
+            add('info', '[INFO] ' + panel[1] + ' more alerts, see the miners below.', 1);
+    }
+
+    function apply(update, reset) {
+        if (reset) {
+            var rows = document.querySelectorAll('#active_miners tr[id], #inactive_miners tr[id]');
+            for (var i = 0; i < rows.length; i++)
+                if (!(rows[i].id.slice(6) in update.miners))
+                    rows[i].remove();
+        }
+        update.removed.forEach(function(ip) {
+            var row = document.getElementById('miner-' + ip);
+            if (row)
+                row.remove();
+        });
+        Object.keys(update.miners).forEach(function(ip) {
+            var miner = update.miners[ip];
+            var row = document.getElementById('miner-' + ip);
+            if ('active' in miner) {
+                // a new row, a row that moves to the other table or a reset
+                if (row)
+                    row.remove();
+                row = create(ip, miner);
+            }
+            if (!row)
+                return;
+            Object.keys(miner).forEach(function(field) {
+                set(row, field, miner[field]);
+            });
+        });
+
+        var fleet = update.fleet;
+        document.getElementById('last_poll').textContent = 'Last poll #' +
+            fleet.cycle + ': ' + fleet.polled_at + ' (' + fleet.duration.toFixed(2) + ' sec)';
+        document.getElementById('active_count').textContent = fleet.active;
+        document.getElementById('inactive_count').textContent = fleet.inactive;
+        document.getElementById('inactive_miner_list').hidden = fleet.inactive === 0;
+        var hashRates = document.getElementById('hash_rates');
+        hashRates.innerHTML = '';
+        Object.keys(fleet.hash_rates).sort().forEach(function(model) {
+            var li = document.createElement('li');
+            var name = document.createElement('u');
+            name.textContent = model + ':';
+            var value = document.createElement('strong');
+            value.textContent = fleet.hash_rates[model];
+            li.appendChild(name);
+            li.appendChild(document.createTextNode(' '));
+            li.appendChild(value);
+            hashRates.appendChild(li);
+        });
+        if (fleet.alerts)
+            alerts(fleet.alerts);
+        tick();
+    }
+
+    var source = new EventSource(element.dataset.events);
+    source.onopen = function() {
+        window.liveUpdates = true;
+    };
+    source.onerror = function() {
+        // the browser reconnects with the id of the last event received
+        window.liveUpdates = false;
+    };
+    source.addEventListener('delta', function(e) {
+        apply(JSON.parse(e.data), false);
+    });
+    source.addEventListener('reset', function(e) {
+        apply(JSON.parse(e.data), true);
+    });
+    setInterval(tick, 1000);
+})();
@@ -1,8 +1,14 @@
 (function countdown(remaining) {
-    if(remaining === 0)
+    var element = document.getElementById('countdown');
+    if (window.liveUpdates) {
+        // the table is patched by live.js, no need to reload
+        element.innerHTML = 'Live updates';
+        setTimeout(function(){ countdown(120); }, 1000);
+    }
+    else if(remaining === 0)
         location.reload(true);
     else {
-        document.getElementById('countdown').innerHTML = 'Refresh in: ' + remaining + ' sec';
+        element.innerHTML = 'Refresh in: ' + remaining + ' sec';
         setTimeout(function(){ countdown(remaining - 1); }, 1000);
     }
 })(120);
@@ -0,0 +1,97 @@
+"""
+Time to compute the per-model, per-subnet and per-worker rollups of a
+fleet snapshot, see aggregation.py.
+
+Builds the polled miners from simulated `stats`, `pools` and `summary`
+responses, with 1% of them hashing at half their nominal rate and 2%
+inactive, then computes their `FleetStats` and the dict served by
+/api/fleet in pure Python and, when it is installed, with NumPy, and checks
+that both give the same results.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_aggregation [miners ...]
+"""
+import math
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from antminermonitor.blueprints.asicminer import aggregation
+from antminermonitor.blueprints.asicminer.aggregation import FleetStats
+from antminermonitor.blueprints.asicminer.registry import registry
+from benchmarks.simulator import fleet
+
+SIZES = (1000, 10000, 50000)
+RUNS = 5
+SLOW = 0.01
+INACTIVE = 0.02
+
+
+def miners(count, seed=0):
+    rng = random.Random(seed)
+    result = []
+    for i, fake in enumerate(fleet(count, seed=seed), 1):
+        miner = registry.miner_class(fake.model_id)(SimpleNamespace(
+            id=i, ip=fake.ip, model_id=fake.model_id, remarks=''))
+        if rng.random() < INACTIVE:
+            miner.set_inactive(
+                {'STATUS': [{'description': 'Connection refused'}]})
+        else:
+            if rng.random() < SLOW:
+                fake.hash_rate /= 2
+            miner.handle({
+                'stats': fake.stats(),
+                'pools': fake.pools(),
+                'summary': fake.summary()
+            })
+        result.append(miner)
+    return result
+
+
+def same(a, b):
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, list):
+        return len(a) == len(b) and all(map(same, a, b))
+    if isinstance(a, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-9)
+    return a == b
+
+
+def best(function):
+    times = []
+    for _ in range(RUNS):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main(*sizes):
+    backends = [('python', False)]
+    if aggregation.numpy is not None:
+        backends.append(('numpy', True))
+    else:
+        print("NumPy is not installed, pure Python only")
+
+    print("{:>7} {:>8} {:>9} {:>11} {:>9}".format('miners', 'backend',
+                                                  'ms', 'us/miner',
+                                                  'outliers'))
+    for size in sizes or SIZES:
+        fleet_miners = miners(size)
+        results = []
+        for name, use_numpy in backends:
+            stats, elapsed = best(lambda: FleetStats(
+                fleet_miners, use_numpy=use_numpy).as_dict())
+            results.append(stats)
+            print("{:>7} {:>8} {:9.1f} {:11.2f} {:>9}".format(
+                size, name, elapsed * 1e3, elapsed * 1e6 / size,
+                len(stats['outliers'])))
+        if not all(same(results[0], result) for result in results[1:]):
+            print("  the results of the backends differ")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
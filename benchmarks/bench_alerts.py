@@ -0,0 +1,67 @@
+"""
+Micro-benchmark of the alert rules evaluated after every poll cycle.
+
+Evaluates the default `ALERT_RULES` on a fleet of polled miners, a few of
+them hot, and reports the cost of a whole cycle.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_alerts
+"""
+import random
+import time
+import timeit
+from types import SimpleNamespace
+
+from antminermonitor.blueprints.asicminer.alerts import AlertEngine
+from antminermonitor.blueprints.asicminer.registry import Chain
+
+SIZES = (100, 2000, 10000)
+
+
+def fleet(size, rng):
+    return [
+        SimpleNamespace(ip='10.0.{}.{}'.format(i // 250, i % 250 + 1),
+                        model_id='Antminer S9',
+                        is_inactive=False,
+                        chips={'Os': 189, 'Xs': 0, '-': 0, 'total': 189},
+                        temperatures=[rng.randint(60, 85) for _ in range(3)],
+                        fan_speeds=[5800, 6000],
+                        hash_rate_ghs5s=rng.uniform(13000, 14000),
+                        hw_error_rate=0.001,
+                        elapsed=86400 + i,
+                        chains=tuple(
+                            Chain(index, 'o' * 63, 4500.0, 0, (70, 60))
+                            for index in (6, 7, 8)),
+                        warnings=[],
+                        errors=[]) for i in range(size)
+    ]
+
+
+def main(number=20):
+    rng = random.Random(0)
+    print("Evaluation of {} alert rules per poll cycle".format(
+        len(AlertEngine().definitions)))
+    for size in SIZES:
+        engine = AlertEngine()
+        # no `Settings` lookup during the benchmark
+        engine.definitions = [
+            dict(d, setting=None) for d in engine.definitions
+        ]
+        miners = fleet(size, rng)
+        now = [time.time()]
+
+        def cycle():
+            now[0] += 30
+            for miner in miners:
+                del miner.warnings[:]
+                miner.elapsed += 30
+            engine.evaluate(miners, now[0])
+
+        seconds = min(timeit.repeat(cycle, number=number, repeat=5)) / number
+        print("  {:>6} miners {:8.2f} ms/cycle {:6.2f} us/miner".format(
+            size, seconds * 1e3, seconds / size * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""
+Cost of a dashboard hit, `GET /`, for the states a browser finds it in.
+
+Builds the polled miners from simulated `stats`, `pools` and `summary`
+responses, publishes them as the latest snapshot and times:
+
+- cold: the first render, every row rendered
+- repoll: the render of the next snapshot where 1% of the miners were
+  polled again, the other rows come from the row cache
+- cached: another hit on the same snapshot, the page of the cache
+- gzip: the same with 'Accept-Encoding: gzip', compressed once
+- 304: a hit with the ETag of the page
+
+and reports the size of the page, raw and gzipped.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_dashboard [miners ...]
+"""
+import sys
+import time
+
+from antminermonitor.blueprints.asicminer.poller import FleetSnapshot
+from benchmarks.bench_aggregation import miners
+
+SIZES = (1000, 10000)
+REPOLLED = 0.01
+RUNS = 5
+
+
+def timed(function, runs=1):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, min(times)
+
+
+def main(*sizes):
+    from antminermonitor.app import create_app
+    from antminermonitor.blueprints.asicminer.poller import poller
+
+    app = create_app(settings_override={
+        'POLLER_ENABLED': False,
+        'METRICS_ENABLED': False,
+        'CHAIN_EVENTS_ENABLED': False,
+        'SHARED_SNAPSHOT': False,
+        'LOGIN_DISABLED': True,
+    })
+    client = app.test_client()
+
+    print("{:>7} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}".format(
+        'miners', 'cold ms', 'repoll ms', 'cached ms', 'gzip ms', '304 ms',
+        'page KiB', 'gzip KiB'))
+    cycle = 0
+    for size in sizes or SIZES:
+        fleet = miners(size)
+        now = time.time()
+        for miner in fleet:
+            miner.polled_at = now
+        cycle += 1
+        poller.publish(FleetSnapshot(miners=fleet, timestamp=now, cycle=cycle))
+        response, cold = timed(lambda: client.get('/'))
+        assert response.status_code == 200, response.status
+
+        now += 5
+        for miner in fleet[::int(1 / REPOLLED)]:
+            miner.polled_at = now
+        cycle += 1
+        poller.publish(FleetSnapshot(miners=fleet, timestamp=now, cycle=cycle))
+        response, repoll = timed(lambda: client.get('/'))
+        page = len(response.data)
+
+        _, cached = timed(lambda: client.get('/'), RUNS)
+        headers = {'Accept-Encoding': 'gzip'}
+        response, gzipped = timed(lambda: client.get('/', headers=headers),
+                                  RUNS)
+        assert response.headers['Content-Encoding'] == 'gzip'
+        compressed = len(response.data)
+        headers = {'If-None-Match': response.headers['ETag']}
+        response, not_modified = timed(
+            lambda: client.get('/', headers=headers), RUNS)
+        assert response.status_code == 304, response.status
+
+        print("{:>7} {:9.1f} {:9.1f} {:9.2f} {:9.2f} {:9.2f} {:9.0f} "
+              "{:9.0f}".format(size, cold * 1e3, repoll * 1e3, cached * 1e3,
+                               gzipped * 1e3, not_modified * 1e3, page / 1024,
+                               compressed / 1024))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
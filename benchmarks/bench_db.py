@@ -0,0 +1,109 @@
+"""
+Benchmark of the reads of the dashboard while the database is written.
+
+A writer thread inserts batches of time-series samples in a loop, like the
+flushes of the time-series store, while the main thread reads the `Miner`
+table and the latest samples, like a page load. Compares the engine
+SQLAlchemy creates by default (rollback journal, a new connection per
+session) with the engine of `antminermonitor.database` and its pragmas.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_db
+"""
+import os
+import tempfile
+import threading
+import time
+
+from sqlalchemy import create_engine, text
+
+# register the tables on the metadata
+from antminermonitor.blueprints.asicminer.models import Miner  # noqa: F401
+from antminermonitor.blueprints.asicminer.models.metric import Metric  # noqa: F401
+from antminermonitor.database import Base, make_engine
+from config.settings import SQLITE_PRAGMAS
+
+MINERS = 500
+BATCH = 500  # samples per write transaction
+READS = 300
+
+
+def setup(engine):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(
+            text("INSERT INTO miner (ip, model_id, remarks) "
+                 "VALUES (:ip, 'Antminer S9', '')"),
+            [{'ip': '10.0.{}.{}'.format(i // 250, i % 250 + 1)}
+             for i in range(MINERS)])
+
+
+def writer(engine, stop, counter):
+    timestamp = 0
+    while not stop.is_set():
+        timestamp += 30
+        rows = [{
+            'ip': '10.0.{}.{}'.format(i // 250, i % 250 + 1),
+            'timestamp': timestamp,
+            'hash_rate': 13500.0,
+        } for i in range(BATCH)]
+        with engine.begin() as connection:
+            connection.execute(
+                text("INSERT INTO metric (ip, model_id, resolution, "
+                     "timestamp, samples, hash_rate) VALUES (:ip, "
+                     "'Antminer S9', 0, :timestamp, 1, :hash_rate)"), rows)
+        counter[0] += 1
+
+
+def read(engine):
+    with engine.connect() as connection:
+        connection.execute(text("SELECT * FROM miner")).fetchall()
+        connection.execute(
+            text("SELECT * FROM metric WHERE resolution = 0 AND "
+                 "ip = '10.0.0.1' ORDER BY timestamp DESC LIMIT 120")
+        ).fetchall()
+
+
+def run(name, engine):
+    setup(engine)
+    stop = threading.Event()
+    counter = [0]
+    thread = threading.Thread(target=writer, args=(engine, stop, counter))
+    thread.start()
+    latencies = []
+    errors = 0
+    start = time.perf_counter()
+    try:
+        for _ in range(READS):
+            t = time.perf_counter()
+            try:
+                read(engine)
+            except Exception:
+                errors += 1
+            latencies.append(time.perf_counter() - t)
+    finally:
+        stop.set()
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    print("  {:<10} read p50 {:7.2f} ms  p99 {:8.2f} ms  max {:8.2f} ms  "
+          "errors {:3}  writes {:5.0f}/s".format(
+              name, latencies[len(latencies) // 2] * 1e3,
+              latencies[int(len(latencies) * 0.99)] * 1e3,
+              latencies[-1] * 1e3, errors, counter[0] / elapsed))
+    engine.dispose()
+
+
+def main():
+    print("{} reads of {} miners while {} samples are written per "
+          "transaction".format(READS, MINERS, BATCH))
+    with tempfile.TemporaryDirectory() as directory:
+        default = 'sqlite:///' + os.path.join(directory, 'default.db')
+        tuned = 'sqlite:///' + os.path.join(directory, 'tuned.db')
+        run('default', create_engine(default))
+        run('tuned', make_engine(tuned, SQLITE_PRAGMAS))
+
+
+if __name__ == '__main__':
+    main()
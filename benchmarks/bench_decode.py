@@ -0,0 +1,99 @@
+"""
+Micro-benchmark of receiving and decoding large `stats` responses.
+
+Compares the receive path of `CgminerAPI` before the single receive buffer
+(4 KB reads appended to a str, `'}{'` replaced on the whole text, then
+`json.loads`) with `CgminerAPI._receive` and `_decode`, on 20, 40 and
+60 KB responses like the ones of the S17/S19 firmware, which add per-chip
+frequencies and voltages to every chain.
+
+The responses are written to one end of a socket pair and read from the
+other, so the cost of the system calls is included.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_decode
+"""
+import json
+import socket
+import timeit
+
+import lib.pycgminer as pycgminer
+from benchmarks.simulator import FakeMiner
+
+SIZES = (20, 40, 60)  # KB
+
+
+def payload(size):
+    """NUL terminated `stats` response of about `size` KB, `}{` included."""
+    miner = FakeMiner('127.0.0.1', 'Antminer S17')
+    response = miner.stats()
+    stats = response['STATS'][1]
+    chain = 0
+    while len(json.dumps(response)) < size * 1024:
+        chain += 1
+        chips = len(miner.chains[0])
+        stats['chain_chipfreq{}'.format(chain)] = ' '.join(
+            str(600 + i % 50) for i in range(chips))
+        stats['chain_chipvol{}'.format(chain)] = ' '.join(
+            str(380 + i % 20) for i in range(chips))
+    text = json.dumps(response).replace('}, {"STATS": 0', '}{"STATS": 0')
+    return text.encode() + b'\x00'
+
+
+def legacy_receive(sock, size=4096):
+    msg = ''
+    while 1:
+        chunk = sock.recv(size)
+        if chunk:
+            msg += chunk.decode('utf-8')
+        else:
+            break
+    return msg
+
+
+def legacy(data):
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(data)
+        # the old receive path waits for the miner to close the connection
+        sender.shutdown(socket.SHUT_WR)
+        received = legacy_receive(receiver)
+        return json.loads(received[:-1].replace('}{', '},{'))
+
+
+def current(data):
+    sender, receiver = socket.socketpair()
+    with sender, receiver:
+        sender.sendall(data)
+        received = pycgminer.CgminerAPI()._receive(receiver)
+        return pycgminer._decode(received)
+
+
+def main(number=500):
+    decoders = [('after', pycgminer._loads)]
+    if pycgminer._loads is not json.loads:
+        decoders.append(('after (json)', json.loads))
+
+    for size in SIZES:
+        data = payload(size)
+        assert legacy(data) == current(data)
+        print("Receive and decode a {:.1f} KB `stats` response".format(
+            len(data) / 1024))
+        before = min(timeit.repeat(lambda: legacy(data), number=number,
+                                   repeat=5)) / number * 1e6
+        print("  {:<13} {:8.1f} us".format('before', before))
+        for name, loads in decoders:
+            pycgminer._loads = loads
+            try:
+                after = min(timeit.repeat(lambda: current(data),
+                                          number=number,
+                                          repeat=5)) / number * 1e6
+            finally:
+                pycgminer._loads = decoders[0][1]
+            print("  {:<13} {:8.1f} us  {:5.2f}x".format(
+                name, after, before / after))
+
+
+if __name__ == '__main__':
+    main()
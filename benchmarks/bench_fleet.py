@@ -0,0 +1,137 @@
+"""
+Load benchmark of the poll path against a simulated fleet.
+
+Starts `benchmarks.simulator` in a child process and, for every fleet size,
+reports:
+
+- cycle: wall time of one `Poller.poll_fleet` over the whole fleet
+- polls/s: miners polled per second of cycle
+- sockets: connections accepted by the simulator during the cycle
+- inactive: miners that timed out or answered garbage
+- memory: peak Python allocations of the cycle (tracemalloc) and the max
+  RSS of the process
+- dashboard: latency of `GET /` rendering the snapshot of the cycle
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_fleet
+    python -m benchmarks.bench_fleet --miners 10 100 --latency 0.05 \\
+        --timeouts 0.01 --malformed 0.01 --threads
+
+Fleets of more than a few thousand miners need a high enough limit of open
+files (`ulimit -n`).
+"""
+import argparse
+import asyncio
+import multiprocessing
+import resource
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from benchmarks.simulator import Simulator, fleet
+
+SIZES = (10, 100, 1000, 5000)
+
+
+def serve(miners, options, connections, ready, stop):
+    """Child process: serve the fake miners until `stop` is set."""
+
+    class CountingSimulator(Simulator):
+        async def handle(self, miner, reader, writer):
+            with connections.get_lock():
+                connections.value += 1
+            await super().handle(miner, reader, writer)
+
+    async def main():
+        simulator = CountingSimulator(miners, **options)
+        await simulator.start()
+        ready.set()
+        while not stop.is_set():
+            await asyncio.sleep(0.1)
+        simulator.close()
+
+    asyncio.run(main())
+
+
+def run(size, args, app, poller):
+    miners = fleet(size, args.model, args.dead_chips)
+    connections = multiprocessing.Value('l', 0)
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    options = dict(latency=args.latency,
+                   jitter=args.jitter,
+                   timeouts=args.timeouts,
+                   malformed=args.malformed)
+    process = multiprocessing.Process(target=serve,
+                                      args=(miners, options, connections,
+                                            ready, stop),
+                                      daemon=True)
+    process.start()
+    try:
+        if not ready.wait(60):
+            raise RuntimeError("simulator did not start")
+
+        rows = [
+            SimpleNamespace(id=i, ip=m.ip, model_id=m.model_id, remarks='')
+            for i, m in enumerate(miners, 1)
+        ]
+        tracemalloc.start()
+        start = time.perf_counter()
+        snapshot = poller.poll_fleet(rows)
+        cycle = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        poller.publish(snapshot)
+        with app.test_client() as client:
+            start = time.perf_counter()
+            response = client.get('/')
+            dashboard = time.perf_counter() - start
+        assert response.status_code == 200, response.status
+
+        print("{:>6} {:>9.3f} {:>9.0f} {:>8} {:>8} {:>9.1f} {:>9.1f} "
+              "{:>9.3f}".format(
+                  size, cycle, size / cycle, connections.value,
+                  len(snapshot.inactive_miners), peak / 2**20,
+                  resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  dashboard))
+    finally:
+        stop.set()
+        process.join(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--miners', type=int, nargs='+', default=SIZES)
+    parser.add_argument('--model', action='append',
+                        help="can be repeated, default: Antminer S9")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--timeouts', type=float, default=0.0)
+    parser.add_argument('--malformed', type=float, default=0.0)
+    parser.add_argument('--dead-chips', type=float, default=0.0)
+    parser.add_argument('--threads', action='store_true',
+                        help="poll with the thread pool instead of asyncio")
+    args = parser.parse_args()
+    args.model = args.model or ['Antminer S9']
+
+    from antminermonitor.app import create_app
+    from antminermonitor.blueprints.asicminer.poller import poller
+
+    app = create_app(settings_override={
+        'POLLER_ENABLED': False,
+        'METRICS_ENABLED': False,
+        'LOGIN_DISABLED': True,
+        'POLL_ASYNC': not args.threads,
+    })
+
+    print("{:>6} {:>9} {:>9} {:>8} {:>8} {:>9} {:>9} {:>9}".format(
+        'miners', 'cycle s', 'polls/s', 'sockets', 'inactive', 'peak MiB',
+        'rss MiB', 'dash s'))
+    for size in args.miners:
+        run(size, args, app, poller)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Memory kept resident for the state of a fleet of 10000 miners.
+
+Builds the polled miner objects from simulated `stats`, `pools` and
+`summary` responses, the `FleetSnapshot` of the cycle and the rows of the
+live dashboard feed, and reports what each of them retains, measured with
+`tracemalloc`.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_memory [miners]
+"""
+import gc
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+from antminermonitor.blueprints.asicminer.live import LiveFeed
+from antminermonitor.blueprints.asicminer.poller import FleetSnapshot
+from antminermonitor.blueprints.asicminer.registry import registry
+from benchmarks.simulator import fleet
+
+
+def retained(build):
+    """(result of `build()`, bytes it still holds once it returned)"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = build()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    return result, tracemalloc.get_traced_memory()[0] - before, elapsed
+
+
+def main(count=10000):
+    fakes = fleet(count)
+    rows = [
+        SimpleNamespace(id=i, ip=fake.ip, model_id=fake.model_id, remarks='')
+        for i, fake in enumerate(fakes, 1)
+    ]
+
+    def poll():
+        miners = []
+        for row, fake in zip(rows, fakes):
+            miner = registry.miner_class(row.model_id)(row)
+            miner.handle({
+                'stats': fake.stats(),
+                'pools': fake.pools(),
+                'summary': fake.summary()
+            })
+            miners.append(miner)
+        return miners
+
+    tracemalloc.start()
+    miners, miners_size, poll_time = retained(poll)
+    snapshot, snapshot_size, snapshot_time = retained(
+        lambda: FleetSnapshot(miners=miners, timestamp=time.time(), cycle=1))
+    feed = LiveFeed()
+    _, feed_size, feed_time = retained(lambda: feed.update(snapshot))
+    tracemalloc.stop()
+
+    print("Resident state of {} miners".format(count))
+    for name, size, elapsed in (
+            ('miners', miners_size, poll_time),
+            ('snapshot', snapshot_size, snapshot_time),
+            ('live feed', feed_size, feed_time),
+    ):
+        print("  {:<10} {:8.2f} MB {:7.0f} bytes/miner {:8.1f} ms".format(
+            name, size / 2**20, size / count, elapsed * 1e3))
+    total = miners_size + snapshot_size + feed_size
+    print("  {:<10} {:8.2f} MB {:7.0f} bytes/miner".format(
+        'total', total / 2**20, total / count))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
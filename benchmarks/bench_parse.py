@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of the per-miner parse cost of a `stats` response.
+
+Compares the parsing done by `ASIC_ANTMINER.poll` before the model parse
+plans (regex search and sort of every key, five `str.count` passes per
+chain) with `ParsePlan.parse`.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_parse
+"""
+import re
+import timeit
+
+from antminermonitor.blueprints.asicminer.registry import registry
+from config.settings import MODELS
+
+
+def s9_stats():
+    """Second section of the `stats` response of an Antminer S9."""
+    stats = {
+        'STATS': 0, 'ID': 'BC50', 'Elapsed': 86400, 'Calls': 0, 'Wait': 0.0,
+        'Max': 0.0, 'Min': 99999999.0, 'GHS 5s': '13512.34',
+        'GHS av': 13498.21, 'miner_count': 3, 'frequency': '650',
+        'fan_num': 2, 'temp_num': 3, 'temp_max': 75,
+        'Device Hardware%': 0.0012, 'no_matching_work': 12,
+        'miner_version': '16.8.1.3', 'total_rateideal': 13500.0,
+        'total_freqavg': 650.0, 'total_acn': 189, 'total_rate': 13498.21,
+    }
+    for i in range(1, 9):
+        stats['fan{}'.format(i)] = 6000 if i in (3, 6) else 0
+        stats['temp{}'.format(i)] = 60 + i if i in (6, 7, 8) else 0
+        stats['temp2_{}'.format(i)] = 70 + i if i in (6, 7, 8) else 0
+    for i in range(1, 17):
+        chain = ' '.join(['oooooooo'] * 7 + ['ooooo']) \
+            if i in (6, 7, 8) else ''
+        stats['chain_acn{}'.format(i)] = 63 if chain else 0
+        stats['chain_acs{}'.format(i)] = chain
+        stats['chain_hw{}'.format(i)] = 12 if chain else 0
+        stats['chain_rate{}'.format(i)] = '4500.12' if chain else ''
+        stats['chain_offside_{}'.format(i)] = 0
+        stats['chain_opencore_{}'.format(i)] = 1
+    return stats
+
+
+def legacy_parse(stats, model_id):
+    """The parsing of `ASIC_ANTMINER.poll` before the parse plans."""
+    asic_chains = [
+        stats[chain] for chain in stats.keys() if "chain_acs" in chain
+    ]
+    Os = sum([str(o).count('o') for o in asic_chains])
+    Xs = sum([str(x).count('x') for x in asic_chains])
+    Cs = sum([str(x).count('C') for x in asic_chains])
+    Bs = sum([str(x).count('B') for x in asic_chains])
+    dash = sum([str(x).count('-') for x in asic_chains])
+    total_chips = sum(
+        [int(y) for y in str(MODELS.get(model_id).get('chips')).split(',')])
+    temperatures = [
+        int(stats[temp])
+        for temp in sorted(stats.keys(), key=lambda x: str(x))
+        if re.search(MODELS.get(model_id).get('temp_keys') + '[0-9]', temp)
+        if stats[temp] != 0
+    ]
+    fan_speeds = [
+        stats[fan] for fan in sorted(stats.keys(), key=lambda x: str(x))
+        if re.search("fan" + '[0-9]', fan) if stats[fan] != 0
+    ]
+    return (Os, Xs, Bs, Cs, dash, total_chips), temperatures, fan_speeds
+
+
+def plan_parse(stats, model_id):
+    plan = registry.plan(model_id)
+    chips, temperatures, fan_speeds = plan.parse(stats)[:3]
+    return (chips['o'], chips['x'], chips['B'], chips['C'], chips['-'],
+            plan.total_chips), temperatures, fan_speeds
+
+
+def main(number=20000):
+    stats = s9_stats()
+    model_id = 'Antminer S9'
+    assert legacy_parse(stats, model_id) == plan_parse(stats, model_id)
+
+    print("Parse cost of an Antminer S9 `stats` response ({} keys)".format(
+        len(stats)))
+    results = {}
+    for name, function in (('before', legacy_parse), ('after', plan_parse)):
+        seconds = min(
+            timeit.repeat(lambda: function(stats, model_id),
+                          number=number,
+                          repeat=5))
+        results[name] = seconds / number * 1e6
+        print("  {:<7} {:8.2f} us/miner".format(name, results[name]))
+    print("  speedup {:8.2f}x".format(results['before'] / results['after']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""
+How fresh the data of each kind of miner is with the priority scheduler of
+the poller, see scheduler.py, against polling every miner on the same
+interval, for the same budget of polls per second.
+
+Simulates an hour of a fleet where 3% of the miners have warnings and 10%
+are tagged 'priority:low', tick by tick on a virtual clock without any RPC,
+and reports the mean and max age of the data of each kind of miner, the
+polls per second and the cost of the scheduler per poll. The budget is
+given as a fraction of the polls per second that polling every miner every
+POLL_INTERVAL needs.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_scheduler [miners [budget ...]]
+"""
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+from antminermonitor.blueprints.asicminer.scheduler import PollScheduler
+from config.settings import (POLL_INTERVAL, POLL_INTERVAL_HIGH,
+                             POLL_INTERVAL_LOW, POLL_TICK)
+
+MINERS = 10000
+BUDGETS = (1.0, 0.5)
+DURATION = 3600
+WARNINGS = 0.03
+LOW = 0.10
+KINDS = ('warning', 'normal', 'low')
+
+
+def fleet(count, seed=0):
+    rng = random.Random(seed)
+    miners = []
+    for i in range(count):
+        draw = rng.random()
+        kind = 'warning' if draw < WARNINGS else \
+            'low' if draw < WARNINGS + LOW else 'normal'
+        miners.append(SimpleNamespace(
+            ip='10.{}.{}.{}'.format(i // 65536, i // 256 % 256, i % 256),
+            model_id='Antminer S9',
+            remarks='priority:low' if kind == 'low' else '',
+            is_inactive=False,
+            warnings=['hot'] if kind == 'warning' else [],
+            errors=[],
+            chips={'Xs': 0},
+            elapsed=86400,
+            kind=kind))
+    return miners
+
+
+def simulate(miners, scheduler, rate):
+    """Mean and max age of the data per kind, polls per second, us/poll."""
+    random.seed(0)
+    by_ip = {miner.ip: miner for miner in miners}
+    polled_at = {}
+    ages = {kind: [] for kind in KINDS}
+    polls = 0
+    cost = 0
+    limit = max(1, int(rate * POLL_TICK))
+    # start from a spread out fleet, not from everything due at once
+    for miner in miners:
+        scheduler._push(miner.ip, random.random() * POLL_INTERVAL,
+                        'normal')
+        polled_at[miner.ip] = 0
+    for now in range(0, DURATION, POLL_TICK):
+        start = time.perf_counter()
+        due = scheduler.due(now, limit)
+        for ip in due:
+            scheduler.schedule(by_ip[ip], now)
+        cost += time.perf_counter() - start
+        polls += len(due)
+        for ip in due:
+            polled_at[ip] = now
+        if now >= POLL_INTERVAL_LOW:
+            for miner in miners:
+                ages[miner.kind].append(now - polled_at[miner.ip])
+    return ({
+        kind: (sum(values) / len(values), max(values))
+        for kind, values in ages.items() if values
+    }, polls / DURATION, cost * 1e6 / max(polls, 1))
+
+
+def main(count=MINERS, *budgets):
+    miners = fleet(count)
+    flat = {
+        'low': POLL_INTERVAL,
+        'normal': POLL_INTERVAL,
+        'high': POLL_INTERVAL
+    }
+    tiered = {
+        'low': POLL_INTERVAL_LOW,
+        'normal': POLL_INTERVAL,
+        'high': POLL_INTERVAL_HIGH
+    }
+    print("{:>7} {:>7} {:>8} {:>6} {:>15} {:>15} {:>15} {:>8}".format(
+        'budget', 'rps', 'schedule', 'polls', 'warning age', 'normal age',
+        'low age', 'us/poll'))
+    for budget in budgets or BUDGETS:
+        rate = budget * count / POLL_INTERVAL
+        for name, intervals in (('flat', flat), ('tiered', tiered)):
+            ages, polls, cost = simulate(miners,
+                                         PollScheduler(intervals=intervals),
+                                         rate)
+            print("{:>7} {:7.0f} {:>8} {:6.0f} {:>15} {:>15} {:>15} "
+                  "{:8.2f}".format(
+                      budget, rate, name, polls, *[
+                          "{:5.1f} / {:4d}".format(*ages[kind])
+                          for kind in KINDS
+                      ], cost))
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    main(*([int(args[0])] if args else []),
+         *(float(arg) for arg in args[1:]))
@@ -0,0 +1,78 @@
+"""
+Startup time of the app, i.e. the boot of a gunicorn worker.
+
+Runs `create_app()` in fresh interpreters with `python -X importtime` and
+reports the wall time, the number of modules imported and the packages that
+take the longest to import: the self time of all the modules of a package,
+e.g. every `sqlalchemy.*`. With the default settings, and again without the
+optional features, whose modules are then not imported.
+
+Run from the root of the project:
+
+    python -m benchmarks.bench_startup
+"""
+import os
+import subprocess
+import sys
+import time
+
+RUNS = 5
+TOP = 10
+CODE = "from antminermonitor.app import create_app; create_app({})"
+CONFIGS = (
+    ('default settings', {}),
+    ('no optional features', {
+        'settings_override': {
+            'METRICS_ENABLED': False,
+            'CHAIN_EVENTS_ENABLED': False,
+            'SHARED_SNAPSHOT': False,
+        }
+    }),
+)
+
+
+def run(kwargs):
+    env = dict(os.environ, PYTHONPATH=os.getcwd())
+    start = time.perf_counter()
+    code = CODE.format(', '.join('{}={!r}'.format(*item)
+                                 for item in kwargs.items()))
+    process = subprocess.run([sys.executable, '-X', 'importtime', '-c', code],
+                             env=env,
+                             stderr=subprocess.PIPE,
+                             universal_newlines=True,
+                             check=True)
+    elapsed = time.perf_counter() - start
+
+    packages = {}
+    modules = 0
+    for line in process.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, _, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(own) / 1e6
+        modules += 1
+    return elapsed, packages, modules
+
+
+def main():
+    for label, kwargs in CONFIGS:
+        results = [run(kwargs) for _ in range(RUNS)]
+        wall = sorted(elapsed for elapsed, _, _ in results)
+        print("create_app() in a new interpreter, {}, {} runs".format(
+            label, RUNS))
+        print("  wall time  min {:6.3f} s  median {:6.3f} s".format(
+            wall[0], wall[len(wall) // 2]))
+        print("  modules imported: {}".format(results[0][2]))
+
+        names = set().union(*(packages for _, packages, _ in results))
+        median = {
+            name: sorted(p.get(name, 0) for _, p, _ in results)[RUNS // 2]
+            for name in names
+        }
+        print("  slowest packages to import (median):")
+        for name in sorted(median, key=median.get, reverse=True)[:TOP]:
+            print("    {:<40} {:7.1f} ms".format(name, median[name] * 1e3))
+
+if __name__ == '__main__':
+    main()
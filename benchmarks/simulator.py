@@ -0,0 +1,256 @@
+"""
+Simulated fleet of cgminer/bmminer API servers.
+
+Every fake miner listens on its own loopback address (127.0.0.0/8 is routed
+to the loopback interface on Linux; on macOS add the aliases first with
+`ifconfig lo0 alias 127.0.x.y`) on the cgminer API port and answers the
+`stats`, `pools`, `summary` and joined (`stats+pools+summary`) commands like
+an Antminer of one of the models of `config/models.json` would, including
+the bmminer `}{` glitch of the `stats` response.
+
+Run from the root of the project:
+
+    python -m benchmarks.simulator --miners 1000 --latency 0.05 \\
+        --jitter 0.02 --timeouts 0.01 --dead-chips 0.001
+
+and add the miners printed on stdout (ip,model_id) to AntminerMonitor.
+"""
+import argparse
+import asyncio
+import ipaddress
+import json
+import random
+import re
+
+from config.settings import MODELS
+
+PORT = 4028
+
+PREFIXES = ('', 'K', 'M', 'G', 'T', 'P')
+NOMINAL = re.compile(r'([0-9.]+) ([KMGTP]?)(H|Sol)/s$')
+
+
+def addresses(count, first='127.0.1.1'):
+    """`count` consecutive loopback addresses, skipping x.x.x.0 and .255"""
+    address = int(ipaddress.ip_address(first))
+    result = []
+    while len(result) < count:
+        ip = ipaddress.ip_address(address)
+        if ip.packed[-1] not in (0, 255):
+            result.append(str(ip))
+        address += 1
+    return result
+
+
+class FakeMiner:
+    """State and responses of a simulated miner."""
+
+    def __init__(self, ip, model_id, dead_chips=0.0, rng=random):
+        self.ip = ip
+        self.model_id = model_id
+        self.model = MODELS[model_id]
+        self.rng = rng
+        self.elapsed = rng.randint(60, 30 * 86400)
+        self.hash_rate = self.nominal_hash_rate()
+        # chip map of every chain, 'o' working, 'x' defective, '-' inactive
+        self.chains = []
+        for chips in str(self.model['chips']).split(','):
+            chain = ''.join('x' if rng.random() < dead_chips else 'o'
+                            for _ in range(int(chips)))
+            self.chains.append(chain)
+
+    def nominal_hash_rate(self):
+        """Hash rate of the description of the model, in the model unit."""
+        match = NOMINAL.search(self.model['description'])
+        if match is None:
+            return 100.0
+        value, prefix, _ = match.groups()
+        unit_prefix = re.match('[KMGTP]?', self.model['unit']).group()
+        shift = PREFIXES.index(prefix) - PREFIXES.index(unit_prefix)
+        return float(value) * 1000 ** shift
+
+    def stats(self):
+        stats = {
+            'STATS': 0,
+            'ID': 'BC50',
+            'Elapsed': self.elapsed,
+            'GHS 5s': '{:.2f}'.format(
+                self.hash_rate * self.rng.uniform(0.95, 1.05)),
+            'GHS av': self.hash_rate,
+            'miner_count': len(self.chains),
+            'fan_num': 2,
+            'fan1': 0,
+            'fan2': 0,
+            'fan3': self.rng.randint(5500, 6200),
+            'fan6': self.rng.randint(5500, 6200),
+            'temp_num': len(self.chains),
+        }
+        for i, chain in enumerate(self.chains, 6):
+            stats['temp{}'.format(i)] = self.rng.randint(50, 65)
+            stats['temp2_{}'.format(i)] = self.rng.randint(60, 78)
+            stats['chain_acn{}'.format(i)] = len(chain)
+            stats['chain_acs{}'.format(i)] = ' '.join(
+                chain[j:j + 8] for j in range(0, len(chain), 8))
+            stats['chain_hw{}'.format(i)] = self.rng.randint(0, 50)
+            stats['chain_rate{}'.format(i)] = '{:.2f}'.format(
+                self.hash_rate / len(self.chains))
+        return {
+            'STATUS': [{
+                'STATUS': 'S',
+                'When': 0,
+                'Code': 70,
+                'Msg': 'CGMiner stats',
+                'Description': 'cgminer 1.0.0'
+            }],
+            'STATS': [{
+                'BMMiner': '2.0.0',
+                'Miner': '16.8.1.3',
+                'Type': self.model_id
+            }, stats],
+            'id': 1
+        }
+
+    def pools(self):
+        return {
+            'STATUS': [{'STATUS': 'S', 'Msg': '1 Pool(s)'}],
+            'POOLS': [{
+                'POOL': 0,
+                'URL': 'stratum+tcp://pool.example.com:3333',
+                'Status': 'Alive',
+                'Stratum Active': True,
+                'User': 'worker.{}'.format(self.ip.replace('.', '_'))
+            }],
+            'id': 1
+        }
+
+    def summary(self):
+        return {
+            'STATUS': [{'STATUS': 'S', 'Msg': 'Summary'}],
+            'SUMMARY': [{
+                'Elapsed': self.elapsed,
+                'GHS 5s': self.hash_rate,
+                'Device Hardware%': round(self.rng.uniform(0, 0.01), 4)
+            }],
+            'id': 1
+        }
+
+    def respond(self, command, malformed=False):
+        """Encoded response of a (joined) command, NUL terminated."""
+        commands = command.split('+')
+        handlers = {'stats': self.stats, 'pools': self.pools,
+                    'summary': self.summary}
+        if any(c not in handlers for c in commands):
+            text = json.dumps({
+                'STATUS': [{'STATUS': 'E', 'Msg': 'Invalid command'}],
+                'id': 1
+            })
+        elif len(commands) > 1:
+            text = json.dumps({c: [handlers[c]()] for c in commands})
+        else:
+            text = json.dumps(handlers[command]())
+        if 'stats' in commands:
+            # bmminer forgets the comma between the two sections of `stats`
+            text = text.replace('}, {"STATS": 0', '}{"STATS": 0')
+        if malformed:
+            text = text[:len(text) // 2]
+        return text.encode() + b'\x00'
+
+
+class Simulator:
+    """
+    Serve a fleet of `FakeMiner` with asyncio.
+
+    :param latency: seconds before a miner answers
+    :param jitter: max random seconds added to the latency
+    :param timeouts: fraction of the requests that are never answered
+    :param malformed: fraction of the responses that are truncated
+    """
+
+    def __init__(self, miners, latency=0.0, jitter=0.0, timeouts=0.0,
+                 malformed=0.0, port=PORT, rng=random):
+        self.miners = miners
+        self.latency = latency
+        self.jitter = jitter
+        self.timeouts = timeouts
+        self.malformed = malformed
+        self.port = port
+        self.rng = rng
+        self.connections = 0
+        self.servers = []
+
+    async def handle(self, miner, reader, writer):
+        self.connections += 1
+        try:
+            request = await reader.read(4096)
+            if not request:
+                return
+            command = json.loads(request.decode())['command']
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if self.rng.random() < self.timeouts:
+                # hang until the client gives up
+                delay = 3600
+            await asyncio.sleep(delay)
+            writer.write(
+                miner.respond(command, self.rng.random() < self.malformed))
+            await writer.drain()
+        except (ConnectionError, ValueError, KeyError):
+            pass
+        except asyncio.CancelledError:
+            # the simulator is shutting down with requests still hanging
+            pass
+        finally:
+            writer.close()
+
+    async def start(self):
+        for miner in self.miners:
+            server = await asyncio.start_server(
+                lambda r, w, miner=miner: self.handle(miner, r, w),
+                miner.ip, self.port, reuse_address=True)
+            self.servers.append(server)
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+
+def fleet(count, models=None, dead_chips=0.0, seed=0):
+    """`count` fake miners of `models` (default: every model) in turn."""
+    rng = random.Random(seed)
+    models = models or list(MODELS)
+    return [
+        FakeMiner(ip, models[i % len(models)], dead_chips, rng)
+        for i, ip in enumerate(addresses(count))
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--miners', type=int, default=100)
+    parser.add_argument('--model', action='append', choices=list(MODELS),
+                        help="can be repeated, default: every model")
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--timeouts', type=float, default=0.0)
+    parser.add_argument('--malformed', type=float, default=0.0)
+    parser.add_argument('--dead-chips', type=float, default=0.0)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+
+    miners = fleet(args.miners, args.model, args.dead_chips)
+    simulator = Simulator(miners, args.latency, args.jitter, args.timeouts,
+                          args.malformed, args.port)
+    for miner in miners:
+        print("{},{}".format(miner.ip, miner.model_id))
+
+    async def serve():
+        await simulator.start()
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -7,7 +7,8 @@ load_dotenv(os.path.join(basedir, '.env'))
 
 import json
 
-with open("config/models.json", "r") as json_data:
+# the absolute path, so the app can be started from any directory
+with open(os.path.join(basedir, 'config/models.json'), "r") as json_data:
     models = json.load(json_data)
 
 MODELS = models
@@ -16,6 +17,221 @@ import multiprocessing as m
 
 NUM_THREADS = m.cpu_count() - 1 or 1
 
+# Background poller
+POLLER_ENABLED = True
+# seconds between two polls of a miner, per priority: 'high' for the miners
+# with warnings or errors or that rebooted in the last hour, the user-set
+# priority of a miner is a 'priority:<low|normal|high>' tag in its remarks
+POLL_INTERVAL = 30  # 'normal', also the interval of the stored samples
+POLL_INTERVAL_HIGH = 10
+POLL_INTERVAL_LOW = 120
+# priority per model id, e.g. {'Antminer L3+': 'low'}
+POLL_PRIORITIES = {}
+POLL_TICK = 5  # min seconds between two looks at the due miners
+# max polls (one batch of RPCs to a miner) started per second, 0 for no limit
+POLL_MAX_RPS = 0
+POLL_FIRST_TIMEOUT = 30  # max seconds a request waits for the first cycle
+# poll with the asyncio client instead of a pool of NUM_THREADS threads
+POLL_ASYNC = True
+POLL_MAX_CONCURRENCY = 256  # max miners polled at the same time
+# max miners of a /24 subnet polled at the same time, 0 for no limit
+POLL_SUBNET_CONCURRENCY = 32
+# per-command cgminer RPC timeouts in seconds, the ceiling of the adaptive
+# timeouts derived from the round-trip time of every miner
+CGMINER_TIMEOUTS = {'stats': 2, 'pools': 1, 'summary': 1}
+POLL_MIN_TIMEOUT = 0.25  # floor of the adaptive timeouts, in seconds
+# skip a miner after this many failed polls in a row, for POLL_BACKOFF
+# seconds doubled after every failed retry up to POLL_MAX_BACKOFF
+POLL_BREAKER_THRESHOLD = 3
+POLL_BACKOFF = 60
+POLL_MAX_BACKOFF = 900
+# poll once for all the processes of the app (e.g. the gunicorn workers):
+# one of them polls and shares every snapshot with the others in this file,
+# in memory (tmpfs): the RuntimeDirectory of the systemd service, else
+# /dev/shm, so the SD card is not written on every poll
+SHARED_SNAPSHOT = True
+if os.environ.get('RUNTIME_DIRECTORY'):
+    SHARED_SNAPSHOT_PATH = os.path.join(
+        os.environ['RUNTIME_DIRECTORY'].split(':')[0], 'snapshot.json')
+elif os.path.isdir('/dev/shm'):
+    SHARED_SNAPSHOT_PATH = '/dev/shm/antminermonitor-snapshot.json'
+else:
+    SHARED_SNAPSHOT_PATH = os.path.join(basedir,
+                                        'antminermonitor/db/snapshot.json')
+SHARED_SNAPSHOT_CHECK_INTERVAL = 1  # seconds between two checks of the file
+
+# Alert rules, evaluated on every polled miner after each poll cycle. See
+# `AlertRule` in antminermonitor/blueprints/asicminer/alerts.py for the keys
+# of a rule. Add a rule of the same name with `models` or `miners` to
+# override a rule for some models or miners.
+ALERT_RULES = [
+    {
+        'name': 'defective_chips',
+        'metric': 'chips_x',
+        'op': '>',
+        'threshold': 0,
+        'level': 'warning',
+        'message': "[WARNING] '{value}' chips are defective on miner '{ip}'.",
+    },
+    {
+        'name': 'missing_chips',
+        'metric': 'chips_missing',
+        'op': '>',
+        'threshold': 0,
+        'level': 'error',
+        'message': ("[ERROR] ASIC chips are missing from miner '{ip}'. Your "
+                    "Antminer '{model_id}' has '{chips_found}/{chips_total} "
+                    "chips'."),
+    },
+    {
+        'name': 'dead_hashboards',
+        'metric': 'chains_down',
+        'op': '>',
+        'threshold': 0,
+        'level': 'error',
+        'message': ("[ERROR] '{value}/{chains_total}' hashboards of miner "
+                    "'{ip}' are down. Chains with working chips: "
+                    "'{chains_up}'."),
+    },
+    {
+        'name': 'missing_temperatures',
+        'metric': 'temp_count',
+        'op': '==',
+        'threshold': 0,
+        'level': 'error',
+        'message': "[ERROR] Could not retrieve temperatures from miner '{ip}'.",
+    },
+    {
+        'name': 'high_temperature',
+        'metric': 'temp_max',
+        'op': '>=',
+        'threshold': 80,
+        # the `temperature_alert` setting of `manage.py create-db`
+        'setting': 'temperature_alert',
+        'hysteresis': 3,
+        'for': 60,
+        'level': 'warning',
+        'message': "[WARNING] High temperatures on miner '{ip}'.",
+    },
+    {
+        'name': 'low_fan_speed',
+        'metric': 'fan_min',
+        'op': '<',
+        'threshold': 1000,
+        'for': 60,
+        'level': 'warning',
+        'message': ("[WARNING] Fan speed of miner '{ip}' is {value} rpm, "
+                    "below {threshold} rpm."),
+    },
+    {
+        'name': 'hash_rate_drop',
+        # percent below the rolling baseline of the miner
+        'metric': 'hash_rate_drop',
+        'op': '>=',
+        'threshold': 20,
+        'hysteresis': 10,
+        'for': 120,
+        'level': 'warning',
+        'message': ("[WARNING] Hashrate of miner '{ip}' is {value:.0f}% below "
+                    "its baseline."),
+    },
+    {
+        'name': 'hw_error_rate',
+        'metric': 'hw_error_rate',
+        'op': '>=',
+        'threshold': 1,
+        'for': 300,
+        'level': 'warning',
+        'message': "[WARNING] HW error rate of miner '{ip}' is {value}%.",
+    },
+    {
+        'name': 'reboot',
+        'metric': 'rebooted',
+        'op': '==',
+        'threshold': 1,
+        'level': 'warning',
+        'message': "[WARNING] Miner '{ip}' rebooted.",
+    },
+]
+# weight of the latest hash rate in the rolling baseline of every miner
+ALERT_BASELINE_ALPHA = 0.1
+ALERT_RELOAD_INTERVAL = 300  # seconds between two reads of the settings
+
+# Live dashboard updates
+LIVE_HISTORY = 20  # poll cycles a reconnecting browser can catch up with
+DASHBOARD_MAX_ALERTS = 50  # max distinct messages in the alert panel
+
+# gzip (or brotli when installed) the responses of at least COMPRESS_MIN_SIZE
+# bytes, streams and files are sent as they are
+COMPRESS_ENABLED = True
+COMPRESS_LEVEL = 6
+COMPRESS_MIN_SIZE = 500
+
+# Cache of the /<ip>/<command> JSON endpoints
+CGMINER_CACHE_SIZE = 1024  # max cached responses, least recently used first
+CGMINER_CACHE_TTLS = {'summary': 5, 'pools': 30, 'stats': 5}  # seconds
+
+# Time-series of the polled metrics
+METRICS_ENABLED = True
+METRICS_FLUSH_INTERVAL = 60  # seconds between two batched writes
+# seconds to keep the samples of each resolution (0 means raw samples)
+METRICS_RETENTION = {
+    0: 86400,  # 1 day
+    60: 7 * 86400,  # 1 week
+    3600: 90 * 86400,  # 3 months
+    86400: 5 * 365 * 86400,  # 5 years
+}
+
+# Changes of the chip maps of the hashboards, see chains.py
+CHAIN_EVENTS_ENABLED = True
+CHAIN_EVENTS_RETENTION = 90 * 86400  # seconds, 3 months
+
+# Prometheus exporter. Scrapers authenticate with 'Authorization: Bearer
+# <METRICS_TOKEN>'; without a token only logged in users can read /metrics
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+# Bearer token of the /api endpoints for scripts, same rules as above
+API_TOKEN = os.environ.get('API_TOKEN')
+
+# Multi-node polling. 'standalone' polls the whole fleet; 'agent' polls
+# its shard of the Miner table (`python manage.py agent`) and pushes the
+# snapshots to the aggregator at AGGREGATOR_URL; 'aggregator' polls nothing
+# and serves the merged snapshots of its agents
+POLL_MODE = os.environ.get('POLL_MODE') or 'standalone'
+AGENT_ID = os.environ.get('AGENT_ID')  # default: the host name
+# the shard of an agent: miners in one of the subnets, whose remarks contain
+# one of the tags and that the consistent hash over AGENT_PEERS assigns to
+# AGENT_ID; an empty criterion matches every miner
+AGENT_SUBNETS = [
+    s.strip() for s in (os.environ.get('AGENT_SUBNETS') or '').split(',')
+    if s.strip()
+]
+AGENT_TAGS = [
+    t.strip() for t in (os.environ.get('AGENT_TAGS') or '').split(',')
+    if t.strip()
+]
+AGENT_PEERS = [
+    p.strip() for p in (os.environ.get('AGENT_PEERS') or '').split(',')
+    if p.strip()
+]
+AGGREGATOR_URL = os.environ.get('AGGREGATOR_URL')
+# Bearer token of the agents, the same on the agents and the aggregator
+AGENT_TOKEN = os.environ.get('AGENT_TOKEN')
+AGENT_BUFFER_SIZE = 1000  # snapshots kept while the aggregator is down
+AGENT_BATCH_SIZE = 20  # snapshots per request to the aggregator
+AGENT_RETRY_INTERVAL = 10  # seconds between two attempts to replay
+AGENT_STALE_AFTER = 120  # seconds without a snapshot before an agent is down
+# bytes of a batch of snapshots once decompressed, larger ones get a 413
+AGENT_MAX_BATCH_SIZE = 64 * 1024 * 1024
+# the aggregator keeps the snapshots of its agents in memory and must run in
+# a single process (e.g. gunicorn --workers 1): the others fail to start on
+# this lock
+AGGREGATOR_LOCK_PATH = SHARED_SNAPSHOT_PATH + '.aggregator.lock'
+
+# Miner discovery
+DISCOVERY_MAX_HOSTS = 65536  # max IP addresses scanned by a single job
+DISCOVERY_MAX_CONCURRENCY = 256  # max IP addresses probed at the same time
+DISCOVERY_PROBE_TIMEOUT = 0.5  # seconds to wait for the cgminer API port
+
 __VERSION__ = '0.5.0'
 
 DEBUG = True
@@ -27,6 +243,18 @@ SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(64)
 SQLALCHEMY_DATABASE_URI = 'sqlite:///' + \
     os.path.join(basedir, 'antminermonitor/db/app.db')
 SQLALCHEMY_TRACK_MODIFICATIONS = False
+# Readers never wait for the writer (poller, time-series, alerts) in WAL
+# mode, and NORMAL only syncs at checkpoints: a power cut loses at most the
+# last transactions, never the database, and the SD card is written less
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -16000,  # KiB
+    'mmap_size': 64 * 1024 * 1024,  # bytes
+}
+SQLITE_POOL_SIZE = NUM_THREADS + 4  # connections kept open per process
+SQLITE_BUSY_TIMEOUT = 30  # seconds a writer waits for another writer
 
 # Session
 #USE_SESSION_FOR_NEXT = True
@@ -37,7 +265,23 @@ MAIL_PORT = int(os.environ.get('MAIL_PORT') or 25)
 MAIL_USE_TLS = os.environ.get('MAIL_USE_TLS') is not None
 MAIL_USERNAME = os.environ.get('MAIL_USERNAME')
 MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
+MAIL_SENDER = os.environ.get('MAIL_SENDER')
+# comma separated addresses that receive the alerts by email
+MAIL_RECIPIENTS = [
+    r.strip() for r in (os.environ.get('MAIL_RECIPIENTS') or '').split(',')
+    if r.strip()
+]
 
 # TELEGRAM
 TELEGRAM_BOT_TOKEN = ""
 TELEGRAM_CHAT_ID = ""
+TELEGRAM_API_URL = os.environ.get('TELEGRAM_API_URL') or \
+    'https://api.telegram.org'
+
+# Notifications
+NOTIFY_INTERVAL = 60  # seconds to coalesce alerts into a single message
+NOTIFY_RATE_LIMIT = 3600  # seconds before the same alert is sent again
+NOTIFY_MAX_RETRIES = 3
+NOTIFY_BACKOFF = 5  # seconds before the first retry, doubled every retry
+# also notify the errors of the miners that could not be polled
+NOTIFY_INACTIVE = False
@@ -20,18 +20,98 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import asyncio
 import socket
 import json
 import sys
 
+try:
+    # faster JSON decoder, used when installed
+    from orjson import loads as _loads
+except ImportError:
+    from json import loads as _loads
+
+# default timeout, in seconds, of a single RPC call
+DEFAULT_TIMEOUT = 1
+# initial size of the receive buffer, doubled as needed
+RECEIVE_BUFFER_SIZE = 65536
+# max size of a response of the asyncio client
+MAX_RESPONSE_SIZE = 2**24
+
+
+def _error(description):
+    return dict({'STATUS': [{'STATUS': 'error', 'description': "{}".format(description)}]})
+
+
+def _split(commands, response):
+    """ Split the response of a joined command, e.g. `stats+pools`, which
+    looks like `{"stats": [{...}], "pools": [{...}]}`, into one response
+    per command. If the miner did not answer with a joined response (an
+    error or a firmware without support for joined commands) every command
+    gets the whole response.
+    """
+    sections = {}
+    for command in commands:
+        try:
+            sections[command] = response[command][0]
+        except (KeyError, IndexError, TypeError):
+            sections[command] = response
+    return sections
+
+
+def _timeout_for(timeout, command):
+    """ Timeout of a command, `timeout` being a number of seconds or a dict
+    of per-command timeouts. A joined command gets the longest timeout of
+    its commands.
+    """
+    if isinstance(timeout, dict):
+        return max(timeout.get(c, DEFAULT_TIMEOUT) for c in command.split('+'))
+    return timeout
+
+
+def _repair(received, error):
+    """ Add a missing comma between two objects, i.e. `}{` becomes `},{`,
+    where decoding failed. If the position of the error does not point at a
+    `}{` (non-ASCII text before it), every `}{` is repaired.
+    """
+    position = getattr(error, 'pos', None)
+    if position is not None and received[position - 1:position + 1] == b'}{':
+        return received[:position] + b',' + received[position:]
+    if b'}{' in received:
+        return received.replace(b'}{', b'},{')
+    raise error
+
+
+def _decode(received):
+    """ Decode a response received without its null byte terminator. """
+    try:
+        # bmminer omits the comma before the second section of `stats`
+        received = received.replace(b'}{"STATS"', b'},{"STATS"')
+        # any other missing comma is repaired where decoding fails
+        for _ in range(received.count(b'}{') + 1):
+            try:
+                return _loads(received)
+            except ValueError as e:
+                received = _repair(received, e)
+        return _loads(received)
+    except Exception as e:
+        return _error(e)
+
 
 class CgminerAPI(object):
-    """ Cgminer RPC API wrapper. """
+    """ Cgminer RPC API wrapper.
+
+    `timeout` is either a number of seconds or a dict of per-command timeouts.
+    """
 
-    def __init__(self, host='localhost', port=4028):
+    def __init__(self, host='localhost', port=4028, timeout=DEFAULT_TIMEOUT):
         self.data = {}
         self.host = host
         self.port = port
+        self.timeout = timeout
+
+    def timeout_for(self, command):
+        return _timeout_for(self.timeout, command)
 
     def command(self, command, arg=None):
         """ Initialize a socket connection,
@@ -39,7 +119,7 @@ class CgminerAPI(object):
         receive the response (and decode it).
         """
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.settimeout(1)
+        sock.settimeout(self.timeout_for(command))
 
         try:
             sock.connect((self.host, self.port))
@@ -54,32 +134,47 @@ class CgminerAPI(object):
                 sock.send(bytes(json.dumps(payload), 'utf-8'))
             received = self._receive(sock)
         except Exception as e:
-            return dict({'STATUS': [{'STATUS': 'error', 'description': "{}".format(e)}]})
+            return _error(e)
         else:
-            # the null byte makes json decoding unhappy
-            # also add a comma on the output of the `stats` command by
-            # replacing '}{' with '},{'
-            try:
-                return json.loads(received[:-1].replace('}{', '},{'))
-            except Exception as e:
-                return dict({'STATUS': [{'STATUS': 'error', 'description': "{}".format(e)}]})
+            return _decode(received)
         finally:
             # sock.shutdown(socket.SHUT_RDWR)
             sock.close()
 
-    def _receive(self, sock, size=4096):
-        msg = ''
+    def multi_command(self, *commands):
+        """ Send several commands joined with '+' over a single connection
+        and return a dict with the response of each command.
+
+        >>> cgminer = CgminerAPI()
+        >>> cgminer.multi_command('stats', 'pools', 'summary')['pools']
+
+        """
+        return _split(commands, self.command('+'.join(commands)))
+
+    def _receive(self, sock, size=RECEIVE_BUFFER_SIZE):
+        """ Receive a response into a single buffer, up to the null byte
+        that ends it (or until the miner closes the connection).
+        """
+        buffer = bytearray(size)
+        length = 0
         while 1:
-            chunk = sock.recv(size)
-            if chunk:
-                if sys.version_info.major == 2:
-                    msg += chunk
-                if sys.version_info.major == 3:
-                    msg += chunk.decode('utf-8')
-            else:
+            if length == len(buffer):
+                buffer.extend(bytearray(len(buffer)))
+            view = memoryview(buffer)
+            try:
+                received = sock.recv_into(view[length:])
+            finally:
+                view.release()
+            if not received:
                 # end of message
                 break
-        return msg
+            end = buffer.find(b'\x00', length, length + received)
+            length += received
+            if end != -1:
+                length = end
+                break
+        del buffer[length:]
+        return buffer
 
     def __getattr__(self, attr):
         """ Allow us to make command calling methods.
@@ -95,31 +190,165 @@ class CgminerAPI(object):
         return out
 
 
-def get_summary(ip):
-    cgminer = CgminerAPI(host=ip)
+class AsyncCgminerAPI(object):
+    """ Cgminer RPC API wrapper for asyncio.
+
+    Exposes the same command surface as `CgminerAPI` but every command is a
+    coroutine. An optional `asyncio.Semaphore` bounds the number of
+    connections in flight across all the clients that share it, and
+    `timeout` is either a number of seconds or a dict of per-command timeouts.
+    """
+
+    def __init__(self, host='localhost', port=4028, timeout=DEFAULT_TIMEOUT,
+                 semaphore=None):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.semaphore = semaphore
+
+    def timeout_for(self, command):
+        return _timeout_for(self.timeout, command)
+
+    async def command(self, command, arg=None):
+        """ Open a connection, send a command (a json encoded dict) and
+        receive the response (and decode it) within the command's timeout.
+        """
+        if self.semaphore is None:
+            return await self._command(command, arg)
+        async with self.semaphore:
+            return await self._command(command, arg)
+
+    async def multi_command(self, *commands):
+        """ Send several commands joined with '+' over a single connection
+        and return a dict with the response of each command.
+        """
+        return _split(commands, await self.command('+'.join(commands)))
+
+    async def _command(self, command, arg=None):
+        payload = {"command": command}
+        if arg is not None:
+            # Parameter must be converted to basestring (no int)
+            payload.update({'parameter': arg})
+        try:
+            # one timeout for the connection, the command and the response
+            received = await asyncio.wait_for(self._exchange(payload),
+                                              self.timeout_for(command))
+        except asyncio.TimeoutError:
+            return _error("timed out")
+        except Exception as e:
+            return _error(e)
+        else:
+            return _decode(received)
+
+    async def _exchange(self, payload):
+        """ Connect, send the command and receive the response, then close
+        the connection, at once if the command failed or timed out.
+        """
+        reader, writer = await asyncio.open_connection(
+            self.host, self.port, limit=MAX_RESPONSE_SIZE)
+        done = False
+        try:
+            writer.write(bytes(json.dumps(payload), 'utf-8'))
+            await writer.drain()
+            received = await self._receive(reader)
+            done = True
+            return received
+        finally:
+            if done:
+                writer.close()
+            else:
+                writer.transport.abort()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _receive(self, reader):
+        """ Receive a response up to the null byte that ends it (or until
+        the miner closes the connection).
+        """
+        try:
+            return (await reader.readuntil(b'\x00'))[:-1]
+        except asyncio.IncompleteReadError as e:
+            return e.partial
+
+    def __getattr__(self, attr):
+        """ Allow us to make command calling coroutines.
+
+        >>> cgminer = AsyncCgminerAPI()
+        >>> await cgminer.summary()
+
+        """
+
+        async def out(arg=None):
+            return await self.command(attr, arg)
+
+        return out
+
+
+def get_summary(ip, timeout=DEFAULT_TIMEOUT):
+    cgminer = CgminerAPI(host=ip, timeout=timeout)
     output = cgminer.summary()
     output.update({"IP": ip})
     return dict(output)
 
 
-def get_pools(ip):
-    cgminer = CgminerAPI(host=ip)
+def get_pools(ip, timeout=DEFAULT_TIMEOUT):
+    cgminer = CgminerAPI(host=ip, timeout=timeout)
     output = cgminer.pools()
     output.update({"IP": ip})
     return dict(output)
 
 
-def get_stats(ip):
-    cgminer = CgminerAPI(host=ip)
+def get_stats(ip, timeout=DEFAULT_TIMEOUT):
+    cgminer = CgminerAPI(host=ip, timeout=timeout)
     output = cgminer.stats()
     output.update({"IP": ip})
     return dict(output)
 
 
+def get_multi(ip, *commands, timeout=DEFAULT_TIMEOUT):
+    cgminer = CgminerAPI(host=ip, timeout=timeout)
+    output = cgminer.multi_command(*commands)
+    for section in output.values():
+        section.update({"IP": ip})
+    return output
+
+
+async def async_get_summary(ip, semaphore=None, timeout=DEFAULT_TIMEOUT):
+    cgminer = AsyncCgminerAPI(host=ip, timeout=timeout, semaphore=semaphore)
+    output = await cgminer.summary()
+    output.update({"IP": ip})
+    return dict(output)
+
+
+async def async_get_pools(ip, semaphore=None, timeout=DEFAULT_TIMEOUT):
+    cgminer = AsyncCgminerAPI(host=ip, timeout=timeout, semaphore=semaphore)
+    output = await cgminer.pools()
+    output.update({"IP": ip})
+    return dict(output)
+
+
+async def async_get_stats(ip, semaphore=None, timeout=DEFAULT_TIMEOUT):
+    cgminer = AsyncCgminerAPI(host=ip, timeout=timeout, semaphore=semaphore)
+    output = await cgminer.stats()
+    output.update({"IP": ip})
+    return dict(output)
+
+
+async def async_get_multi(ip, *commands, semaphore=None,
+                          timeout=DEFAULT_TIMEOUT):
+    cgminer = AsyncCgminerAPI(host=ip, timeout=timeout, semaphore=semaphore)
+    output = await cgminer.multi_command(*commands)
+    for section in output.values():
+        section.update({"IP": ip})
+    return output
+
+
 if __name__ == '__main__':
-    L3 = CgminerAPI(host='192.168.1.103')
-    print(L3.stats())
-    S7 = CgminerAPI(host='192.168.1.107')
-    print(S7.stats())
-    S9 = CgminerAPI(host='192.168.1.109')
-    print(S9.stats())
+    # e.g. python lib/pycgminer.py 127.0.1.1 stats+pools
+    if len(sys.argv) < 2:
+        sys.exit("usage: {} host [command]".format(sys.argv[0]))
+    host = sys.argv[1]
+    command = sys.argv[2] if len(sys.argv) > 2 else 'stats'
+    print(json.dumps(CgminerAPI(host=host).command(command), indent=4))
@@ -0,0 +1,38 @@
+import hmac
+from functools import wraps
+
+from flask import Response, current_app, request
+from flask_login import current_user
+
+
+def token_or_login_required(config_key):
+    """
+    Allow the request if it carries the header 'Authorization: Bearer
+    <token>' where <token> is the value of the setting `config_key`, or if
+    the user is logged in. Used by the endpoints meant for scrapers and
+    scripts, which cannot go through the login form. Like `login_required`,
+    it allows every request when the setting `LOGIN_DISABLED` is set.
+
+    :param config_key: Name of the setting that holds the token
+    :type config_key: str
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if current_app.config.get('LOGIN_DISABLED'):
+                return view(*args, **kwargs)
+            token = current_app.config.get(config_key)
+            if token:
+                expected = 'Bearer {}'.format(token)
+                given = request.headers.get('Authorization', '')
+                if hmac.compare_digest(given.encode(), expected.encode()):
+                    return view(*args, **kwargs)
+            if current_user.is_authenticated:
+                return view(*args, **kwargs)
+            return Response('Unauthorized\n', 401,
+                            {'WWW-Authenticate': 'Bearer'})
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class _Call:
+    """A call in flight, shared by every caller of the same key."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe, size-bounded cache with a TTL per entry and LRU eviction.
+
+    `get_or_call` collapses concurrent misses of the same key into a single
+    call (single-flight): the first caller runs the function while the
+    others wait for its result.
+
+    Example:
+        ```
+        cache = TTLCache(maxsize=1024)
+        value, age = cache.get_or_call(('10.0.0.1', 'stats'),
+                                       lambda: get_stats('10.0.0.1'), ttl=5)
+        ```
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        # key => (expires, stored, value), least recently used first
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        :return: (value, age in seconds) or None if missing or expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, stored, value = entry
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value, now - stored
+
+    def set(self, key, value, ttl):
+        now = time.monotonic()
+        with self._lock:
+            self._entries[key] = (now + ttl, now, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_call(self, key, function, ttl):
+        """
+        Return the cached value of `key` or call `function` to get it.
+
+        :return: (value, age in seconds)
+        """
+        cached = self.get(key)
+        if cached is not None:
+            self.hits += 1
+            return cached
+
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            self.hits += 1
+            if call.error is not None:
+                raise call.error
+            return call.value, 0
+
+        self.misses += 1
+        try:
+            call.value = function()
+            self.set(key, call.value, ttl)
+            return call.value, 0
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
@@ -0,0 +1,83 @@
+import gzip
+
+from flask import request
+
+try:
+    # optional, better compression than gzip for the same CPU
+    import brotli
+except ImportError:
+    brotli = None
+
+# the encodings that can be sent, the best first
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip', )
+
+
+def compress(data, encoding, level=6):
+    """Compress `data` (bytes) with 'br' or 'gzip'."""
+    if encoding == 'br':
+        # brotli levels go up to 11, gzip ones up to 9
+        return brotli.compress(data, quality=min(level, 11))
+    return gzip.compress(data, compresslevel=min(level, 9))
+
+
+class Compressor:
+    """
+    Compress the responses of a Flask app with brotli (when installed) or
+    gzip, whichever the client accepts, e.g. the dashboard and the JSON of
+    the API, a fraction of their size once compressed.
+
+    Streamed responses (Server-Sent Events, NDJSON), files and the responses
+    smaller than `min_size` bytes are sent as they are. A view can send its
+    own compressed body, e.g. cached with the rest of the page, see
+    `encoding()`.
+    """
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.level = 6
+        self.min_size = 500
+        self.mimetypes = {
+            'text/html', 'text/css', 'text/plain', 'text/csv',
+            'application/json', 'application/javascript'
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('COMPRESS_ENABLED', self.enabled)
+        self.level = app.config.get('COMPRESS_LEVEL', self.level)
+        self.min_size = app.config.get('COMPRESS_MIN_SIZE', self.min_size)
+        self.mimetypes = set(
+            app.config.get('COMPRESS_MIMETYPES', self.mimetypes))
+        app.after_request(self.after_request)
+        app.extensions['compress'] = self
+
+    def encoding(self, size=None):
+        """
+        The encoding to send a response of `size` bytes in to the client of
+        the current request, None to send it as it is.
+        """
+        if not self.enabled or (size is not None and size < self.min_size):
+            return None
+        return request.accept_encodings.best_match(ENCODINGS)
+
+    def compress(self, data, encoding):
+        return compress(data, encoding, self.level)
+
+    def after_request(self, response):
+        if response.status_code < 200 or response.status_code in (204, 304) \
+                or response.is_streamed or response.direct_passthrough \
+                or 'Content-Encoding' in response.headers \
+                or response.mimetype not in self.mimetypes:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding(response.content_length)
+        if encoding is None:
+            return response
+        response.set_data(self.compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+
+compressor = Compressor()
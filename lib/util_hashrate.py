@@ -1,22 +1,45 @@
+from math import frexp
+
 # Update from one unit to the next if the value is greater than 1024.
-# e.g. update_unit_and_value(1024, "GH/s") => (1, "TH/s")
+# e.g. update_unit_and_value(1024, "GH/s") => (1024, "GH/s")
+#      update_unit_and_value(2048, "GH/s") => (2, "TH/s")
+
+# the units of each kind of hash rate, 1024 times larger each
+UNITS = (
+    ('H/s', 'KH/s', 'MH/s', 'GH/s', 'TH/s', 'PH/s', 'EH/s'),
+    ('Sol/s', 'KSol/s', 'MSol/s', 'GSol/s'),
+)
+# unit => (units of its kind, index of the unit, max number of steps up)
+UNIT_TABLE = {
+    unit: (units, index, len(units) - 1 - index)
+    for units in UNITS for index, unit in enumerate(units)
+}
+FACTORS = tuple(1024.0**steps for steps in range(max(map(len, UNITS))))
 
 
 def update_unit_and_value(value, unit):
-    while value > 1024:
-        value = value / 1024.0
-        if unit == 'MH/s':
-            unit = 'GH/s'
-        elif unit == 'GH/s':
-            unit = 'TH/s'
-        elif unit == 'TH/s':
-            unit = 'PH/s'
-        elif unit == 'PH/s':
-            unit = 'EH/s'
-        elif unit == 'KSol/s':
-            unit = 'MSol/s'
-        elif unit == 'MSol/s':
-            unit = 'GSol/s'
-        else:
-            assert False, "Unsupported unit: {}".format(unit)
-    return (value, unit)
+    if value <= 1024:
+        return (value, unit)
+    try:
+        units, index, max_steps = UNIT_TABLE[unit]
+    except KeyError:
+        raise ValueError("Unsupported unit: {}".format(unit))
+    # number of times the value is greater than 1024, from its exponent, up
+    # to the largest unit of its kind
+    steps = min((frexp(value)[1] - 1) // 10, max_steps)
+    if value <= FACTORS[steps]:
+        steps -= 1
+    return (value / FACTORS[steps], units[index + steps])
+
+
+def to_base_unit(value, unit):
+    """
+    Convert to the smallest unit of its kind, so that the hash rates of
+    models in different units add up.
+    e.g. to_base_unit(2, "KH/s") => (2048.0, "H/s")
+    """
+    try:
+        units, index, _ = UNIT_TABLE[unit]
+    except KeyError:
+        raise ValueError("Unsupported unit: {}".format(unit))
+    return (value * FACTORS[index], units[0])
@@ -1,9 +1,17 @@
+import logging
+import smtplib
+import threading
+import time
 import traceback
-
-import requests
+from collections import OrderedDict
+from email.message import EmailMessage
 
 from config.settings import TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID
 
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API_URL = "https://api.telegram.org"
+
 
 def notify_telegram(message: str):
     """
@@ -26,13 +34,272 @@ def notify_telegram(message: str):
     """
     try:
         if TELEGRAM_BOT_TOKEN and TELEGRAM_CHAT_ID and message:
-            payload = {
-                "chat_id": TELEGRAM_CHAT_ID,
-                "text": message,
-            }
-            requests.post(
-                url=
-                f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage",
-                data=payload)
+            TelegramBackend(TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID).send(message)
     except Exception as e:
         traceback.print_exception(type(e), e, e.__traceback__)
+
+
+class TelegramBackend:
+    """
+    Send notifications to a Telegram chat using the Telegram Bot API.
+
+    Args:
+        token (str): The token of the bot.
+        chat_id (str): The chat the bot posts to.
+        api_url (str): The base URL of the Bot API, e.g. a local stub server.
+        timeout (float): Seconds to wait for the API to answer.
+    """
+    # Telegram rejects messages longer than 4096 characters
+    max_length = 4096
+
+    def __init__(self, token, chat_id, api_url=TELEGRAM_API_URL, timeout=10):
+        self.token = token
+        self.chat_id = chat_id
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+
+    def __repr__(self):
+        return "TelegramBackend(chat_id='{}')".format(self.chat_id)
+
+    def send(self, message: str):
+        # imported on the first message, it slows down the start of the app
+        import requests
+
+        for text in self.split(message):
+            response = requests.post(
+                url=f"{self.api_url}/bot{self.token}/sendMessage",
+                data={
+                    "chat_id": self.chat_id,
+                    "text": text,
+                },
+                timeout=self.timeout)
+            response.raise_for_status()
+
+    def split(self, message: str):
+        """
+        Split a message longer than `max_length` into several ones, at line
+        boundaries unless a line is longer than that on its own.
+        """
+        parts = []
+        part = ""
+        for line in message.split("\n"):
+            while len(line) > self.max_length:
+                if part:
+                    parts.append(part)
+                    part = ""
+                parts.append(line[:self.max_length])
+                line = line[self.max_length:]
+            if part and len(part) + 1 + len(line) > self.max_length:
+                parts.append(part)
+                part = line
+            else:
+                part = part + "\n" + line if part else line
+        if part:
+            parts.append(part)
+        return parts
+
+
+class SMTPBackend:
+    """
+    Send notifications by email.
+
+    Args:
+        server (str): The SMTP server.
+        port (int): The port of the SMTP server.
+        sender (str): The address of the sender.
+        recipients (list): The addresses of the recipients.
+        use_tls (bool): Whether to upgrade the connection with STARTTLS.
+        username (str): The username, if the server requires a login.
+        password (str): The password, if the server requires a login.
+        timeout (float): Seconds to wait for the server to answer.
+    """
+
+    def __init__(self, server, port=25, sender=None, recipients=(),
+                 use_tls=False, username=None, password=None, timeout=10,
+                 subject="[AntminerMonitor] Alerts"):
+        self.server = server
+        self.port = port
+        self.sender = sender or username
+        self.recipients = list(recipients)
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.subject = subject
+
+    def __repr__(self):
+        return "SMTPBackend(server='{}:{}')".format(self.server, self.port)
+
+    def send(self, message: str):
+        email = EmailMessage()
+        email['Subject'] = self.subject
+        email['From'] = self.sender
+        email['To'] = ', '.join(self.recipients)
+        email.set_content(message)
+
+        with smtplib.SMTP(self.server, self.port,
+                          timeout=self.timeout) as smtp:
+            if self.use_tls:
+                smtp.starttls()
+            if self.username and self.password:
+                smtp.login(self.username, self.password)
+            smtp.send_message(email)
+
+
+class NotificationDispatcher:
+    """
+    Queue notifications and send them from a background thread.
+
+    All the notifications queued during `interval` seconds are coalesced
+    into a single message per backend, split at line boundaries if it is
+    longer than the backend accepts. A notification is dropped if another
+    one with the same key was queued less than `rate_limit` seconds ago, so
+    a condition that persists for many poll cycles is only reported once in
+    a while. A message that could not be sent is retried up to `max_retries`
+    times with exponential backoff starting at `backoff` seconds.
+
+    Example:
+        ```
+        notifier = NotificationDispatcher([TelegramBackend(token, chat_id)])
+        notifier.notify("[ERROR] Miner '10.0.0.1' is down", key=('10.0.0.1',
+                                                                 'down'))
+        ```
+    """
+
+    def __init__(self, backends=None, interval=60, rate_limit=3600,
+                 max_retries=3, backoff=5):
+        self.backends = list(backends or [])
+        self.interval = interval
+        self.rate_limit = rate_limit
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._queue = []
+        # key => time it was last queued, oldest first
+        self._sent = OrderedDict()
+        # (due time, attempt, backend, message)
+        self._retries = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def init_app(self, app):
+        """Configure the backends from the settings of a Flask app."""
+        config = app.config
+        self.interval = config.get('NOTIFY_INTERVAL', self.interval)
+        self.rate_limit = config.get('NOTIFY_RATE_LIMIT', self.rate_limit)
+        self.max_retries = config.get('NOTIFY_MAX_RETRIES', self.max_retries)
+        self.backoff = config.get('NOTIFY_BACKOFF', self.backoff)
+
+        self.backends = []
+        if config.get('TELEGRAM_BOT_TOKEN') and config.get('TELEGRAM_CHAT_ID'):
+            self.backends.append(
+                TelegramBackend(config['TELEGRAM_BOT_TOKEN'],
+                                config['TELEGRAM_CHAT_ID'],
+                                api_url=config.get('TELEGRAM_API_URL',
+                                                   TELEGRAM_API_URL)))
+        if config.get('MAIL_SERVER') and config.get('MAIL_RECIPIENTS'):
+            self.backends.append(
+                SMTPBackend(config['MAIL_SERVER'],
+                            port=config.get('MAIL_PORT', 25),
+                            sender=config.get('MAIL_SENDER'),
+                            recipients=config['MAIL_RECIPIENTS'],
+                            use_tls=config.get('MAIL_USE_TLS', False),
+                            username=config.get('MAIL_USERNAME'),
+                            password=config.get('MAIL_PASSWORD')))
+        app.extensions['notifier'] = self
+
+    def notify(self, message: str, key=None):
+        """
+        Queue a message, unless a message with the same key (default: the
+        message itself) was queued less than `rate_limit` seconds ago.
+
+        :return: True if the message was queued
+        """
+        if not self.backends or not message:
+            return False
+        key = key or message
+        now = time.time()
+        with self._lock:
+            # forget the keys that are out of the rate limit window
+            while self._sent and \
+                    next(iter(self._sent.values())) <= now - self.rate_limit:
+                self._sent.popitem(last=False)
+            if key in self._sent:
+                return False
+            self._sent[key] = now
+            self._queue.append(message)
+        self.start()
+        return True
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run,
+                                            name='antminer-notifier',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread and send what is still queued."""
+        self._stopped.set()
+        self.flush()
+
+    def flush(self):
+        """Send the queued messages as one message per backend."""
+        with self._lock:
+            messages, self._queue = self._queue, []
+
+        if messages:
+            message = "\n".join(messages)
+            for backend in self.backends:
+                # the parts of a long message are retried on their own
+                split = getattr(backend, 'split', None)
+                for part in split(message) if split else [message]:
+                    self._send(backend, part, 0)
+        self.retry()
+
+    def retry(self):
+        """Send again the messages whose backoff delay has expired."""
+        now = time.time()
+        with self._lock:
+            due = [r for r in self._retries if r[0] <= now]
+            self._retries = [r for r in self._retries if r[0] > now]
+
+        for _, attempt, backend, message in due:
+            self._send(backend, message, attempt)
+
+    def _send(self, backend, message, attempt):
+        try:
+            backend.send(message)
+        except Exception as e:
+            if attempt >= self.max_retries:
+                logger.error("Giving up sending notification with %r: %s",
+                             backend, e)
+                return
+            delay = self.backoff * 2**attempt
+            logger.warning("Could not send notification with %r: %s. "
+                           "Retrying in %s sec", backend, e, delay)
+            with self._lock:
+                self._retries.append(
+                    (time.time() + delay, attempt + 1, backend, message))
+
+    def _run(self):
+        next_flush = time.time() + self.interval
+        while True:
+            with self._lock:
+                due = min([next_flush] + [r[0] for r in self._retries])
+            if self._stopped.wait(max(0, due - time.time())):
+                break
+            try:
+                if time.time() >= next_flush:
+                    next_flush = time.time() + self.interval
+                    self.flush()
+                else:
+                    self.retry()
+            except Exception:
+                logger.exception("Notification dispatcher failed")
+
+
+notifier = NotificationDispatcher()
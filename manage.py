@@ -1,12 +1,13 @@
 import subprocess
 
+import click
 from flask.cli import FlaskGroup
 
 from antminermonitor.app import create_app
 from antminermonitor.blueprints.asicminer.models.miner import Miner
 from antminermonitor.blueprints.asicminer.models.settings import Settings
 from antminermonitor.blueprints.user.models import User
-from antminermonitor.database import db_session, init_db
+from antminermonitor.database import init_db, transaction
 
 cli = FlaskGroup(create_app=create_app)
 
@@ -30,9 +31,8 @@ def create_db():
             description="Whether to send an email on alert"))
 
     try:
-         for setting in settings:
-            db_session.add(setting)
-            db_session.commit()
+        with transaction() as session:
+            session.add_all(settings)
     except IntegrityError:
         print("[INFO] Database already exists.")
     else:
@@ -57,14 +57,34 @@ def create_admin():
             firstname='admin',
             active=0)
         admin.set_password('antminermonitor')
-        db_session.add(admin)
-        db_session.commit()
+        with transaction() as session:
+            session.add(admin)
     elif admin:
         print("[INFO] Admin user already exists.")
     else:
         print("[INFO] Something went wrong.")
 
 
+@cli.command()
+def agent():
+    """
+        Poll the shard of this agent and push it to the aggregator.
+    """
+    from flask import current_app
+
+    from antminermonitor.blueprints.asicminer.cluster import agent
+    from antminermonitor.blueprints.asicminer.poller import poller
+
+    if not agent.enabled:
+        raise click.UsageError("Set POLL_MODE=agent and AGGREGATOR_URL.")
+    print("[INFO] Agent '{}' pushing to {} every {} seconds...".format(
+        agent.agent_id, agent.url, current_app.config['POLL_INTERVAL']))
+    try:
+        poller.run()
+    except KeyboardInterrupt:
+        pass
+
+
 @cli.command()
 def format():
     """Runs the yapf and isort formatters over the project."""
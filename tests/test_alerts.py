@@ -0,0 +1,199 @@
+from types import SimpleNamespace
+
+import pytest
+
+from antminermonitor.blueprints.asicminer import alerts
+from antminermonitor.blueprints.asicminer.alerts import AlertEngine, AlertRule
+
+RULES = [
+    {
+        'name': 'high_temp',
+        'metric': 'temp_max',
+        'op': '>=',
+        'threshold': 80,
+        'hysteresis': 5,
+        'level': 'warning',
+        'message': "[WARNING] {ip} at {value} C",
+    },
+    {
+        'name': 'low_fan_speed',
+        'metric': 'fan_min',
+        'op': '<',
+        'threshold': 1000,
+        'for': 60,
+        'level': 'error',
+        'message': "[ERROR] {ip} fan at {value} rpm",
+    },
+]
+
+
+def miner(temp=70, fan=6000, ip='10.0.0.1', model_id='Antminer S9',
+          hash_rate_ghs5s=13500):
+    return SimpleNamespace(ip=ip, model_id=model_id, is_inactive=False,
+                           chains=(), chips={'Os': 189, 'Xs': 0,
+                                             'total': 189},
+                           temperatures=[temp], fan_speeds=[fan],
+                           hash_rate_ghs5s=hash_rate_ghs5s, hw_error_rate=0,
+                           elapsed=86400, warnings=[], errors=[])
+
+
+@pytest.fixture
+def engine():
+    engine = AlertEngine()
+    engine.definitions = RULES
+    return engine
+
+
+def evaluate(engine, now, **state):
+    polled = miner(**state)
+    engine.evaluate([polled], now)
+    return polled
+
+
+def test_fires_once_the_threshold_is_crossed(engine):
+    assert evaluate(engine, 1000, temp=79).warnings == []
+    assert evaluate(engine, 1030, temp=80).warnings == [
+        "[WARNING] 10.0.0.1 at 80 C"
+    ]
+
+
+def test_clears_only_past_the_hysteresis(engine):
+    evaluate(engine, 1000, temp=82)
+
+    # under the threshold, down to the hysteresis: still firing
+    assert evaluate(engine, 1030, temp=76).warnings == [
+        "[WARNING] 10.0.0.1 at 76 C"
+    ]
+    assert engine.firing('10.0.0.1') == {
+        'high_temp': "[WARNING] 10.0.0.1 at 76 C"
+    }
+    assert evaluate(engine, 1060, temp=75).warnings != []
+    assert evaluate(engine, 1090, temp=74).warnings == []
+    assert engine.firing('10.0.0.1') == {}
+    # and fires again at the threshold only
+    assert evaluate(engine, 1120, temp=79).warnings == []
+
+
+def test_fires_once_the_condition_held_for_its_duration(engine):
+    assert evaluate(engine, 1000, fan=500).errors == []
+    assert evaluate(engine, 1030, fan=400).errors == []
+    assert evaluate(engine, 1060, fan=300).errors == [
+        "[ERROR] 10.0.0.1 fan at 300 rpm"
+    ]
+
+
+def test_the_duration_starts_again_when_the_condition_stops(engine):
+    evaluate(engine, 1000, fan=500)
+    evaluate(engine, 1030, fan=6000)
+
+    assert evaluate(engine, 1060, fan=500).errors == []
+    assert evaluate(engine, 1119, fan=500).errors == []
+    assert evaluate(engine, 1120, fan=500).errors != []
+
+
+def test_a_sustained_hash_rate_drop_keeps_firing(engine):
+    engine.definitions = [{
+        'name': 'hash_rate_drop',
+        'metric': 'hash_rate_drop',
+        'op': '>=',
+        'threshold': 20,
+        'hysteresis': 10,
+        'for': 120,
+        'message': "[WARNING] {ip} {value:.0f}% below its baseline",
+    }]
+    now = 1000
+    for _ in range(20):
+        evaluate(engine, now)
+        now += 30
+
+    # half the hash rate for an hour
+    fired = [evaluate(engine, now + t, hash_rate_ghs5s=6750).warnings
+             for t in range(0, 3600, 30)]
+
+    assert fired[:4] == [[]] * 4
+    assert fired[4:] == [["[WARNING] 10.0.0.1 50% below its baseline"]] * \
+        (len(fired) - 4)
+
+    # back to its hash rate
+    assert evaluate(engine, now + 3600).warnings == []
+
+
+def test_only_the_polled_miners_are_checked(engine):
+    first = miner(temp=85)
+    second = miner(temp=85, ip='10.0.0.2')
+
+    engine.evaluate([first, second], 1000, polled=[second])
+
+    assert first.warnings == []
+    assert second.warnings != []
+
+
+def test_the_unreachable_miners_are_not_checked(engine):
+    down = miner(temp=85)
+    down.is_inactive = True
+
+    engine.evaluate([down], 1000)
+
+    assert down.warnings == [] and engine.firing('10.0.0.1') == {}
+
+
+def test_forgets_the_miners_removed_from_the_fleet(engine):
+    evaluate(engine, 1000, temp=85)
+
+    engine.evaluate([miner(ip='10.0.0.2')], 1030)
+
+    assert engine.firing('10.0.0.1') == {}
+
+
+def test_the_most_specific_rule_wins(engine):
+    engine.definitions = RULES + [
+        dict(RULES[0], threshold=90, models=['Antminer S9']),
+        dict(RULES[0], threshold=60, miners=['10.0.0.2']),
+    ]
+
+    assert evaluate(engine, 1000, temp=85).warnings == []
+    assert evaluate(engine, 1000, temp=65, ip='10.0.0.2').warnings != []
+    assert evaluate(engine, 1000, temp=85,
+                    model_id='Antminer L3+').warnings != []
+
+
+def test_the_threshold_of_a_setting():
+    rule = AlertRule(dict(RULES[0], setting='temperature_alert'),
+                     {'temperature_alert': '70'})
+
+    assert rule.threshold == 70.0
+    assert rule.clear == 65.0
+
+
+def test_an_unknown_level_is_refused():
+    with pytest.raises(ValueError):
+        AlertRule(dict(RULES[0], level='critical'))
+
+
+class Notifier:
+    def __init__(self):
+        self.sent = []
+
+    def notify(self, message, key=None):
+        self.sent.append((key, message))
+
+
+def test_notifies_an_alert_by_miner_and_rule(engine, monkeypatch):
+    notifier = Notifier()
+    monkeypatch.setattr(alerts, 'alert_engine', engine)
+    monkeypatch.setattr(alerts, 'notifier', notifier)
+    hot = evaluate(engine, 1000, temp=85, fan=500)
+    down = miner(ip='10.0.0.2')
+    down.is_inactive = True
+    down.errors = ["timed out"]
+
+    alerts.notify_alerts(SimpleNamespace(miners=[hot, down]))
+
+    assert notifier.sent == [
+        (('10.0.0.1', 'high_temp'), "[WARNING] 10.0.0.1 at 85 C"),
+    ]
+
+    engine.notify_inactive = True
+    alerts.notify_alerts(SimpleNamespace(miners=[hot, down]))
+
+    assert notifier.sent[-1] == (('10.0.0.2', 'inactive'), "timed out")
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from antminermonitor.blueprints.asicminer import chains
+from antminermonitor.blueprints.asicminer.chains import ChainTracker, diff
+from antminermonitor.blueprints.asicminer.models import ChainEvent
+from antminermonitor.blueprints.asicminer.registry import Chain
+from antminermonitor.database import db_session, engine
+
+
+@pytest.fixture(autouse=True)
+def database(monkeypatch):
+    """An empty `ChainEvent` table in memory instead of the app database."""
+    memory = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    monkeypatch.setattr(chains, 'engine', memory)
+    db_session.remove()
+    db_session.configure(bind=memory)
+    yield
+    db_session.remove()
+    db_session.configure(bind=engine)
+
+
+@pytest.fixture
+def tracker():
+    tracker = ChainTracker()
+    # no flushing thread
+    tracker._thread = SimpleNamespace(is_alive=lambda: True)
+    return tracker
+
+
+def snapshot(timestamp, *maps):
+    miner = SimpleNamespace(ip='10.0.0.1', model_id='Antminer S9',
+                            is_inactive=False,
+                            chains=tuple(
+                                Chain(index, chips, 4500.0, 0, (70, ), (0, ))
+                                for index, chips in maps))
+    return SimpleNamespace(miners=[miner], timestamp=timestamp)
+
+
+def events():
+    try:
+        return [(row.timestamp, row.chain, row.chips, row.changes)
+                for row in ChainEvent.query.order_by(ChainEvent.id)]
+    finally:
+        db_session.remove()
+
+
+def test_diff():
+    assert diff('ooox', 'oxoo') == '1:o>x,3:x>o'
+    assert diff('oo', 'ooo') == '2:_>o'
+
+
+def test_record_only_queues_the_snapshots(tracker, monkeypatch):
+    def no_database(*args, **kwargs):
+        raise AssertionError("the database is used by record")
+
+    monkeypatch.setattr(tracker, '_load', no_database)
+    monkeypatch.setattr(chains, 'transaction', no_database)
+
+    tracker.record(snapshot(1000, (6, 'oooo')))
+    tracker.record(snapshot(1030, (6, 'ooxo')))
+
+    assert len(tracker._queue) == 2
+
+
+def test_the_flush_stores_only_the_changes(tracker):
+    tracker.record(snapshot(1000, (6, 'oooo'), (7, 'oooo')))
+    tracker.record(snapshot(1030, (6, 'oooo'), (7, 'oooo')))
+    tracker.record(snapshot(1060, (6, 'ooxo'), (7, 'oooo')))
+    tracker.record(snapshot(1090, (6, 'ooxo')))
+
+    tracker.flush(now=1100)
+
+    assert events() == [
+        (1000, 6, 'oooo', None),
+        (1000, 7, 'oooo', None),
+        (1060, 6, 'ooxo', '2:o>x'),
+        (1090, 7, '', None),
+    ]
+    assert tracker._queue == []
+
+
+def test_a_restart_does_not_store_the_fleet_again(tracker):
+    tracker.record(snapshot(1000, (6, 'oooo')))
+    tracker.flush(now=1000)
+
+    restarted = ChainTracker()
+    restarted._thread = tracker._thread
+    restarted.record(snapshot(1030, (6, 'oooo')))
+    restarted.record(snapshot(1060, (6, 'xooo')))
+    restarted.flush(now=1060)
+
+    assert events() == [
+        (1000, 6, 'oooo', None),
+        (1060, 6, 'xooo', '0:o>x'),
+    ]
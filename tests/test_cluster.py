@@ -0,0 +1,168 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from antminermonitor.blueprints.asicminer import alerts
+from antminermonitor.blueprints.asicminer.alerts import AlertEngine
+from antminermonitor.blueprints.asicminer.base_miner import BaseMiner
+from antminermonitor.blueprints.asicminer.cluster import (Aggregator, decode,
+                                                          encode)
+from antminermonitor.blueprints.asicminer.poller import FleetSnapshot
+
+
+def miner(ip, hash_rate=13500, polled_at=1000.0):
+    miner = BaseMiner(
+        SimpleNamespace(id=1, ip=ip, model_id='Antminer S9', remarks=''))
+    miner.hash_rate_ghs5s = hash_rate
+    miner.polled_at = polled_at
+    return miner
+
+
+def payload(agent_id, timestamp, *miners, cycle=1):
+    snapshot = FleetSnapshot(miners=list(miners),
+                             timestamp=timestamp,
+                             duration=1.5,
+                             cycle=cycle)
+    # as sent over the wire
+    return json.loads(json.dumps(encode(snapshot, agent_id)))
+
+
+@pytest.fixture
+def aggregator():
+    aggregator = Aggregator()
+    aggregator.enabled = True
+    aggregator.stale_after = 60
+    # neither publish to the poller nor watch the agents from a thread
+    aggregator.publish = lambda: None
+    aggregator._watch = lambda: None
+    return aggregator
+
+
+def test_decode_is_the_inverse_of_encode():
+    polled = miner('10.0.0.1', hash_rate=14000)
+    polled.temperatures = [60, 62]
+    polled.warnings = ["[WARNING] hot"]
+
+    snapshot = decode(payload('a', 1000.0, polled, cycle=7))
+
+    [decoded] = snapshot.miners
+    assert (snapshot.timestamp, snapshot.cycle) == (1000.0, 7)
+    assert decoded.ip == '10.0.0.1'
+    assert decoded.hash_rate_ghs5s == 14000
+    assert decoded.temperatures == [60, 62]
+    assert decoded.warnings == ["[WARNING] hot"]
+    assert decoded.polled_at == 1000.0
+
+
+def test_decode_ignores_the_fields_of_other_versions():
+    encoded = payload('a', 1000.0, miner('10.0.0.1'))
+    encoded['fields'] = list(encoded['fields']) + ['firmware']
+    encoded['miners'][0].append('2023-01-01')
+
+    [decoded] = decode(encoded).miners
+
+    assert decoded.ip == '10.0.0.1'
+    assert not hasattr(decoded, 'firmware')
+
+
+def test_merges_the_latest_snapshot_of_every_agent(aggregator):
+    aggregator.receive([
+        payload('b', 1000.0, miner('10.0.1.1'), miner('10.0.1.2')),
+        payload('a', 1000.0, miner('10.0.0.1')),
+    ])
+    aggregator.receive([payload('a', 1030.0, miner('10.0.0.1', 7000))])
+
+    merged = aggregator.merge(now=1031.0)
+
+    assert [m.ip for m in merged.miners] == [
+        '10.0.0.1', '10.0.1.1', '10.0.1.2'
+    ]
+    assert merged.miners[0].hash_rate_ghs5s == 7000
+    assert merged.timestamp == 1030.0
+    totals = merged.total_hash_rate_per_model
+    assert totals['Antminer S9']['value'] == 7000 + 2 * 13500
+
+
+def test_replayed_snapshots_reach_the_listeners_only(aggregator):
+    received = []
+    aggregator.subscribe(lambda snapshot: received.append(snapshot.timestamp))
+    aggregator.receive([payload('a', 1060.0, miner('10.0.0.1', 7000))])
+
+    # replayed by the agent after an outage, oldest first
+    aggregator.receive([
+        payload('a', 1030.0, miner('10.0.0.1', 14000)),
+        payload('a', 1000.0, miner('10.0.0.1', 13000)),
+    ])
+
+    assert received == [1060.0, 1000.0, 1030.0]
+    [merged] = aggregator.merge(now=1061.0).miners
+    assert merged.hash_rate_ghs5s == 7000
+
+
+def test_the_miners_of_a_stale_agent_are_inactive(aggregator):
+    aggregator.receive([payload('a', 1000.0, miner('10.0.0.1'))])
+    aggregator.receive([payload('b', 1000.0, miner('10.0.1.1'))])
+    received = aggregator._agents['a']['received']
+    aggregator._agents['a']['received'] = received - 120
+
+    merged = aggregator.merge(now=received)
+
+    stale, fresh = merged.miners
+    assert stale.ip == '10.0.0.1' and stale.is_inactive
+    assert stale.errors[0].startswith("[ERROR] Agent 'a' has not reported")
+    assert not fresh.is_inactive
+    totals = merged.total_hash_rate_per_model
+    assert totals['Antminer S9']['value'] == 13500
+    assert aggregator.status(now=received)['a']['stale']
+
+
+class Notifier:
+    def __init__(self):
+        self.sent = []
+
+    def notify(self, message, key=None):
+        self.sent.append((key, message))
+
+
+def test_the_alerts_of_an_agent_are_notified(aggregator, monkeypatch):
+    engine = AlertEngine()
+    engine.definitions = [{
+        'name': 'high_temp',
+        'metric': 'temp_max',
+        'op': '>=',
+        'threshold': 80,
+        'for': 30,
+        'message': "[WARNING] {ip} at {value} C",
+    }]
+    notifier = Notifier()
+    monkeypatch.setattr(alerts, 'alert_engine', engine)
+    monkeypatch.setattr(alerts, 'notifier', notifier)
+    aggregator.subscribe(engine.check)
+
+    def publish():
+        merged = aggregator.merge()
+        engine.retain(merged)
+        alerts.notify_alerts(merged)
+
+    aggregator.publish = publish
+    hot = miner('10.0.0.1')
+    hot.temperatures = [85]
+    # the agent fired it already
+    hot.warnings = ["[WARNING] 10.0.0.1 at 85 C"]
+
+    aggregator.receive([payload('a', 1000.0, hot)])
+    assert notifier.sent == []
+
+    aggregator.receive([
+        payload('a', 1030.0, hot),
+        payload('b', 1030.0, miner('10.0.1.1')),
+    ])
+    assert notifier.sent == [
+        (('10.0.0.1', 'high_temp'), "[WARNING] 10.0.0.1 at 85 C"),
+    ]
+    [merged, _] = aggregator.merge().miners
+    assert merged.warnings == ["[WARNING] 10.0.0.1 at 85 C"]
+
+    aggregator.receive([payload('a', 1060.0)])
+    assert engine.firing('10.0.0.1') == {}
@@ -0,0 +1,83 @@
+import pytest
+
+from antminermonitor.blueprints.asicminer.health import (CLOSED, HALF_OPEN,
+                                                         OPEN, HealthTracker)
+
+
+@pytest.fixture
+def health():
+    return HealthTracker(threshold=3, base_backoff=60, max_backoff=300,
+                         min_timeout=0.25)
+
+
+def test_the_circuit_opens_after_threshold_failures(health):
+    health.failure('10.0.0.1', now=1000)
+    health.failure('10.0.0.1', now=1000)
+    assert health.should_poll('10.0.0.1', now=1000)
+
+    health.failure('10.0.0.1', now=1000)
+
+    assert health.get('10.0.0.1').state == OPEN
+    assert not health.should_poll('10.0.0.1', now=1059)
+
+
+def test_the_backoff_doubles_up_to_the_max(health):
+    backoffs = []
+    for _ in range(7):
+        health.failure('10.0.0.1', now=1000)
+        miner = health.get('10.0.0.1')
+        backoffs.append(miner.retry_at - 1000 if miner.state == OPEN else 0)
+
+    assert backoffs == [0, 0, 60, 120, 240, 300, 300]
+
+
+def test_a_probe_once_the_backoff_expired(health):
+    for _ in range(3):
+        health.failure('10.0.0.1', now=1000)
+
+    assert health.should_poll('10.0.0.1', now=1060)
+    assert health.get('10.0.0.1').state == HALF_OPEN
+
+    # a failed probe opens the circuit again, for longer
+    health.failure('10.0.0.1', now=1060)
+    assert health.get('10.0.0.1').state == OPEN
+    assert not health.should_poll('10.0.0.1', now=1179)
+    assert health.should_poll('10.0.0.1', now=1180)
+
+
+def test_an_answer_closes_the_circuit(health):
+    for _ in range(3):
+        health.failure('10.0.0.1', now=1000)
+    health.should_poll('10.0.0.1', now=1060)
+
+    health.success('10.0.0.1', 0.05)
+
+    miner = health.get('10.0.0.1')
+    assert (miner.state, miner.failures, miner.retry_at) == (CLOSED, 0, 0)
+
+
+def test_the_timeout_adapts_to_the_round_trip_time(health):
+    timeouts = {'stats': 2, 'pools': 1}
+    # never answered: the configured timeouts
+    assert health.timeout('10.0.0.1', timeouts) is timeouts
+
+    for _ in range(20):
+        health.success('10.0.0.1', 0.1)
+    assert health.timeout('10.0.0.1', timeouts) == pytest.approx(0.25)
+
+    for _ in range(20):
+        health.success('10.0.0.1', 0.5)
+    assert 0.5 < health.timeout('10.0.0.1', timeouts) <= 2
+
+    health.failure('10.0.0.1')
+    assert health.timeout('10.0.0.1', 3) == 3
+
+
+def test_forget_the_removed_miners(health):
+    health.failure('10.0.0.1')
+    health.failure('10.0.0.2')
+
+    health.forget(['10.0.0.2'])
+
+    assert health.get('10.0.0.1').failures == 0
+    assert health.get('10.0.0.2').failures == 1
@@ -0,0 +1,147 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from antminermonitor.blueprints.asicminer import inventory
+from antminermonitor.blueprints.asicminer.inventory import InventoryError
+from antminermonitor.blueprints.asicminer.models import Miner
+from antminermonitor.database import db_session, engine
+
+
+@pytest.fixture(autouse=True)
+def database():
+    """An empty `Miner` table in memory instead of the app database."""
+    memory = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    Miner.__table__.create(bind=memory)
+    db_session.remove()
+    db_session.configure(bind=memory)
+    yield
+    db_session.remove()
+    db_session.configure(bind=engine)
+
+
+def miners():
+    try:
+        return sorted((miner.ip, miner.model_id, miner.remarks)
+                      for miner in Miner.query)
+    finally:
+        db_session.remove()
+
+
+def statuses(results):
+    return [(result['ip'], result['status']) for result in results]
+
+
+def test_adds_and_updates_in_one_go():
+    inventory.upsert([
+        {'ip': '10.0.0.1', 'model_id': 'Antminer S9', 'remarks': 'rack 1'},
+        {'ip': '10.0.0.2', 'model_id': 'Antminer S9'},
+    ])
+
+    results = inventory.upsert([
+        {'ip': '10.0.0.1', 'model_id': 'Antminer S9', 'remarks': 'rack 1'},
+        {'ip': '10.0.0.2', 'model_id': 'Antminer L3+', 'remarks': 'rack 2'},
+        {'ip': '10.0.0.3', 'model_id': 'Antminer D3'},
+    ])
+
+    assert statuses(results) == [
+        ('10.0.0.1', 'unchanged'),
+        ('10.0.0.2', 'updated'),
+        ('10.0.0.3', 'added'),
+    ]
+    assert miners() == [
+        ('10.0.0.1', 'Antminer S9', 'rack 1'),
+        ('10.0.0.2', 'Antminer L3+', 'rack 2'),
+        ('10.0.0.3', 'Antminer D3', ''),
+    ]
+
+
+def test_skips_the_invalid_rows():
+    results = inventory.upsert([
+        {'ip': '10.0.0.1', 'model_id': 'Antminer S9'},
+        {'ip': '10.0.0.300', 'model_id': 'Antminer S9'},
+        {'ip': '10.0.0.2', 'model_id': 'Antminer Z1'},
+        {'model_id': 'Antminer S9'},
+        'not a row',
+    ])
+
+    assert statuses(results) == [
+        ('10.0.0.1', 'added'),
+        ('10.0.0.300', 'error'),
+        ('10.0.0.2', 'error'),
+        (None, 'error'),
+        (None, 'error'),
+    ]
+    assert [result['row'] for result in results] == [1, 2, 3, 4, 5]
+    assert miners() == [('10.0.0.1', 'Antminer S9', '')]
+
+
+def test_the_last_row_of_an_ip_wins():
+    results = inventory.upsert([
+        {'ip': '10.0.0.1', 'model_id': 'Antminer S9', 'remarks': 'first'},
+        {'ip': ' 10.0.0.1 ', 'model_id': 'Antminer S9', 'remarks': 'last'},
+    ])
+
+    assert statuses(results) == [('10.0.0.1', 'duplicate'),
+                                 ('10.0.0.1', 'added')]
+    assert miners() == [('10.0.0.1', 'Antminer S9', 'last')]
+
+
+def test_more_miners_than_the_bound_parameters_of_sqlite():
+    rows = [{
+        'ip': '10.0.{}.{}'.format(i // 250, i % 250 + 1),
+        'model_id': 'Antminer S9'
+    } for i in range(2 * inventory.CHUNK_SIZE + 10)]
+    inventory.upsert(rows[:inventory.CHUNK_SIZE + 5])
+
+    results = inventory.upsert(rows)
+
+    assert [result['status'] for result in results].count('unchanged') == \
+        inventory.CHUNK_SIZE + 5
+    assert len(miners()) == len(rows)
+
+    results = inventory.delete([row['ip'] for row in rows] + ['10.9.9.9'])
+    assert results[-1] == {'ip': '10.9.9.9', 'status': 'missing'}
+    assert miners() == []
+
+
+def test_parse_a_csv_file_with_the_columns_in_any_order():
+    rows = inventory.parse(
+        "remarks,ip,model_id\nrack 1,10.0.0.1,Antminer S9\n", 'csv')
+
+    assert rows == [{
+        'ip': '10.0.0.1',
+        'model_id': 'Antminer S9',
+        'remarks': 'rack 1'
+    }]
+
+
+@pytest.mark.parametrize('data, format', [
+    ("model_id\nAntminer S9\n", 'csv'),
+    ("{not json", 'json'),
+    ('{"ip": "10.0.0.1"}', 'json'),
+    ("", 'xml'),
+])
+def test_a_file_that_cannot_be_imported(data, format):
+    with pytest.raises(InventoryError):
+        inventory.parse(data, format)
+
+
+def test_an_export_imports_back():
+    inventory.upsert([
+        {'ip': '10.0.0.10', 'model_id': 'Antminer S9', 'remarks': 'a, "b"'},
+        {'ip': '10.0.0.9', 'model_id': 'Antminer L3+'},
+    ])
+
+    for format in ('csv', 'json'):
+        data = inventory.export(format)
+        rows = inventory.parse(data, format)
+        assert [row['ip'] for row in rows] == ['10.0.0.9', '10.0.0.10']
+        assert statuses(inventory.upsert(rows)) == [
+            ('10.0.0.9', 'unchanged'),
+            ('10.0.0.10', 'unchanged'),
+        ]
+    assert json.loads(inventory.export('json'))[1]['remarks'] == 'a, "b"'
@@ -0,0 +1,172 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+from lib.util_notify import NotificationDispatcher, TelegramBackend
+
+
+class StubTelegram(HTTPServer):
+    """A local Bot API that records the messages and fails on demand."""
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), StubHandler)
+        self.messages = []
+        # number of the next requests answered with a 500
+        self.failures = 0
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_port)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        form = parse_qs(self.rfile.read(length).decode())
+        server = self.server
+        if server.failures:
+            server.failures -= 1
+            self.send_response(500)
+        else:
+            assert self.path == '/botTOKEN/sendMessage'
+            server.messages.append(form['text'][0])
+            self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def telegram():
+    server = StubTelegram()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def dispatcher(telegram):
+    dispatcher = NotificationDispatcher(
+        [TelegramBackend('TOKEN', 42, api_url=telegram.url, timeout=2)],
+        interval=3600,
+        rate_limit=3600,
+        max_retries=2,
+        backoff=5)
+    yield dispatcher
+    dispatcher._stopped.set()
+
+
+def test_coalesces_the_queued_notifications(dispatcher, telegram):
+    assert dispatcher.notify("first", key=('10.0.0.1', 'temp'))
+    assert dispatcher.notify("second", key=('10.0.0.2', 'temp'))
+    assert dispatcher.notify("third", key=('10.0.0.1', 'fan'))
+    assert telegram.messages == []
+
+    dispatcher.flush()
+
+    assert telegram.messages == ["first\nsecond\nthird"]
+
+
+def test_rate_limits_a_condition(dispatcher, telegram):
+    assert dispatcher.notify("fan at 900 rpm", key=('10.0.0.1', 'fan'))
+    assert not dispatcher.notify("fan at 800 rpm", key=('10.0.0.1', 'fan'))
+    dispatcher.flush()
+    assert not dispatcher.notify("fan at 700 rpm", key=('10.0.0.1', 'fan'))
+    dispatcher.flush()
+
+    assert telegram.messages == ["fan at 900 rpm"]
+
+
+def test_notifies_again_after_the_rate_limit(dispatcher, telegram):
+    dispatcher.rate_limit = 0.1
+    assert dispatcher.notify("down", key=('10.0.0.1', 'down'))
+    time.sleep(0.2)
+    assert dispatcher.notify("down", key=('10.0.0.1', 'down'))
+    dispatcher.flush()
+
+    assert telegram.messages == ["down\ndown"]
+
+
+def test_retries_with_exponential_backoff(dispatcher, telegram):
+    telegram.failures = 2
+    dispatcher.notify("down", key=('10.0.0.1', 'down'))
+
+    dispatcher.flush()
+    assert telegram.messages == []
+    [(due, attempt, _, message)] = dispatcher._retries
+    assert attempt == 1 and message == "down"
+    assert due - time.time() == pytest.approx(5, abs=1)
+
+    # not due yet
+    dispatcher.retry()
+    assert len(dispatcher._retries) == 1
+
+    dispatcher._retries = [(0, 1, backend, message)
+                           for _, _, backend, message in dispatcher._retries]
+    dispatcher.retry()
+    [(due, attempt, _, _)] = dispatcher._retries
+    assert attempt == 2
+    assert due - time.time() == pytest.approx(10, abs=1)
+
+    dispatcher._retries = [(0, 2, backend, message)
+                           for _, _, backend, message in dispatcher._retries]
+    dispatcher.retry()
+    assert dispatcher._retries == []
+    assert telegram.messages == ["down"]
+
+
+def test_gives_up_after_max_retries(dispatcher, telegram):
+    telegram.failures = 10
+    dispatcher.notify("down", key=('10.0.0.1', 'down'))
+    dispatcher.flush()
+    for attempt in (1, 2):
+        [(_, retry_attempt, backend, message)] = dispatcher._retries
+        assert retry_attempt == attempt
+        dispatcher._retries = [(0, attempt, backend, message)]
+        dispatcher.retry()
+
+    assert dispatcher._retries == []
+    assert telegram.messages == []
+
+
+def test_splits_long_messages_at_line_boundaries(dispatcher, telegram):
+    lines = ["[WARNING] Miner '10.0.{}.{}' is hot.".format(i // 256, i % 256)
+             for i in range(300)]
+    for i, line in enumerate(lines):
+        dispatcher.notify(line, key=(i, 'temp'))
+
+    dispatcher.flush()
+
+    assert len(telegram.messages) > 1
+    assert all(len(message) <= 4096 for message in telegram.messages)
+    assert "\n".join(telegram.messages).split("\n") == lines
+
+
+def test_retries_only_the_part_that_failed(dispatcher, telegram):
+    backend = dispatcher.backends[0]
+    backend.max_length = 10
+    dispatcher.notify("aaaa", key=1)
+    dispatcher.notify("bbbb", key=2)
+    dispatcher.notify("cccc", key=3)
+    telegram.failures = 1
+
+    dispatcher.flush()
+    assert telegram.messages == ["cccc"]
+    [(_, _, _, message)] = dispatcher._retries
+    assert message == "aaaa\nbbbb"
+
+
+def test_splits_a_line_longer_than_a_message():
+    backend = TelegramBackend('TOKEN', 42)
+    backend.max_length = 10
+
+    assert backend.split("abc\n" + "x" * 25 + "\nk") == [
+        "abc", "x" * 10, "x" * 10, "x" * 5 + "\nk"
+    ]
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+
+import pytest
+
+from antminermonitor.blueprints.asicminer.poller import (FleetSnapshot,
+                                                         Poller)
+
+
+def row(ip):
+    return SimpleNamespace(id=1, ip=ip, model_id='Antminer S9', remarks='')
+
+
+@pytest.fixture
+def poller():
+    poller = Poller()
+    poller.scheduler.jitter = 0
+    poller.rows = [row('10.0.0.1'), row('10.0.0.2')]
+    poller.polled = []
+    poller._load_miners = lambda: list(poller.rows)
+
+    def poll(miner_objects, polled, start):
+        poller.polled.append(sorted(obj.ip for obj in polled))
+        return FleetSnapshot(miners=miner_objects)
+
+    poller._poll = poll
+    # no polling thread
+    poller.start = lambda: None
+    return poller
+
+
+def test_a_reload_polls_only_the_new_miners(poller):
+    poller.poll_due(refresh=True)
+    poller.rows.append(row('10.0.0.3'))
+
+    snapshot = poller.poll_due(reload=True)
+
+    assert poller.polled == [['10.0.0.1', '10.0.0.2'], ['10.0.0.3']]
+    assert [m.ip for m in snapshot.miners] == [
+        '10.0.0.1', '10.0.0.2', '10.0.0.3'
+    ]
+
+
+def test_the_removed_miners_leave_the_snapshot(poller):
+    poller.poll_due(refresh=True)
+    del poller.rows[0]
+
+    snapshot = poller.poll_due(reload=True)
+
+    assert poller.polled[-1] == []
+    assert [m.ip for m in snapshot.miners] == ['10.0.0.2']
+
+
+def test_a_refresh_polls_every_miner(poller):
+    poller.poll_due(refresh=True)
+
+    poller.poll_due(refresh=True)
+
+    assert poller.polled[-1] == ['10.0.0.1', '10.0.0.2']
+
+
+def test_the_polling_thread_wakes_up_for_what_was_asked(poller):
+    poller.reload()
+    assert poller._sleep(5) == (False, True)
+
+    poller.refresh()
+    assert poller._sleep(5) == (True, False)
+
+    # nothing asked
+    assert poller._sleep(0.01) == (False, False)
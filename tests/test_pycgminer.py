@@ -0,0 +1,172 @@
+import asyncio
+import json
+import socketserver
+import threading
+import time
+
+import pytest
+
+from lib.pycgminer import (AsyncCgminerAPI, CgminerAPI, _decode, _repair,
+                           _split, _timeout_for)
+
+STATUS = b'{"STATUS":[{"STATUS":"S","Msg":"CGMiner stats"}],"id":1}'
+
+
+def test_decode_a_valid_response():
+    assert _decode(STATUS) == json.loads(STATUS)
+
+
+def test_decode_repairs_the_stats_of_bmminer():
+    # the second section of `stats` follows the first without a comma
+    received = (b'{"STATUS":[{"STATUS":"S"}],"STATS":[{"BMMiner":"2.0.0"}'
+                b'{"STATS":0,"fan1":6000}],"id":1}')
+
+    response = _decode(received)
+
+    assert response['STATS'] == [{'BMMiner': '2.0.0'},
+                                 {'STATS': 0, 'fan1': 6000}]
+
+
+def test_decode_repairs_every_missing_comma():
+    received = b'{"POOLS":[{"POOL":0}{"POOL":1}{"POOL":2}]}'
+
+    assert [p['POOL'] for p in _decode(received)['POOLS']] == [0, 1, 2]
+
+
+def test_decode_leaves_the_strings_alone():
+    # a `}{` in a value is not a missing comma
+    received = b'{"STATUS":[{"Msg":"a}{b"}{"Msg":"c"}]}'
+
+    assert [s['Msg'] for s in _decode(received)['STATUS']] == ['a}{b', 'c']
+
+
+def test_decode_returns_an_error_response():
+    response = _decode(b'{"STATUS": [')
+
+    assert response['STATUS'][0]['STATUS'] == 'error'
+    assert response['STATUS'][0]['description']
+
+
+def test_repair_raises_what_it_cannot_repair():
+    error = ValueError("Expecting value")
+
+    with pytest.raises(ValueError):
+        _repair(b'{"a": }', error)
+
+
+def test_split_a_joined_response():
+    response = {'stats': [{'STATS': []}], 'pools': [{'POOLS': []}]}
+
+    assert _split(('stats', 'pools'), response) == {
+        'stats': {'STATS': []},
+        'pools': {'POOLS': []},
+    }
+
+
+def test_split_an_error_gives_it_to_every_command():
+    error = {'STATUS': [{'STATUS': 'error', 'description': 'timed out'}]}
+
+    assert _split(('stats', 'pools'), error) == {
+        'stats': error,
+        'pools': error,
+    }
+
+
+def test_the_timeout_of_a_joined_command_is_the_longest():
+    timeouts = {'stats': 2, 'pools': 1}
+
+    assert _timeout_for(timeouts, 'pools') == 1
+    assert _timeout_for(timeouts, 'stats+pools') == 2
+    assert _timeout_for(3, 'stats+pools') == 3
+
+
+class FakeMiner(socketserver.BaseRequestHandler):
+    """Answers every command with a large response in small writes."""
+    response = json.dumps({
+        'STATUS': [{'STATUS': 'S'}],
+        'STATS': [{'chain_acs6': 'oooo ' * 20000}],
+    }).encode() + b'\x00'
+
+    def handle(self):
+        self.request.recv(1024)
+        for i in range(0, len(self.response), 1000):
+            self.request.sendall(self.response[i:i + 1000])
+
+
+@pytest.fixture
+def miner():
+    server = socketserver.TCPServer(('127.0.0.1', 0), FakeMiner)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_command_receives_a_response_larger_than_the_buffer(miner):
+    host, port = miner
+    api = CgminerAPI(host, port, timeout=2)
+
+    response = api.command('stats')
+
+    assert response['STATS'][0]['chain_acs6'] == 'oooo ' * 20000
+
+
+class SlowMiner(socketserver.BaseRequestHandler):
+    """Answers after `delay` seconds, and records when it was closed."""
+    delay = 0.3
+    closed = None
+
+    def handle(self):
+        self.request.recv(1024)
+        time.sleep(self.delay)
+        try:
+            self.request.sendall(STATUS + b'\x00')
+            self.request.settimeout(2)
+            SlowMiner.closed = self.request.recv(1024) == b''
+        except OSError:
+            SlowMiner.closed = True
+
+
+@pytest.fixture
+def slow_miner():
+    SlowMiner.closed = None
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), SlowMiner)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server.server_address
+    server.shutdown()
+    server.server_close()
+
+
+def test_one_timeout_for_the_whole_command(slow_miner, monkeypatch):
+    open_connection = asyncio.open_connection
+
+    async def slow_connection(*args, **kwargs):
+        await asyncio.sleep(0.3)
+        return await open_connection(*args, **kwargs)
+
+    monkeypatch.setattr(asyncio, 'open_connection', slow_connection)
+    host, port = slow_miner
+    api = AsyncCgminerAPI(host, port, timeout=0.5)
+
+    start = time.monotonic()
+    response = asyncio.run(api.command('stats'))
+
+    # 0.3 s to connect and 0.3 s to answer, each within the timeout
+    assert response['STATUS'][0]['description'] == 'timed out'
+    assert time.monotonic() - start < 0.55
+
+
+def test_the_connection_is_closed_after_the_command(slow_miner):
+    host, port = slow_miner
+    api = AsyncCgminerAPI(host, port, timeout=2)
+
+    response = asyncio.run(api.command('stats'))
+
+    assert response['STATUS'][0]['Msg'] == 'CGMiner stats'
+    for _ in range(20):
+        if SlowMiner.closed is not None:
+            break
+        time.sleep(0.05)
+    assert SlowMiner.closed
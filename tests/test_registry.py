@@ -0,0 +1,101 @@
+from antminermonitor.blueprints.asicminer.models import ChainEvent, Metric
+from antminermonitor.blueprints.asicminer.registry import (Chain, ParsePlan,
+                                                           registry)
+from config.settings import MODELS
+
+
+def stats():
+    """Second section of the `stats` response of an Antminer S9."""
+    stats = {'STATS': 0, 'ID': 'BC50', 'Elapsed': 86400, 'fan_num': 2}
+    for i in range(1, 9):
+        stats['fan{}'.format(i)] = 6000 + i if i in (3, 6) else 0
+        stats['temp{}'.format(i)] = 60 + i if i in (6, 7, 8) else 0
+        stats['temp2_{}'.format(i)] = 70 + i if i in (6, 7, 8) else 0
+    for i in range(1, 17):
+        stats['chain_acs{}'.format(i)] = ''
+        stats['chain_hw{}'.format(i)] = 0
+        stats['chain_rate{}'.format(i)] = ''
+    stats['chain_acs6'] = 'oooooooo oooooooo oooooooo'
+    stats['chain_acs7'] = 'oooooxoo oooooooo ooo-----'
+    stats['chain_acs8'] = 'oooooooo oooooooo ooooooox'
+    stats['chain_hw6'] = 12
+    stats['chain_rate6'] = '4500.12'
+    stats['chain_rate7'] = 'n/a'
+    return stats
+
+
+def test_counts_the_chips_of_every_chain():
+    chips = ParsePlan(MODELS['Antminer S9']).parse(stats())[0]
+
+    assert chips == {'o': 65, 'x': 2, 'B': 0, 'C': 0, '-': 5}
+
+
+def test_leaves_out_the_sensors_and_fans_reading_0():
+    plan = ParsePlan(MODELS['Antminer S9'])
+
+    _, temperatures, fan_speeds, _, temperature_ids, fan_ids = plan.parse(
+        stats())
+
+    # temp2_1 .. temp2_8, sorted as strings
+    assert temperatures == [76, 77, 78]
+    assert temperature_ids == (5, 6, 7)
+    assert fan_speeds == [6003, 6006]
+    assert fan_ids == (2, 5)
+
+
+def test_parses_every_hashboard():
+    chains = ParsePlan(MODELS['Antminer S9']).parse(stats())[3]
+
+    # temp2_6 (chips) then temp6 (PCB) for chain 6
+    assert chains == (
+        Chain(6, 'o' * 24, 4500.12, 12, (76, 66), (0, 1)),
+        Chain(7, 'oooooxoo' + 'o' * 11 + '-----', None, 0, (77, 67), (0, 1)),
+        Chain(8, 'o' * 23 + 'x', None, 0, (78, 68), (0, 1)),
+    )
+
+
+def test_ids_of_a_hashboard_sensor_reading_0():
+    response = stats()
+    response['temp6'] = 0
+
+    chain = ParsePlan(MODELS['Antminer S9']).parse(response)[3][0]
+
+    assert chain.temperatures == (76, )
+    assert chain.temperature_ids == (0, )
+
+    response['temp2_6'] = 0
+    response['temp6'] = 66
+    chain = ParsePlan(MODELS['Antminer S9']).parse(response)[3][0]
+
+    assert chain.temperatures == (66, )
+    assert chain.temperature_ids == (1, )
+
+
+def test_resolves_the_keys_once_per_firmware_layout():
+    plan = ParsePlan(MODELS['Antminer S9'])
+    first = stats()
+    second = stats()
+    second['chain_acs6'] = 'xxxxxxxx'
+
+    plan.parse(first)
+    layout = plan.layout(first)
+    assert plan.layout(second) is layout
+
+    second['temp2_9'] = 80
+    assert plan.layout(second) is not layout
+    assert plan.parse(second)[1] == [76, 77, 78, 80]
+
+
+def test_the_registry_caches_a_plan_per_model():
+    plan = registry.plan('Antminer S9')
+
+    assert plan is registry.plan('Antminer S9')
+    assert plan.total_chips == 189
+    assert plan.unit == 'GH/s'
+
+
+def test_the_model_ids_fit_the_recorded_tables():
+    longest = max(len(model_id) for model_id in MODELS)
+
+    for table in (Metric, ChainEvent):
+        assert longest <= table.model_id.type.length
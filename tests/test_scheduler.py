@@ -0,0 +1,143 @@
+from types import SimpleNamespace
+
+import pytest
+
+from antminermonitor.blueprints.asicminer.scheduler import (PollScheduler,
+                                                            RateLimiter)
+
+INTERVALS = {'low': 120, 'normal': 30, 'high': 10}
+
+
+def miner(ip, remarks='', model_id='Antminer S9', **state):
+    values = dict(ip=ip, remarks=remarks, model_id=model_id,
+                  is_inactive=False, warnings=[], errors=[], chips={},
+                  elapsed=86400)
+    values.update(state)
+    return SimpleNamespace(**values)
+
+
+@pytest.fixture
+def scheduler():
+    return PollScheduler(INTERVALS, {'Antminer L3+': 'low'}, jitter=0)
+
+
+def test_the_priority_of_the_model(scheduler):
+    assert scheduler.priority(miner('10.0.0.1')) == 'normal'
+    assert scheduler.priority(miner('10.0.0.1', model_id='Antminer L3+')) \
+        == 'low'
+
+
+def test_the_priority_tag_overrides_the_model(scheduler):
+    tagged = miner('10.0.0.1', 'rack 3 Priority:HIGH')
+    assert scheduler.priority(tagged) == 'high'
+    tagged = miner('10.0.0.1', 'priority:low', model_id='Antminer S9')
+    assert scheduler.priority(tagged) == 'low'
+    # not a tag
+    assert scheduler.priority(miner('10.0.0.1', 'nopriority:low')) == \
+        'normal'
+
+
+@pytest.mark.parametrize('state', [
+    {'warnings': ["[WARNING] hot"]},
+    {'errors': ["[ERROR] chips"]},
+    {'chips': {'Xs': 2}},
+    {'elapsed': 600},
+])
+def test_a_miner_that_needs_attention_is_high(scheduler, state):
+    assert scheduler.priority(miner('10.0.0.1', 'priority:low',
+                                    **state)) == 'high'
+
+
+def test_an_unreachable_miner_keeps_its_priority(scheduler):
+    down = miner('10.0.0.1', 'priority:low', is_inactive=True,
+                 errors=["timed out"])
+    assert scheduler.priority(down) == 'low'
+
+
+def test_new_miners_are_due_at_once(scheduler):
+    scheduler.sync(['10.0.0.1', '10.0.0.2'], now=1000)
+
+    assert sorted(scheduler.due(1000)) == ['10.0.0.1', '10.0.0.2']
+    assert scheduler.due(1000) == []
+
+
+def test_a_miner_is_due_after_the_interval_of_its_priority(scheduler):
+    miners = [
+        miner('10.0.0.1'),
+        miner('10.0.0.2', 'priority:low'),
+        miner('10.0.0.3', warnings=["hot"]),
+    ]
+    scheduler.sync([m.ip for m in miners], now=1000)
+    scheduler.due(1000)
+    for m in miners:
+        scheduler.schedule(m, 1000)
+
+    assert scheduler.next_due() == 1010
+    assert scheduler.due(1009) == []
+    assert scheduler.due(1010) == ['10.0.0.3']
+    assert scheduler.due(1030) == ['10.0.0.1']
+    assert scheduler.due(1119) == []
+    assert scheduler.due(1120) == ['10.0.0.2']
+
+
+def test_the_jitter_brings_the_polls_forward():
+    scheduler = PollScheduler(INTERVALS, jitter=0.1)
+    scheduler.sync(['10.0.0.1'], now=1000)
+    scheduler.due(1000)
+    scheduler.schedule(miner('10.0.0.1'), 1000)
+
+    assert 1027 <= scheduler.next_due() <= 1030
+
+
+def test_the_latest_relative_to_their_interval_first(scheduler):
+    # 20 s late for a high miner is later than 60 s for a low one
+    scheduler._push('10.0.0.1', 940, 'low')
+    scheduler._push('10.0.0.2', 980, 'high')
+    scheduler._push('10.0.0.3', 970, 'normal')
+
+    assert scheduler.due(1000, limit=1) == ['10.0.0.2']
+    assert scheduler.due(1000, limit=1) == ['10.0.0.3']
+    assert scheduler.due(1000, limit=1) == ['10.0.0.1']
+
+
+def test_sync_drops_the_removed_miners(scheduler):
+    scheduler.sync(['10.0.0.1', '10.0.0.2'], now=1000)
+    scheduler.sync(['10.0.0.2'], now=1000)
+
+    assert scheduler.due(1000) == ['10.0.0.2']
+
+
+def test_a_miner_taken_but_not_scheduled_is_due_again(scheduler):
+    scheduler.sync(['10.0.0.1'], now=1000)
+    assert scheduler.due(1000) == ['10.0.0.1']
+
+    # the cycle failed before `schedule`
+    scheduler.sync(['10.0.0.1'], now=1005)
+    assert scheduler.due(1005) == ['10.0.0.1']
+
+
+def test_expedite_makes_every_miner_due(scheduler):
+    scheduler.sync(['10.0.0.1', '10.0.0.2'], now=1000)
+    scheduler.due(1000)
+    scheduler.schedule(miner('10.0.0.1'), 1000)
+    scheduler.schedule(miner('10.0.0.2', 'priority:low'), 1000)
+
+    scheduler.expedite(1001)
+
+    assert sorted(scheduler.due(1001)) == ['10.0.0.1', '10.0.0.2']
+
+
+def test_the_rate_limiter_spaces_the_slots_out():
+    limiter = RateLimiter(10)
+
+    delays = [limiter.reserve() for _ in range(5)]
+
+    assert delays[0] == 0
+    for i, delay in enumerate(delays):
+        assert delay == pytest.approx(i * 0.1, abs=0.01)
+
+
+def test_a_rate_of_0_does_not_limit():
+    limiter = RateLimiter(0)
+
+    assert [limiter.reserve() for _ in range(3)] == [0, 0, 0]
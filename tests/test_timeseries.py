@@ -0,0 +1,86 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.pool import StaticPool
+
+from antminermonitor.blueprints.asicminer import timeseries
+from antminermonitor.blueprints.asicminer.models import Metric
+from antminermonitor.blueprints.asicminer.timeseries import TimeSeriesStore
+from antminermonitor.database import db_session, engine
+
+# a day boundary
+T = 1000000000 - 1000000000 % 86400
+
+
+@pytest.fixture
+def store(monkeypatch):
+    """A store writing to an empty `Metric` table in memory."""
+    memory = create_engine('sqlite://', poolclass=StaticPool,
+                           connect_args={'check_same_thread': False})
+    monkeypatch.setattr(timeseries, 'engine', memory)
+    db_session.remove()
+    db_session.configure(bind=memory)
+    store = TimeSeriesStore()
+    store._ensure_table()
+    yield store
+    db_session.remove()
+    db_session.configure(bind=engine)
+
+
+def insert(ip, *timestamps, hash_rate=10.0):
+    db_session.bulk_insert_mappings(Metric, [
+        dict(ip=ip, model_id='Antminer S9', resolution=0, timestamp=t,
+             samples=1, online=1.0, hash_rate=hash_rate)
+        for t in timestamps
+    ])
+
+
+def rows(resolution):
+    return [(row.ip, row.timestamp - T, row.samples, row.hash_rate)
+            for row in Metric.query.filter_by(resolution=resolution)
+            .order_by(Metric.ip, Metric.timestamp)]
+
+
+def test_rolls_up_the_complete_buckets(store):
+    insert('a', T + 3, T + 33, T + 63, T + 93, T + 123)
+
+    store.rollup(T + 150)
+
+    assert rows(60) == [('a', 0, 2, 10.0), ('a', 60, 2, 10.0)]
+
+
+def test_rolls_up_again_the_buckets_of_late_samples(store):
+    insert('a', T + 3, T + 63)
+    store.rollup(T + 150)
+
+    # replayed by an agent
+    insert('b', T + 7, hash_rate=5.0)
+    store.rollup(T + 150, since=T + 7)
+
+    assert rows(60) == [('a', 0, 1, 10.0), ('a', 60, 1, 10.0),
+                        ('b', 0, 1, 5.0)]
+
+
+def test_keeps_the_rollups_of_the_pruned_samples(store):
+    store.retention[0] = 120
+    insert('a', T + 3, T + 63, T + 123, T + 183)
+    store.rollup(T + 200)
+    store.prune(T + 200)
+
+    insert('b', T + 7, hash_rate=5.0)
+    store.rollup(T + 200, since=T + 7)
+
+    # the raw samples of the first 2 minutes are gone, not their rollups
+    assert rows(60) == [('a', 0, 1, 10.0), ('a', 60, 1, 10.0),
+                        ('a', 120, 1, 10.0)]
+
+
+def test_adds_the_missing_indexes(store):
+    db_session.execute('DROP INDEX ix_metric_resolution_timestamp')
+    store._table_checked = False
+
+    store._ensure_table()
+
+    plan = db_session.execute(
+        'EXPLAIN QUERY PLAN DELETE FROM metric '
+        'WHERE resolution = 0 AND timestamp < 1').fetchall()
+    assert 'ix_metric_resolution_timestamp' in plan[0][-1]
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lib import util_cache
+from lib.util_cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(util_cache.time, 'monotonic', clock)
+    return clock
+
+
+def test_an_entry_expires_after_its_ttl(clock):
+    cache = TTLCache()
+    cache.set('stats', 1, ttl=5)
+
+    clock.now += 4
+    assert cache.get('stats') == (1, 4)
+    clock.now += 1
+    assert cache.get('stats') is None
+    assert len(cache) == 0
+
+
+def test_evicts_the_least_recently_used(clock):
+    cache = TTLCache(maxsize=2)
+    cache.set('a', 1, ttl=5)
+    cache.set('b', 2, ttl=5)
+    cache.get('a')
+
+    cache.set('c', 3, ttl=5)
+
+    assert cache.get('b') is None
+    assert cache.get('a') == (1, 0)
+    assert cache.get('c') == (3, 0)
+
+
+def test_calls_only_on_a_miss(clock):
+    cache = TTLCache()
+    calls = []
+
+    def function():
+        calls.append(clock.now)
+        return len(calls)
+
+    assert cache.get_or_call('stats', function, ttl=5) == (1, 0)
+    clock.now += 2
+    assert cache.get_or_call('stats', function, ttl=5) == (1, 2)
+    clock.now += 3
+    assert cache.get_or_call('stats', function, ttl=5) == (2, 0)
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_concurrent_misses_share_a_single_call():
+    cache = TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def function():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 'stats'
+
+    with ThreadPoolExecutor(8) as executor:
+        leader = executor.submit(cache.get_or_call, 'stats', function, 5)
+        started.wait(5)
+        followers = [
+            executor.submit(cache.get_or_call, 'stats', function, 5)
+            for _ in range(7)
+        ]
+        release.set()
+        results = [leader.result(5)] + [f.result(5) for f in followers]
+
+    assert calls == [1]
+    assert [value for value, _ in results] == ['stats'] * 8
+
+
+def test_the_error_of_the_call_is_raised_to_every_caller():
+    cache = TTLCache()
+    started = threading.Event()
+    release = threading.Event()
+
+    def function():
+        started.set()
+        release.wait(5)
+        raise OSError("timed out")
+
+    with ThreadPoolExecutor(2) as executor:
+        leader = executor.submit(cache.get_or_call, 'stats', function, 5)
+        started.wait(5)
+        follower = executor.submit(cache.get_or_call, 'stats', function, 5)
+        release.set()
+        for future in (leader, follower):
+            with pytest.raises(OSError):
+                future.result(5)
+
+    # an error is not cached
+    assert cache.get('stats') is None
+    assert cache.get_or_call('stats', lambda: 'stats', 5) == ('stats', 0)
@@ -0,0 +1,65 @@
+import pytest
+
+from lib.util_hashrate import to_base_unit, update_unit_and_value
+
+NEXT = {
+    'MH/s': 'GH/s',
+    'GH/s': 'TH/s',
+    'TH/s': 'PH/s',
+    'PH/s': 'EH/s',
+    'KSol/s': 'MSol/s',
+    'MSol/s': 'GSol/s',
+}
+
+
+def divided(value, unit):
+    """The conversion by repeated divisions the table replaces."""
+    while value > 1024:
+        value = value / 1024.0
+        unit = NEXT[unit]
+    return (value, unit)
+
+
+@pytest.mark.parametrize('value, unit, expected', [
+    (0, 'GH/s', (0, 'GH/s')),
+    (13500.5, 'GH/s', (13500.5 / 1024, 'TH/s')),
+    (1024, 'GH/s', (1024, 'GH/s')),
+    (2048, 'GH/s', (2.0, 'TH/s')),
+    (1024**2, 'GH/s', (1024.0, 'TH/s')),
+    (1024**2 + 1, 'GH/s', ((1024**2 + 1) / 1024**2, 'PH/s')),
+    (20500, 'KSol/s', (20500 / 1024, 'MSol/s')),
+    (730, 'KSol/s', (730, 'KSol/s')),
+])
+def test_update_unit_and_value(value, unit, expected):
+    assert update_unit_and_value(value, unit) == expected
+
+
+@pytest.mark.parametrize('unit', ['MH/s', 'GH/s', 'TH/s', 'KSol/s'])
+def test_same_as_repeated_divisions(unit):
+    for exponent in range(0, 30):
+        for value in (2**exponent - 1, 2**exponent, 2**exponent + 1,
+                      1.5 * 2**exponent, 1000 * 10**(exponent % 7)):
+            try:
+                expected = divided(value, unit)
+            except KeyError:
+                # past the largest unit
+                continue
+            converted, converted_unit = update_unit_and_value(value, unit)
+            assert converted_unit == expected[1]
+            assert converted == pytest.approx(expected[0])
+
+
+def test_stops_at_the_largest_unit():
+    assert update_unit_and_value(5 * 1024.0**3, 'TH/s') == (5 * 1024.0,
+                                                            'EH/s')
+
+
+def test_unsupported_unit():
+    with pytest.raises(ValueError):
+        update_unit_and_value(4096, 'bogus')
+
+
+def test_to_base_unit():
+    assert to_base_unit(2, 'KH/s') == (2048.0, 'H/s')
+    assert to_base_unit(13.5, 'TH/s') == (13.5 * 1024**4, 'H/s')
+    assert to_base_unit(3, 'KSol/s') == (3072.0, 'Sol/s')